@@ -11,13 +11,23 @@ import os.path
 import sys
 import csv
 import glob
+import re
+import math
 import time
+import fnmatch
 import shutil
 import subprocess
 from datetime import date, datetime
 from tempfile import mkstemp
 from collections import defaultdict
 
+import Pool
+import Slots
+import Notify
+import History
+import Executors
+import Ledger
+import Scheduler
 import imageslider
 from Logger import Logger
 
@@ -31,6 +41,11 @@ else:
 
 actCopyright = "&copy; " + str(date.today().year) + ", <A href='mailto:ariva@ufl.edu'>A. Riva</A>, University of Florida."
 submitCmd = "submit"
+jobwrapCmd = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobwrap.py")
+arrayArgs = "--array={}-{}"      # Options passed to submit for array jobs (first and last index)
+arrayElementId = "{}_{}"         # ID of an element of an array job (array ID and index)
+walltimeArgs = "--time={}"       # Option passed to submit to request a walltime (in minutes)
+memArgs = "--mem={}M"            # Option passed to submit to request memory (in MB)
 
 # Internal utilities (not really meant for users)
 
@@ -38,9 +53,84 @@ submitCmd = "submit"
 # Each waiter has a success() method that returns True
 # when the event it's waiting for happens
 
+class DirIndex():
+    """A snapshot of the directories that waiters are looking at, shared by all
+the waiters in a wait() call. Each directory is listed at most once per poll
+cycle, and the return code in each sentinel file is read only once."""
+    listings = {}               # dir -> list of filenames, for the current cycle
+    names = {}                  # dir -> set of filenames, for exists()
+    codes = {}                  # filename -> return code
+
+    def __init__(self):
+        self.listings = {}
+        self.names = {}
+        self.codes = {}
+
+    def refresh(self):
+        """Start a new poll cycle: directories will be listed again when needed."""
+        self.listings = {}
+        self.names = {}
+
+    def listdir(self, d):
+        d = d or "."
+        if d not in self.listings:
+            try:
+                self.listings[d] = os.listdir(d)
+            except OSError:
+                self.listings[d] = []
+            self.names[d] = set(self.listings[d])
+        return self.listings[d]
+
+    def exists(self, filename):
+        (d, name) = os.path.split(filename)
+        self.listdir(d)
+        return name in self.names[d or "."]
+
+    def glob(self, pattern):
+        """Like glob.glob(), but matching against the cached directory listing."""
+        (d, base) = os.path.split(pattern)
+        if Notify.hasMagic(d):
+            return glob.glob(pattern)
+        names = fnmatch.filter(self.listdir(d), base)
+        if not base.startswith("."):
+            names = [ n for n in names if not n.startswith(".") ]
+        return [ os.path.join(d, n) for n in names ]
+
+    def returnCode(self, filename):
+        """Returns the return code stored in the first line of `filename', or None if
+the file does not contain one (yet)."""
+        if filename in self.codes:
+            return self.codes[filename]
+        code = readReturnCode(filename)
+        if code != None:
+            self.codes[filename] = code
+        return code
+
+    def forget(self, filename):
+        """Remove `filename' from the index after it has been deleted."""
+        self.codes.pop(filename, None)
+        (d, name) = os.path.split(filename)
+        d = d or "."
+        if d in self.names and name in self.names[d]:
+            self.names[d].discard(name)
+            self.listings[d].remove(name)
+
+def readReturnCode(filename):
+    """Returns the integer in the first line of `filename', or None."""
+    try:
+        with open(filename, "r") as f:
+            return int(f.readline())
+    except (IOError, OSError, ValueError):
+        return None
+
 class Waiter():
     wanted = 0
     filename = ""
+    index = None                # DirIndex shared with the other waiters, if any
+    jobindex = None             # Scheduler.JobIndex shared with the other waiters, if any
+    jobquery = None             # Scheduler.JobQuery to use instead of the Actor's one
+    ledger = None               # Ledger.Ledger this waiter reads from, if any
+    code = None                 # Return code, set by wait() when the waiter succeeds
 
     def __init__(self, filename):
         self.filename = filename
@@ -48,16 +138,51 @@ class Waiter():
     def str(self):
         return "<File {}>".format(self.filename)
 
+    def exists(self, filename):
+        if self.index:
+            return self.index.exists(filename)
+        return os.path.exists(filename)
+
+    def glob(self, pattern):
+        if self.index:
+            return self.index.glob(pattern)
+        return glob.glob(pattern)
+
+    def returnCode(self, filename):
+        if self.index:
+            return self.index.returnCode(filename)
+        return readReturnCode(filename)
+
+    def remove(self, filename):
+        os.remove(filename)
+        if self.index:
+            self.index.forget(filename)
+
     def success(self):
         """A base Waiter is successful when its target file exists."""
-        return os.path.exists(self.filename)
+        return self.exists(self.filename)
 
     def status(self):
-        """Returns the overall success status of the processes we waited for."""
-        return True
+        """Returns the overall return code of the processes we waited for (0 means success).
+We assume that the first line of the file, if any, contains the return code."""
+        return self.returnCode(self.filename) or 0
 
     def delete(self):
-        os.remove(self.filename)
+        self.remove(self.filename)
+
+    def watchdir(self):
+        """Returns the directory in which the target file will appear, or None if
+this waiter has to be polled."""
+        return os.path.dirname(self.filename) or "."
+
+    def pendingJobs(self):
+        """Returns the IDs of the jobs whose scheduler state this waiter needs."""
+        return []
+
+    def failures(self):
+        """Returns a list of (name, code) tuples for the processes that already
+terminated with a non-zero return code, while this waiter is still pending."""
+        return []
 
 class CounterWaiter(Waiter):
 
@@ -71,22 +196,24 @@ class CounterWaiter(Waiter):
     def success(self):
         """A CounterWaiter is successful when the target file exists and 
 contains a value greater than or equal to `wanted'."""
-        if os.path.exists(self.filename):
-            try:
-                with open(self.filename, "r") as f:
-                    current = int(f.readline())
-                return (current >= self.wanted)
-            except:
-                return False
+        if self.exists(self.filename):
+            current = readReturnCode(self.filename)
+            return (current != None and current >= self.wanted)
         else:
             return False
 
+    def status(self):
+        """The file contains a counter, not a return code."""
+        return 0
+
 class GlobWaiter(CounterWaiter):
     found = 0
+    matches = []
 
     def __init__(self, filename, wanted):
         self.filename = filename
         self.wanted = wanted
+        self.matches = []
         
     def str(self):
         return "<{}/{} files matching {}>".format(self.wanted-self.found, self.wanted, self.filename)
@@ -94,27 +221,263 @@ class GlobWaiter(CounterWaiter):
     def success(self):
         """A GlobWaiter is successful if the number of existing files matching
 the pattern in `filename' is greater than or equal to `wanted'."""
-        self.found = len(glob.glob(self.filename))
+        self.matches = self.glob(self.filename)
+        self.found = len(self.matches)
         return (self.found >= self.wanted)
         
     def status(self):
         """We assume that the first line of the file contains the return code. Returns
 the maximum return code found."""
-        stfiles = glob.glob(self.filename)
         st = 0
-        for stfile in stfiles:
-            with open(stfile, "r") as f:
-                l = f.readline()
-                try:
-                    ret = int(l)
-                    st = max(st, ret)
-                except ValueError:
-                    pass
+        for stfile in self.matches or self.glob(self.filename):
+            ret = self.returnCode(stfile)
+            if ret != None:
+                st = max(st, ret)
         return st
 
+    def failures(self):
+        """Each sentinel file is read once, as soon as it appears."""
+        failed = []
+        for stfile in self.matches:
+            ret = self.returnCode(stfile)
+            if ret:
+                failed.append((stfile, ret))
+        return failed
+
     def delete(self):
-        for f in glob.glob(self.filename):
-            os.remove(f)
+        for f in self.matches or self.glob(self.filename):
+            self.remove(f)
+        self.matches = []
+
+class SchedulerWaiter(Waiter):
+    """Waits for a list of jobs by asking the scheduler for their state, instead of
+looking for sentinel files. When used within wait(), the states of the pending jobs
+of all SchedulerWaiters are obtained with a single query per poll cycle."""
+    task = ""
+    jobids = []
+    codes = {}                  # jobid -> return code of finished jobs
+
+    def __init__(self, task, jobids, jobquery=None):
+        self.task = task
+        self.filename = task
+        self.jobids = list(jobids)
+        self.wanted = len(self.jobids)
+        self.codes = {}
+        self.jobquery = jobquery
+
+    def str(self):
+        return "<{}/{} jobs of task {}>".format(self.wanted - len(self.codes), self.wanted, self.task)
+
+    def pendingJobs(self):
+        # Jobs waiting to be resubmitted (see Actor._checkRetries) can't be queried yet
+        return [ j for j in self.jobids if j not in self.codes and not j.startswith("retry:") ]
+
+    def success(self):
+        """A SchedulerWaiter is successful when all its jobs are no longer active."""
+        jobindex = self.jobindex
+        if not jobindex:
+            if not self.jobquery:
+                self.jobquery = Scheduler.JobQuery()
+            jobindex = Scheduler.JobIndex(self.jobquery)
+            jobindex.refresh(self.pendingJobs())
+        for j in self.pendingJobs():
+            st = jobindex.state(j)
+            if st and st.finished():
+                self.codes[j] = st.returnCode()
+        return len(self.codes) >= self.wanted
+
+    def status(self):
+        return max(list(self.codes.values()) + [0])
+
+    def failures(self):
+        return [ (j, c) for (j, c) in self.codes.items() if c ]
+
+    def delete(self):
+        pass
+
+    def watchdir(self):
+        return None
+
+class LedgerWaiter(Waiter):
+    """Waits for jobs that record their completion in a ledger. A LedgerWaiter is
+successful when the number of ledger records whose task matches `pattern' is greater
+than or equal to `wanted'. This covers the semantics of the other waiters: use a task
+name with wanted=1 for a single job, or a glob-style pattern for many of them."""
+    pattern = ""
+    found = 0
+
+    def __init__(self, ledger, pattern, wanted=1):
+        self.ledger = ledger
+        self.pattern = pattern
+        self.filename = pattern
+        self.wanted = wanted
+
+    def str(self):
+        return "<{}/{} ledger records for {}>".format(self.wanted - self.found, self.wanted, self.pattern)
+
+    def success(self):
+        if not self.index:
+            self.ledger.update()
+        self.found = self.ledger.count(self.pattern)
+        return (self.found >= self.wanted)
+
+    def status(self):
+        return self.ledger.maxCode(self.pattern)
+
+    def failures(self):
+        return [ ("{} ({})".format(r.task, r.jobid), r.code) for r in self.ledger.query(self.pattern) if r.code ]
+
+    def delete(self):
+        self.ledger.consume(self.ledger.query(self.pattern))
+
+    def watchdir(self):
+        return os.path.dirname(self.ledger.filename) or "."
+
+class WaitGroup():
+    """A set of waiters that can grow while it is being waited for. Pass it to waitIter(), and
+add() new waiters to it after receiving each completed one: they are waited for in the same
+loop, together with those still pending."""
+    incoming = []               # Waiters added since the last cycle of the wait loop
+
+    def __init__(self, waiters=[]):
+        self.incoming = list(waiters)
+
+    def add(self, waiter):
+        self.incoming.append(waiter)
+
+    def take(self):
+        """Returns the waiters added since the last call, and forgets them."""
+        new = self.incoming
+        self.incoming = []
+        return new
+
+class WaitResult():
+    """Returned by wait() when it stops before all waiters succeed. It evaluates to False,
+like a failed wait(); `pending' is the list of waiters that had not succeeded yet, and
+`status' is False if any of the completed ones reported an error."""
+    pending = []
+    elapsed = 0
+    status = True
+
+    def __init__(self, pending, elapsed, status=True):
+        self.pending = pending
+        self.elapsed = elapsed
+        self.status = status
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def pendingStr(self):
+        return ", ".join([ w.str() for w in self.pending ])
+
+class WaitPause():
+    """Yielded by Actor._waitSteps() when it needs to sleep for `delay' seconds before polling again."""
+    delay = 0
+
+    def __init__(self, delay):
+        self.delay = delay
+
+class WaitTimeout(WaitResult):
+    """Returned by wait() when its timeout expires."""
+
+    def __str__(self):
+        return "Timeout after {:.0f}s waiting for: {}".format(self.elapsed, self.pendingStr())
+
+class WaitFailure(WaitResult):
+    """Returned by wait() in fail-fast mode as soon as a job reports a non-zero return
+code. `failed' is a list of (name, code) tuples, where name is the sentinel file (or job ID)
+that reported the failure."""
+    failed = []
+    cancelled = []
+
+    def __init__(self, pending, elapsed, failed, cancelled=[]):
+        self.pending = pending
+        self.elapsed = elapsed
+        self.status = False
+        self.failed = failed
+        self.cancelled = cancelled
+
+    def __str__(self):
+        return "Failure after {:.0f}s: {}".format(self.elapsed, ", ".join([ "{} returned error code {}".format(n, c) for (n, c) in self.failed ]))
+
+class Job():
+    """A job submitted with Actor.submit(), with the information needed to resubmit it."""
+    jobid = ""
+    task = None
+    script = ""                 # The scriptAndArgs passed to submit()
+    args = {}                   # The other arguments passed to submit()
+    submitted = 0               # Submission time
+    attempts = 1                # Number of times this job was submitted
+    heartbeat = None            # Heartbeat file, if any; cleared when the job terminates
+    beats = False               # Set when the heartbeat file is seen for the first time
+    lost = False                # Set when the heartbeat goes stale
+    bundle = 0                  # Number of tasks, if this job runs a bundle (see submitBundle())
+    tasks = None                # For bundles, the done file and ledger task of each of their commands
+    element = False             # True for the elements of array jobs: `script' is a command line, run by jobwrap.py with a shell
+    retry = None                # RetryPolicy, if the job should be resubmitted when it fails
+    final = False               # Set when the job's outcome is known and no retry is pending
+    copy = None                 # ID of the speculative copy of this job, if any (see Actor._checkStragglers())
+    original = None             # For a speculative copy, the ID of the job it duplicates
+    winner = None               # The ID of whichever of this job and its copy terminated first
+    started = None              # Time at which the job was seen running
+    finished = None             # Time at which the job was seen terminating
+    elapsed = None              # Its runtime
+    code = None                 # Its return code
+    scratch = None              # For a speculative copy, the scratch directory it runs in
+
+    def __init__(self, jobid, script, args, attempts=1):
+        self.jobid = jobid
+        self.script = script
+        self.args = args
+        self.task = args.get('task')
+        self.submitted = time.time()
+        self.attempts = attempts
+
+    def heartbeatAge(self):
+        """Returns the number of seconds since the last heartbeat, or None if the job is
+not beating (not started yet, or already terminated)."""
+        if self.heartbeat:
+            try:
+                return time.time() - os.path.getmtime(self.heartbeat)
+            except OSError:
+                pass
+        return None
+
+class RetryPolicy():
+    """Determines how failed jobs are resubmitted: at most `attempts' times in total, waiting
+`backoff' seconds before the first retry and multiplying the wait by `factor' each time. If
+the job fails with one of the return codes in `oomCodes' (usually meaning that it ran out of
+memory, including jobs that the scheduler reports as OUT_OF_MEMORY), the memory requested in its
+options is multiplied by `memFactor' (if not 1). A resubmitted job gets a new job ID, so jobs that
+depend on it through `after' are not affected by the retry: avoid combining the two."""
+    attempts = 3
+    backoff = 30.0
+    factor = 2.0
+    memFactor = 2.0
+    oomCodes = [Scheduler.oomCode]
+
+    def __init__(self, attempts=3, backoff=30.0, factor=2.0, memFactor=2.0, oomCodes=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.memFactor = memFactor
+        if oomCodes != None:
+            self.oomCodes = oomCodes
+
+    def shouldRetry(self, job, code):
+        return code != 0 and job.attempts < self.attempts
+
+    def delay(self, attempt):
+        """Returns the number of seconds to wait before resubmitting a job that failed at its `attempt'-th attempt."""
+        return self.backoff * (self.factor ** (attempt - 1))
+
+    def options(self, options, code):
+        """Returns the options for resubmitting a job that failed with return code `code'."""
+        if code in self.oomCodes and self.memFactor != 1:
+            return Executors.scaleMemory(options, self.memFactor)
+        return options
 
 class ActorError(Exception):
     step = False
@@ -177,6 +540,7 @@ class Actor():
     Conf = None                  # ConfigParser object
     Steps = []                   # Steps the user wants to run
     Prefix = None                # Prefix for submit jobs
+    prefix = None                # Prefix for submit jobs, from the label entry in the configuration
     log = Logger(None)           # To avoid errors in scripts that don't explicitly create one
     
     # Runtime
@@ -198,7 +562,64 @@ class Actor():
     nreferences = 0              # Number of references
     complete = False             # Set to true for successful completion
     error = None                 # Set to an error message in case of errors
+    aborted = None               # Set to the reason why the run was aborted (see abort())
     jobs = None                  # Dictionary of submitted jobs (key is task name, value is list of job IDs)
+    waitMode = "auto"            # How wait() detects completion: auto, inotify, or poll
+    pollPolicy = None            # Notify.PollPolicy for wait(); if None, built from the configuration
+    jobQuery = None              # Scheduler.JobQuery used by SchedulerWaiters; if None, uses queryCmd from the configuration
+    _schedulerQuery = None
+    failFast = False             # Default for the `failfast' argument of wait()
+    ledgerFile = ".ledger"       # Completion ledger, used by jobs submitted with ledger=True
+    _ledger = None
+    jobinfo = None               # Dictionary of Job objects, indexed by job ID
+    heartbeatDir = ".heartbeats" # Where heartbeat files are created
+    heartbeatInterval = 60       # Seconds between heartbeats
+    heartbeatTimeout = 600       # A job is lost if its heartbeat is older than this
+    lostAction = "fail"          # What to do with lost jobs: fail or resubmit
+    maxResubmits = 1             # Number of times a lost job can be resubmitted
+    lostCode = 255               # Return code recorded for lost jobs
+    _lastHeartbeatCheck = 0
+    arrayDir = ".arrays"         # Where task files for array jobs are written
+    maxArraySize = 1000          # Maximum number of elements in an array job
+    bundleTime = 1800            # Target runtime in seconds of the jobs created by submitBundle()
+    bundleSize = 10              # Tasks per bundle when their runtime cannot be predicted
+    bundleCores = 1              # Tasks run in parallel within a bundle
+    pilotDir = ".pilots"         # Queue directory for the pilot executor
+    collected = None             # IDs of the jobs submitted since startCollecting()
+    maxJobs = 0                  # Maximum number of jobs queued or running at the same time (0: no limit)
+    slotFile = None              # File used to share the maxJobs limit with other runs
+    slotPoll = 30                # Seconds between checks for completed jobs holding a slot
+    slotExpire = 3600            # Seconds after which the unrefreshed slots of runs on other hosts are freed
+    _slots = None
+    _lastSlotCheck = 0
+    _retries = None              # Failed jobs waiting to be resubmitted: list of (time, job, code)
+    speculate = False            # Submit a copy of straggler jobs while waiting (see _checkStragglers())
+    speculateQuantile = 0.95     # A job is a straggler if it takes longer than this quantile of the runtimes of its task...
+    speculateFactor = 1.5        # ...multiplied by this factor,
+    speculateFraction = 0.75     # once this fraction of the jobs of the task has completed
+    speculateDir = ".speculative"  # Where the scratch directories of speculative copies are created
+    _losers = None               # Jobs that were cancelled and replaced (speculative copies, lost jobs), whose ledger records should be ignored
+    cancelOnAbort = True         # Cancel the outstanding jobs when the run is aborted
+    keepTasks = []               # Tasks whose jobs are not cancelled when the run is aborted
+    usage = None                 # Resources used by each job (Scheduler.JobUsage), indexed by job ID; see collectUsage()
+    usageReport = True           # Collect the resource usage of all jobs at the end of the run, and report it
+    usageFile = "usage.txt"      # Where the resource usage of each job is written
+    usageTop = 10                # Number of jobs listed in the report as using the most time and memory
+    usageRetries = 3             # Number of times the accounting command is repeated for jobs whose usage is not filled in yet
+    usageDelay = 10              # Seconds between these repetitions
+    resourceRequests = "off"     # Base walltime and memory requests on past usage: off, suggest (only log them), or set
+    resourceQuantile = 0.95      # Quantile of the past runtimes and memory usage of a task that is requested...
+    resourceMargin = 0.25        # ...increased by this fraction
+    memoryScaling = []           # Tasks (patterns) whose memory requests, like walltimes, are scaled to the size of their input
+    _suggested = None            # Tasks for which suggested resources were logged
+    defaultAfter = None          # Jobs that all submitted jobs depend on (see startCollecting())
+    submitWorkers = 4            # Number of concurrent submissions in submitPool()
+    submitRate = 10              # Maximum submissions per second in submitPool()
+    submitRetries = 3            # Retries of a failed submission in submitPool()
+    executor = None              # Executors.Executor used by submit(); see getExecutor()
+    localThreshold = 60          # With the hybrid executor, jobs expected to take less than this many seconds run locally
+    localCpus = 2                # CPUs used by the local pool of the hybrid executor
+    _history = None
 
     # Internal methods (not meant to be called by user)
 
@@ -209,10 +630,24 @@ class Actor():
         self.tempfiles = []
         self.previousDir = ""
         self.jobs = defaultdict(list)
+        self.jobinfo = {}
+        self._retries = []
+        self._losers = set()
+        self._suggested = set()
         self.Info = {}
 
     def _cleanup(self):
 
+        # If the run was aborted, don't leave jobs behind
+        self._cancelIfAborted()
+
+        # Collect the resources used by our jobs
+        self._reportUsage()
+
+        # Let the executor know we're done (e.g. pilot jobs can exit)
+        if self.executor:
+            self.executor.close()
+
         # Finish HTML file and close it
         if self.out and not self.out.closed:
             self.postamble(self.out)
@@ -231,6 +666,11 @@ class Actor():
             os.chdir(self.previousDir)
             self.message("Current directory now: {}", os.getcwd())
 
+        # Let subclasses finish their own work (e.g. MultiSampleActor closes its log)
+        cleanup = getattr(self, "cleanup", None)
+        if cleanup:
+            cleanup()
+
     def _addToExclude(self, filename):
         with open(self.excludeFile, "a") as out:
             out.write("{}\n".format(filename))
@@ -313,6 +753,11 @@ stylesheets, logos)."""
         b = b / 1024.0
         return "{:.2f} GB".format(b)
 
+    def printDuration(self, secs):
+        # Return a string containing the number of seconds `secs' formatted as h:mm:ss.
+        secs = int(round(secs))
+        return "{}:{:02d}:{:02d}".format(secs // 3600, (secs // 60) % 60, secs % 60)
+
     def timeStamp(self):
         dt = datetime.now()
         return "{}-{}-{}@{}:{:0>2}".format(dt.month, dt.day, dt.year, dt.hour, dt.minute)
@@ -592,7 +1037,9 @@ can be either a list of strings or a string containing comma-separated step name
     # The following few methods deal with waiting for things to happen...
 
     def _parseWait(self, w):
-        if type(w).__name__ == 'str':
+        if isinstance(w, Waiter):
+            return w
+        elif type(w).__name__ == 'str':
             return Waiter(w)
         else:
             filename = w[0]
@@ -604,45 +1051,748 @@ can be either a list of strings or a string containing comma-separated step name
             else:
                 return CounterWaiter(filename, cnt)
 
-    def wait(self, wanted, delete=True):
-        """Wait until all the files in the `wanted' list get created. Returns True when all specified files exist. This can be used to check for the completion of a background script. If `delete' is True, the files are deleted before returning."""
+    def _notifier(self):
+        mode = self.getConf("waitMode", default=self.waitMode) if self.Conf else self.waitMode
+        return Notify.makeNotifier(mode)
+
+    def _pollPolicy(self):
+        if self.pollPolicy:
+            return self.pollPolicy
+        if self.Conf:
+            return Notify.PollPolicy(initial=self.getConfFloat("pollInitial", default=1.0),
+                                     maximum=self.getConfFloat("pollMax", default=60.0),
+                                     factor=self.getConfFloat("pollFactor", default=1.5),
+                                     jitter=self.getConfFloat("pollJitter", default=0.1))
+        return Notify.PollPolicy()
+
+    def _jobQuery(self):
+        if self.jobQuery:
+            return self.jobQuery
+        if self.getExecutor().query([]) != None:
+            return Executors.ExecutorQuery(self.getExecutor())
+        # Keep the same query across calls, since it remembers which jobs the scheduler stopped reporting
+        if not self._schedulerQuery:
+            self._schedulerQuery = Scheduler.JobQuery(self.getConf("queryCmd") if self.Conf else None, grace=self._queryGrace())
+        return self._schedulerQuery
+
+    def _queryGrace(self):
+        return self.getConfFloat("queryGrace", default=Scheduler.queryGrace) if self.Conf else Scheduler.queryGrace
+
+    def getLedger(self):
+        """Returns the completion ledger for this run. Records left over from previous runs are ignored."""
+        if not self._ledger:
+            self._ledger = Ledger.Ledger(os.path.abspath(self.ledgerFile), aliases=self.getExecutor().aliases)
+            self._ledger.skipExisting()
+        return self._ledger
+
+    def ledgerWaiter(self, pattern, wanted=1):
+        """Returns a LedgerWaiter for `wanted' ledger records whose task matches `pattern'. As in
+wait(), the @ character in `pattern' matches any string."""
+        return LedgerWaiter(self.getLedger(), pattern.replace("@", "*"), wanted)
+
+    def jobsWaiter(self, task):
+        """Returns a SchedulerWaiter for all the jobs submitted so far for `task'. Pass it to wait() to
+wait for their completion without sentinel files."""
+        return SchedulerWaiter(task, self.jobs[task])
+
+    def waitJobs(self, task, **kwargs):
+        """Wait for all the jobs submitted for `task' using the scheduler state. Accepts the same keyword
+arguments as wait()."""
+        return self.wait(self.jobsWaiter(task), **kwargs)
+
+    def cancelJobs(self, task, jobids=None):
+        """Cancel the jobs submitted for `task' (or only those in `jobids'). Returns the list of cancelled job IDs."""
+        if jobids == None:
+            jobids = self.jobs[task]
+        if not jobids:
+            return []
+        self.log.log("Cancelling {} jobs of task {}", len(jobids), task)
+        self.getExecutor().cancel(jobids)
+        return jobids
 
+    def activeJobs(self, jobids):
+        """Returns the jobs in `jobids' that have not terminated yet, according to a single query of their state (all of them, if the query fails)."""
+        if not jobids:
+            return []
+        states = self._jobQuery().query(list(set(jobids)))
+        if not states:
+            return list(jobids)
+        return [ j for j in jobids if not (j in states and states[j].finished()) ]
+
+    def cancelOutstanding(self, keep=None):
+        """Cancel all the jobs submitted by this run that are still queued or running (according to a single query of their state; if the query fails, all jobs not known to have terminated), with a single call to the executor (for the submit executor, this runs the cancelCmd configuration entry, default: scancel). The jobs of the tasks matching one of the patterns in `keep' (default: the keepTasks configuration entry, a comma-separated list) are left alone. Returns the list of cancelled job IDs."""
+        if keep == None:
+            keep = self.getConfList("keepTasks", default=self.keepTasks) if self.Conf else self.keepTasks
+        jobids = []
+        for job in sorted(self.jobinfo.values(), key=lambda j: j.submitted):
+            if job.final or job.finished != None or job.jobid in jobids:
+                continue
+            if job.task and [ k for k in keep if fnmatch.fnmatchcase(job.task, k.replace("@", "*")) ]:
+                continue
+            jobids.append(job.jobid)
+        self._retries = []
+        jobids = self.activeJobs(jobids)
+        if not jobids:
+            return []
+        self.log.log("Cancelling {} outstanding jobs: {}", len(jobids), " ".join(jobids))
+        self.messagelf("Cancelling {} outstanding jobs".format(len(jobids)))
+        self.message("\n")
+        self.getExecutor().cancel(jobids)
+        for j in jobids:
+            self.jobinfo[j].final = True
+        return jobids
+
+    def collectUsage(self):
+        """Obtain the resources used (walltime, CPU time, and maximum memory) by all the jobs submitted by this run, from the executor for the jobs it runs itself, and otherwise with a single call to the scheduler's accounting command (the usageCmd configuration entry, default: sacct; see Scheduler.usageCmd for its output format). Returns self.usage, a dictionary mapping job IDs to Scheduler.JobUsage objects. The memory used by each job is also recorded in the history of its task (see getHistory())."""
+        if self.usage == None:
+            self.usage = {}
+        jobids = []
+        for job in sorted(self.jobinfo.values(), key=lambda j: j.submitted):
+            if not self._usageComplete(self.usage.get(job.jobid)) and job.jobid not in jobids:
+                jobids.append(job.jobid)
+        if not jobids:
+            return self.usage
+        codes = self._finalCodes([ self.jobinfo[j] for j in jobids ])
+        found = self.getExecutor().usage(jobids)
+        rest = [ j for j in jobids if j not in found ]
+        if rest:
+            if self.Conf:
+                retries = self.getConfInt("usageRetries", default=self.usageRetries)
+                delay = self.getConfFloat("usageDelay", default=self.usageDelay)
+            else:
+                (retries, delay) = (self.usageRetries, self.usageDelay)
+            query = Scheduler.UsageQuery(self.getConf("usageCmd") if self.Conf else None)
+            real = dict([ (self.getExecutor().resolve(j), j) for j in rest ])     # The scheduler's IDs of the jobs
+            while True:
+                data = query.query([ r for r in real if real[r] in rest ])
+                if data == None:
+                    self.log.log("Could not obtain the resource usage of {} jobs.", len(rest))
+                    break
+                for (r, u) in data.items():
+                    if r in real:
+                        u.jobid = real[r]
+                        found[u.jobid] = u
+                # The accounting fields of the jobs that just terminated may not be filled in yet
+                rest = [ j for j in rest if j in codes and not self._usageComplete(found.get(j)) ]
+                if not rest or retries <= 0:
+                    break
+                retries -= 1
+                time.sleep(delay)
+        self.usage.update(found)
+        hist = self.getHistory()
+        if hist:
+            for u in found.values():
+                job = self.jobinfo.get(u.jobid)
+                code = codes.get(u.jobid)
+                if code == None or not self._usageComplete(u) or not job or not job.task or job.bundle:
+                    continue
+                sample = self.jobSample(job)
+                for task in [job.task] + (["{}:{}".format(job.task, sample)] if sample else []):
+                    try:
+                        hist.record(task, None, size=job.args.get('size'), mem=u.maxrss, code=code)
+                    except Exception as e:
+                        self.log.log("Error recording memory usage of {}: {}".format(task, e))
+        return self.usage
+
+    def _usageComplete(self, u):
+        """Returns True if JobUsage `u' has all the fields that are filled in when a job terminates."""
+        return u != None and u.walltime != None and u.maxrss != None
+
+    def _finalCodes(self, jobs):
+        """Returns a dictionary mapping the IDs of the `jobs' that terminated to their return codes, when they are known: from their ledger records, from their done files, or from the state reported by the executor or the scheduler. Jobs whose outcome is unknown are not included."""
+        codes = {}
+        if [ job for job in jobs if job.args.get('ledger') ]:
+            for r in self.getLedger().scan():
+                codes[r.jobid] = r.code
+        # All the attempts of a job write the same done file: it holds the outcome of the last one
+        owners = {}
+        for job in sorted(self.jobinfo.values(), key=lambda j: j.submitted):
+            if job.args.get('done') and not job.original:
+                owners[job.args['done']] = job
+        for job in jobs:
+            done = job.args.get('done')
+            if job.jobid not in codes and done and owners.get(done) is job and job.winner in [None, job.jobid]:
+                code = readReturnCode(done)
+                if code != None:
+                    codes[job.jobid] = code
+        rest = [ job.jobid for job in jobs if job.jobid not in codes and not job.bundle ]
+        states = self._jobQuery().query(rest) if rest else None
+        for st in (states or {}).values():
+            # Jobs that the scheduler stopped reporting are finished, but their code is not known
+            if st.finished() and (st.code != None or st.state == Scheduler.FAILED):
+                codes[st.jobid] = st.returnCode()
+        return codes
+
+    def jobSample(self, job):
+        """Returns the sample (or other item) that Job `job' processed, if known: this is the part after the colon in its ledger task, when it is of the form task:item (as for the jobs of scattered Lines)."""
+        key = job.args.get('ledger')
+        if type(key).__name__ == 'str' and job.task and key.startswith(job.task + ":"):
+            return key[len(job.task)+1:]
+        return None
+
+    def _usageRows(self):
+        """Returns a list of (jobid, task, sample, JobUsage) for the jobs whose resource usage is known, one for each job ID."""
+        rows = []
+        seen = set()
+        for job in sorted(self.jobinfo.values(), key=lambda j: j.submitted):
+            u = (self.usage or {}).get(job.jobid)
+            if u and u.walltime != None and job.jobid not in seen:
+                seen.add(job.jobid)
+                rows.append((job.jobid, job.task or "", self.jobSample(job) or "", u))
+        return rows
+
+    def writeUsage(self, filename):
+        """Write the resource usage of each job to tab-delimited file `filename'."""
+        with open(filename, "w") as out:
+            out.write("JobID\tTask\tSample\tWalltime\tCPUtime\tMaxRSS_MB\n")
+            for (jobid, task, sample, u) in self._usageRows():
+                out.write("{}\t{}\t{}\t{:.1f}\t{}\t{}\n".format(jobid, task, sample, u.walltime,
+                                                              "" if u.cputime == None else "{:.1f}".format(u.cputime),
+                                                              "" if u.maxrss == None else "{:.1f}".format(u.maxrss)))
+
+    def usageScene(self, top=None):
+        """Add a `Resource usage' scene to the report, with the total walltime and CPU time and the maximum memory used by the jobs of each task and sample, and the `top' jobs (default: usageTop) that ran the longest and used the most memory."""
+        if top == None:
+            top = self.getConfInt("usageTop", default=self.usageTop) if self.Conf else self.usageTop
+        rows = self._usageRows()
+        mem = lambda m: "-" if m == None else self.printBytes(m * 1024 * 1024)
+
+        def totals(key):
+            groups = {}
+            for r in rows:
+                k = key(r)
+                if not k:
+                    continue
+                g = groups.setdefault(k, [0, 0.0, 0.0, None])
+                g[0] += 1
+                g[1] += r[3].walltime
+                g[2] += r[3].cputime or 0
+                if r[3].maxrss != None:
+                    g[3] = max(g[3] or 0, r[3].maxrss)
+            return [ [k, g[0], self.printDuration(g[1]), self.printDuration(g[2]), mem(g[3])] for (k, g) in sorted(groups.items()) ]
+
+        self.scene("Resource usage")
+        self.reportf("Resources used by the {} jobs submitted by this run.", len(rows))
+        header = ["Jobs", "Walltime", "CPU time", "Max memory"]
+        byTask = totals(lambda r: r[1] or "(none)")
+        allJobs = totals(lambda r: "Total")
+        self.table(byTask + allJobs, header=["Task"] + header, align="LRRRR", caption="Totals by task")
+        bySample = totals(lambda r: r[2])
+        if bySample:
+            self.table(bySample, header=["Sample"] + header, align="LRRRR", caption="Totals by sample")
+        jobHeader = ["Job", "Task", "Sample", "Walltime", "CPU time", "Max memory"]
+        job = lambda r: [r[0], r[1], r[2], self.printDuration(r[3].walltime), "-" if r[3].cputime == None else self.printDuration(r[3].cputime), mem(r[3].maxrss)]
+        longest = sorted(rows, key=lambda r: -r[3].walltime)[:top]
+        self.table([ job(r) for r in longest ], header=jobHeader, align="LLLRRR", caption="Longest jobs")
+        largest = sorted([ r for r in rows if r[3].maxrss != None ], key=lambda r: -r[3].maxrss)[:top]
+        if largest:
+            self.table([ job(r) for r in largest ], header=jobHeader, align="LLLRRR", caption="Jobs using the most memory")
+        if os.path.isfile(self.usageFile):
+            self.file(self.usageFile, "Resource usage of each job.")
+
+    def _reportUsage(self):
+        """Called at the end of the run: collect the resource usage of all jobs, write it to usageFile, and add the Resource usage scene to the report, unless usageReport is false."""
+        if not self.jobinfo or not (self.getConfBoolean("usageReport", default=self.usageReport) if self.Conf else self.usageReport):
+            return
+        try:
+            self.collectUsage()
+            if not self._usageRows():
+                return
+            self.writeUsage(self.usageFile)
+            if self.out and not self.out.closed:
+                self.usageScene()
+        except Exception as e:
+            self.log.log("Error reporting resource usage: {}".format(e))
+
+    def abort(self, reason):
+        """Record that the run is being aborted because of `reason' (e.g. an error, or an interrupt). When the run terminates, the jobs that are still outstanding are cancelled (see cancelOutstanding()), unless cancelOnAbort is false."""
+        if not self.aborted:
+            self.aborted = reason
+            self.log.log("Run aborted: {}", reason)
+
+    def _cancelIfAborted(self):
+        if self.aborted and (self.getConfBoolean("cancelOnAbort", default=self.cancelOnAbort) if self.Conf else self.cancelOnAbort):
+            try:
+                self.cancelOutstanding()
+            except Exception as e:
+                self.log.log("Error cancelling outstanding jobs: {}", e)
+
+    def wait(self, wanted, delete=True, timeout=None, policy=None, failfast=None, cancel=None):
+        """Wait until all the files in the `wanted' list get created (elements of `wanted' can also be Waiter objects, e.g. from jobsWaiter()). Returns True when all specified files exist. This can be used to check for the completion of a background script. If `delete' is True, the files are deleted before returning. Depending on `waitMode', the directories containing the files are watched with inotify, or polled with the delays determined by `policy' (a Notify.PollPolicy, defaulting to the one in the configuration). If `timeout' is specified and not all files exist after that many seconds, returns a WaitTimeout object (that evaluates to False) listing the pending waiters. If `failfast' is True (default: the failFast configuration entry), sentinel files are checked as soon as they appear, and the first non-zero return code causes wait() to return a WaitFailure object (that also evaluates to False) reporting which file or job failed; in this case, if `cancel' is a task name (or a list of task names), the jobs of those tasks are cancelled."""
         status = True
+        for w in self.waitIter(wanted, delete=delete, timeout=timeout, policy=policy, failfast=failfast, cancel=cancel):
+            if not w:
+                return w
+            if w.code != 0:
+                status = False
+        return status
+
+    def waitIter(self, wanted, delete=True, timeout=None, policy=None, failfast=None, cancel=None):
+        """Like wait(), but returns a generator that yields each waiter as soon as it succeeds, so that work depending on it can start while the others are still pending. The `code' attribute of each waiter yielded contains its return code. If waiting stops early because of `timeout' or `failfast', the last object yielded is the WaitTimeout or WaitFailure object (both evaluate to False). Example:
+
+  for w in ACT.waitIter(["sample1-align.done", "sample2-align.done"]):
+      if w:
+          ACT.submit("quant.qsub " + w.filename.replace("-align.done", ""))
+
+`wanted' can also be a WaitGroup, to which new waiters can be added while waiting.
+"""
+        return self._waitSteps(wanted, delete=delete, timeout=timeout, policy=policy, failfast=failfast, cancel=cancel)
 
-        # If a single filename was passed, turn it into a list
-        if type(wanted).__name__ != 'list':
-            wanted = [wanted]
+    def waitAsync(self, wanted, **kwargs):
+        """Awaitable version of wait(), for coroutines run by an AsyncDirector (Python 3 only). Accepts the same arguments as wait(); instead of blocking, it lets other coroutines run while waiting."""
+        import AsyncDirector
+        return AsyncDirector.waitAsync(self, wanted, **kwargs)
 
-        wanted = [ self._parseWait(w) for w in wanted ]
-        nwanted = sum(w.wanted for w in wanted)
-        wmsg   = ", ".join([ w.str() for w in wanted])
-        self.messagelf("\nWaiting for: " + wmsg)
+    def _waitSteps(self, wanted, delete=True, timeout=None, policy=None, failfast=None, cancel=None, pauses=False):
+        """The generator behind waitIter(). If `pauses' is True, instead of sleeping between polls it yields a WaitPause object, and the caller is responsible for sleeping."""
+
+        status = True
+
+        # New waiters are taken from the group at each cycle
+        if isinstance(wanted, WaitGroup):
+            group = wanted
+        else:
+            group = WaitGroup(wanted if type(wanted).__name__ == 'list' else [wanted])
+        wanted = []
+        taken = []                      # All the waiters taken from the group
+        nwanted = 0
+        wmsg = None
+        index = DirIndex()
+        jobquery = self._jobQuery()
+        jobindexes = {}
+        ledgers = set()
+        notifier = Notify.PollNotifier() if pauses else self._notifier()
+        policy = policy or self._pollPolicy()
+        policy.reset()
+        if failfast == None:
+            failfast = self.getConfBoolean("failFast", default=self.failFast) if self.Conf else self.failFast
+        speculate = self.getConfBoolean("speculate", default=self.speculate) if self.Conf else self.speculate
+        start = time.time()
         # print "Initial: {}".format(wanted)
-        while wanted:
-            newmsg = ", ".join([ w.str() for w in wanted])
-            if newmsg != wmsg:
-                wmsg = newmsg
-                self.messagelf("Waiting for: " + wmsg)
-            newwanted = []
+        try:
+            while wanted or group.incoming:
+                new = [ self._parseWait(w) for w in group.take() ]
+                taken += new
+                for w in new:
+                    w.index = index
+                    q = w.jobquery or jobquery
+                    if q not in jobindexes:
+                        jobindexes[q] = Scheduler.JobIndex(q)
+                    w.jobindex = jobindexes[q]
+                    if w.ledger:
+                        ledgers.add(w.ledger)
+                if new:
+                    notifier.watch(set(w.watchdir() for w in new))
+                    nwanted += sum(w.wanted for w in new)
+                    wanted += new
+                newmsg = self._waitMessage(wanted)
+                if newmsg != wmsg:
+                    self.messagelf(("\n" if wmsg == None else "") + "Waiting for: " + newmsg)
+                    wmsg = newmsg
+                self._checkHeartbeats()
+                self._releaseSlots()
+                if self.executor:
+                    self.executor.poll()
+                index.refresh()
+                copies = self._speculationJobs() if speculate else []
+                for ji in jobindexes.values():
+                    ji.refresh([ j for w in wanted if w.jobindex is ji for j in w.pendingJobs() ] + copies)
+                for l in ledgers:
+                    new = l.update()
+                    for rec in new:
+                        self._ledgerRuntime(rec)
+                    l.consume([ rec for rec in new if rec.jobid in self._losers ])
+                nextCheck = self._checkStragglers(index, jobindexes.values()) if speculate else None
+                self._checkRetries(wanted, index, jobindexes.values())
+                newwanted = []
+                completed = []
+                for w in wanted:
+                    success = w.success()
+                    if success:
+                        w.code = w.status()
+                        if w.code != 0:
+                            self.messagelf("Warning: one of {} returned error code {}".format(w.filename, w.code))
+                            status = False
+                        if delete:
+                            w.delete()
+                        completed.append(w)
+                    else:
+                        newwanted.append(w)
+                wanted = newwanted
+                for w in completed:
+                    yield w
+                if failfast:
+                    failed = [ (w.filename, w.code) for w in completed if w.code ]
+                    failed += [ f for w in wanted for f in w.failures() ]
+                    if failed:
+                        yield self._failWait(wanted, time.time() - start, failed, cancel)
+                        return
+                # print "Now: {}".format(wanted)
+                if wanted:
+                    delay = policy.next()
+                    left = None
+                    if timeout != None:
+                        left = start + timeout - time.time()
+                        if left <= 0:
+                            result = WaitTimeout(wanted, time.time() - start, status)
+                            self.messagelf(str(result))
+                            self.message("\n")
+                            self.log.log(str(result))
+                            yield result
+                            return
+                        delay = min(delay, left)
+                    # Only running jobs need timely heartbeat checks: the others are noticed at the next wakeup
+                    if [ j for j in self._beating() if j.beats ]:
+                        interval = self._heartbeatInterval()
+                        left = interval if left == None else min(left, interval)
+                    if self._retries:
+                        due = max(0, min([ r[0] for r in self._retries ]) - time.time())
+                        left = due if left == None else min(left, due)
+                    if nextCheck != None:
+                        left = nextCheck if left == None else min(left, nextCheck)
+                    if pauses:
+                        yield WaitPause(delay)
+                    else:
+                        notifier.sleep(delay, left)
+        finally:
+            notifier.close()
+            # The indexes are only valid during this wait
+            for w in taken:
+                w.index = None
+                w.jobindex = None
+        self.messagelf("{} jobs completed.".format(nwanted))
+        self.message("\n")
+
+    def _waitMessage(self, wanted, shown=5):
+        """Returns the description of the waiters in `wanted', listing at most `shown' of them."""
+        msg = ", ".join([ w.str() for w in wanted[:shown] ])
+        if len(wanted) > shown:
+            msg += " and {} more".format(len(wanted) - shown)
+        return msg
+
+    def getRetryPolicy(self, retry):
+        """Returns the RetryPolicy for the `retry' argument of submit(): None if `retry' is false, `retry' itself if it is a RetryPolicy, or a policy built from the configuration (retryAttempts, default 3; retryBackoff, default 30 seconds; retryMemFactor, default 2) otherwise. If `retry' is a number, it is the maximum number of attempts."""
+        if not retry:
+            return None
+        if isinstance(retry, RetryPolicy):
+            return retry
+        if self.Conf:
+            policy = RetryPolicy(attempts=self.getConfInt("retryAttempts", default=3),
+                                 backoff=self.getConfFloat("retryBackoff", default=30.0),
+                                 memFactor=self.getConfFloat("retryMemFactor", default=2.0))
+        else:
+            policy = RetryPolicy()
+        if retry is not True:
+            policy.attempts = int(retry)
+        return policy
+
+    def _jobOutcome(self, job, index, jobindexes, records):
+        """Returns the return code of `job' if it has terminated, or None. Looks at its done file, its ledger record (in `records', indexed by job ID), and at the scheduler states obtained in the current wait cycle. If the job was speculatively duplicated, the outcome is the one of the copy that terminated first."""
+        done = job.args.get('done')
+        if done:
+            if index.exists(done):
+                return index.returnCode(done)
+            return None
+        jobid = job.winner or job.jobid
+        if job.args.get('ledger'):
+            r = records.get(jobid)
+            return r.code if r else None
+        for ji in jobindexes:
+            st = ji.state(jobid)
+            if st and st.finished():
+                return st.returnCode()
+        return None
+
+    def _checkRetries(self, wanted, index, jobindexes):
+        """Called at each wait cycle: look for failed jobs that have a retry policy, hide their failure from the waiters, and schedule their resubmission. Resubmit the jobs whose backoff time has expired."""
+        candidates = [ job for job in self.jobinfo.values() if job.retry and not job.final ]
+        records = self._ledgerRecords(candidates)
+        for job in candidates:
+            code = self._jobOutcome(job, index, jobindexes, records)
+            if code == None:
+                continue
+            job.final = True
+            if not job.retry.shouldRetry(job, code):
+                continue
+            delay = job.retry.delay(job.attempts)
+            self.log.log("Job {} (task {}) failed with code {}, attempt {}/{}: resubmitting in {:.0f}s.",
+                         job.jobid, job.task, code, job.attempts, job.retry.attempts, delay)
+            self.messagelf("Warning: job {} failed with code {}, will be resubmitted".format(job.jobid, code))
+            self.message("\n")
+            done = job.args.get('done')
+            if done:
+                try:
+                    os.remove(done)
+                except OSError:
+                    pass
+                index.forget(done)
+            if job.args.get('ledger'):
+                ledger = self.getLedger()
+                ledger.consume([ r for r in ledger.records if r.jobid == (job.winner or job.jobid) ])
+            for w in wanted:
+                if isinstance(w, SchedulerWaiter) and job.jobid in w.jobids:
+                    w.codes.pop(job.jobid, None)
+                    w.jobids[w.jobids.index(job.jobid)] = "retry:" + job.jobid   # Never finished, until replaced
+            self._retries.append((time.time() + delay, job, code))
+        now = time.time()
+        due = [ r for r in self._retries if r[0] <= now ]
+        for r in due:
+            self._retries.remove(r)
+            (t, job, code) = r
+            newid = self._resubmit(job, job.attempts+1, options=job.retry.options(job.args.get('options'), code), retry=job.retry)
+            self.log.log("Job {} resubmitted as {}.", job.jobid, newid)
+            if job.task and job.jobid in self.jobs[job.task]:
+                self.jobs[job.task].remove(job.jobid)
             for w in wanted:
-                success = w.success()
-                if success:
-                    st = w.status()
-                    if st != 0:
-                        self.messagelf("Warning: one of {} returned error code {}".format(w.filename, st))
-                        status = False
-                    if delete:
-                        w.delete()
-                    wanted.remove(w)
+                if isinstance(w, SchedulerWaiter) and "retry:" + job.jobid in w.jobids:
+                    w.jobids[w.jobids.index("retry:" + job.jobid)] = newid
+
+    def _ledgerRecords(self, jobs):
+        """Returns a dictionary mapping job IDs to their unconsumed ledger records, if any of `jobs' writes to the ledger."""
+        if not [ job for job in jobs if job.args.get('ledger') ]:
+            return {}
+        ledger = self.getLedger()
+        return dict([ (r.jobid, r) for r in ledger.records if r not in ledger.consumed ])
+
+    def _speculationJobs(self):
+        """Returns the IDs of the jobs whose scheduler state is needed to look for stragglers: those that have not terminated yet, to know when they start running, and their speculative copies."""
+        return [ j for job in self.jobinfo.values() if job.task and not job.bundle and not job.original and job.finished == None and not job.final
+                 for j in [job.jobid, job.copy] if j ]
+
+    def _firstOutcome(self, job, index, jobindexes, records):
+        """Returns a tuple (jobid, code) for the first of `job' and its speculative copy that terminated, or (None, None) if both are still running. The copy writes its own done file, next to its scratch directory (see submit())."""
+        done = job.args.get('done')
+        if done:
+            if index.exists(done):
+                return (job.jobid, index.returnCode(done))
+            copy = self.jobinfo.get(job.copy)
+            if copy and os.path.exists(copy.scratch + ".done"):
+                return (job.copy, readReturnCode(copy.scratch + ".done"))
+            return (None, None)
+        for jobid in [job.jobid, job.copy]:
+            if jobid == None:
+                continue
+            if job.args.get('ledger'):
+                if jobid in records:
+                    return (jobid, records[jobid].code)
+            else:
+                for ji in jobindexes:
+                    st = ji.state(jobid)
+                    if st and st.finished():
+                        return (jobid, st.returnCode())
+        return (None, None)
+
+    def _observed(self, job, jobindexes):
+        """Returns True if the termination of `job' can be detected in the current wait cycle."""
+        if job.args.get('done') or job.args.get('ledger'):
+            return True
+        return [ ji for ji in jobindexes if ji.state(job.jobid) ] != []
+
+    def _checkStarted(self, job, index, jobindexes, now):
+        """Set the start time of `job' if it was not known, and it is now running: its heartbeat file exists, or the scheduler reports it as running."""
+        if job.started != None:
+            return
+        if job.heartbeat and index.exists(job.heartbeat):
+            job.started = now
+            return
+        for ji in jobindexes:
+            st = ji.state(job.jobid)
+            if st and st.running:
+                job.started = now
+                return
+
+    def _checkStragglers(self, index, jobindexes):
+        """Called at each wait cycle when speculation is enabled (speculate configuration entry). Once speculateFraction of the jobs of a task have completed, a job of the same task that has been running for longer than speculateFactor times the speculateQuantile quantile of their runtimes is a straggler, and a copy of it is submitted. Runtimes are measured from the time the jobs were seen starting (or taken from their ledger records), so the time spent in the queue is not counted. Whichever of the two copies terminates first determines the outcome of the job, and the other one is cancelled. Returns the number of seconds until the next job would become a straggler, or None."""
+        if self.Conf:
+            q = self.getConfFloat("speculateQuantile", default=self.speculateQuantile)
+            factor = self.getConfFloat("speculateFactor", default=self.speculateFactor)
+            fraction = self.getConfFloat("speculateFraction", default=self.speculateFraction)
+        else:
+            (q, factor, fraction) = (self.speculateQuantile, self.speculateFactor, self.speculateFraction)
+        jobs = [ job for job in self.jobinfo.values() if job.task and not job.bundle and not job.original ]
+        records = self._ledgerRecords(jobs)
+        now = time.time()
+        nextCheck = None
+        tasks = defaultdict(list)
+        for job in jobs:
+            if job.finished == None:
+                self._checkStarted(job, index, jobindexes, now)
+                (winner, code) = self._firstOutcome(job, index, jobindexes, records)
+                if code != None:
+                    job.finished = now
+                    job.code = code
+                    rec = records.get(winner)
+                    job.elapsed = rec.elapsed if rec and rec.elapsed != None else now - (job.started or job.submitted)
+                    if job.copy:
+                        self._settleCopies(job, winner)
+                elif not self._observed(job, jobindexes):
+                    continue
+            if job.winner and job.winner != job.jobid:
+                for ji in jobindexes:
+                    ji.alias(job.jobid, job.winner)
+            tasks[job.task].append(job)
+        # Ignore the records of the copies that lost, including those settled in this cycle
+        if self._losers and records:
+            self.getLedger().consume([ r for r in records.values() if r.jobid in self._losers ])
+        for (task, tjobs) in tasks.items():
+            finished = [ job.elapsed for job in tjobs if job.finished != None and job.code == 0 and not job.copy ]
+            if len(finished) < max(History.History.minimum, fraction * len(tjobs)):
+                continue
+            limit = History.quantile(finished, q) * factor
+            for job in tjobs:
+                if job.finished == None and job.started != None and not job.copy and not job.lost:
+                    if now - job.started > limit:
+                        self._speculate(job, now - job.started, limit)
+                    else:
+                        wait = job.started + limit - now
+                        nextCheck = wait if nextCheck == None else min(nextCheck, wait)
+        return nextCheck
+
+    def _speculate(self, job, elapsed, limit):
+        """Submit a copy of straggler `job'. The copy runs in a scratch directory in speculateDir, so that it does not overwrite the outputs that `job' is writing: the scratch directory only links the files that were last modified before `job' was seen starting, and the outputs of the copy are moved to the run directory when it succeeds (see jobwrap.py)."""
+        self.mkdir(self.speculateDir)
+        scratch = os.path.abspath(os.path.join(self.speculateDir, job.jobid))
+        job.copy = self._resubmit(job, job.attempts, _scratch=scratch, _since=job.started, retry=None)     # Retries are handled by the original job
+        self.jobinfo[job.copy].original = job.jobid
+        self.jobinfo[job.copy].scratch = scratch
+        self.log.log("Job {} (task {}) running for {:.0f}s, longer than {:.0f}s: submitted copy {}.", job.jobid, job.task, elapsed, limit, job.copy)
+        self.messagelf("Warning: job {} is a straggler, submitted copy {}".format(job.jobid, job.copy))
+        self.message("\n")
+
+    def _settleCopies(self, job, winner):
+        """`winner', one of `job' and its copy, terminated first: cancel the other one and remove the copy's scratch directory. If the copy won, its outcome is written to the done file of `job'."""
+        job.winner = winner
+        loser = job.copy if winner == job.jobid else job.jobid
+        self.log.log("Job {} (task {}): copy {} terminated first, cancelling {}.", job.jobid, job.task, winner, loser)
+        self.getExecutor().cancel([loser])
+        copy = self.jobinfo[job.copy]
+        if winner == job.copy and job.args.get('done'):
+            Executors.writeDone(job.args['done'], job.code)
+        shutil.rmtree(copy.scratch, ignore_errors=True)
+        try:
+            os.remove(copy.scratch + ".done")
+        except OSError:
+            pass
+        self._losers.add(loser)
+        copy.final = True
+        if loser in self.jobs[job.task]:
+            self.jobs[job.task].remove(loser)
+
+    def _resubmit(self, job, attempts, _scratch=None, _since=None, **changes):
+        """Submit Job `job' again, with the arguments in `changes' replacing its original ones, as its `attempts'-th attempt. `_scratch' and `_since' are as in submit(). Returns the new job ID."""
+        args = dict(job.args)
+        args.update(changes)
+        if job.element:
+            newid = self._submitElement(job.script, _attempts=attempts, _scratch=_scratch, _since=_since, **args)
+        else:
+            newid = self.submit(job.script, _attempts=attempts, _scratch=_scratch, _since=_since, **args)
+        self.jobinfo[newid].bundle = job.bundle
+        self.jobinfo[newid].tasks = job.tasks
+        return newid
+
+    def _beating(self):
+        """Returns the jobs that are being monitored through their heartbeat."""
+        return [ j for j in self.jobinfo.values() if j.heartbeat and not j.lost and not j.final and j.finished == None ]
+
+    def _heartbeatInterval(self):
+        return self.getConfInt("heartbeatInterval", default=self.heartbeatInterval) if self.Conf else self.heartbeatInterval
+
+    def _checkHeartbeats(self):
+        """Look for jobs whose heartbeat is older than heartbeatTimeout, and handle them according to lostAction. A job whose heartbeat file was seen and has disappeared has terminated, and is not monitored anymore."""
+        beating = self._beating()
+        if not beating or time.time() - self._lastHeartbeatCheck < self._heartbeatInterval():
+            return
+        self._lastHeartbeatCheck = time.time()
+        timeout = self.getConfInt("heartbeatTimeout", default=self.heartbeatTimeout) if self.Conf else self.heartbeatTimeout
+        action = self.getConf("onLostJob", default=self.lostAction) if self.Conf else self.lostAction
+        try:
+            present = set(os.listdir(self.heartbeatDir))
+        except OSError:
+            return
+        for job in beating:
+            if os.path.basename(job.heartbeat) in present:
+                if not job.beats:
+                    job.beats = True
+                    if job.started == None:
+                        job.started = time.time()
+                age = job.heartbeatAge()
+                if age != None and age > timeout:
+                    self._lostJob(job, age, action)
+            elif job.beats:
+                job.heartbeat = None        # Removed by jobwrap.py when the job terminated
+
+    def _lostJob(self, job, age, action):
+        job.lost = True
+        self.log.log("Job {} (task {}) lost: no heartbeat for {:.0f}s.", job.jobid, job.task, age)
+        self.messagelf("Warning: job {} lost, no heartbeat for {:.0f}s".format(job.jobid, age))
+        self.message("\n")
+        self.getExecutor().cancel([job.jobid])
+        try:
+            os.remove(job.heartbeat)
+        except OSError:
+            pass
+        if job.original:
+            # A speculative copy: forget it, the original job provides the outcome
+            job.final = True
+            self.jobinfo[job.original].copy = None
+            self._losers.add(job.jobid)
+            if job.jobid in self.jobs[job.task]:
+                self.jobs[job.task].remove(job.jobid)
+            shutil.rmtree(job.scratch, ignore_errors=True)
+            return None
+        if action == "resubmit" and job.attempts <= self.maxResubmits:
+            # Ignore the outcome the executor may have recorded when cancelling the job
+            self._losers.add(job.jobid)
+            if job.args.get('done'):
+                try:
+                    os.remove(job.args['done'])
+                except OSError:
+                    pass
+            newid = self._resubmit(job, job.attempts+1)
+            if job.task and job.jobid in self.jobs[job.task]:
+                self.jobs[job.task].remove(job.jobid)
+            self.log.log("Job {} resubmitted as {}.", job.jobid, newid)
+            return newid
+        # Record the failure in the same way the job would have
+        if job.tasks:
+            self._failBundle(job)
+            return None
+        if job.args.get('done'):
+            with open(job.args['done'], "w") as out:
+                out.write("{}\n".format(self.lostCode))
+        ledger = job.args.get('ledger')
+        if ledger and not self.getLedger().scan(job.jobid):     # Unless the executor recorded the cancellation
+            self.getLedger().append(job.jobid, self._ledgerKey(ledger, job.task, job.args.get('prefix')), self.lostCode)
+        return None
+
+    def _failBundle(self, job):
+        """Record return code lostCode for each command of the lost bundle `job' that did not complete: write it to its done file, and append its ledger record."""
+        ledger = self.getLedger() if [ t for t in job.tasks if t[1] ] else None
+        recorded = defaultdict(int)     # Records already written by the bundle, by task
+        if ledger:
+            for rec in ledger.scan(job.jobid):
+                recorded[rec.task] += 1
+        for (done, key) in job.tasks:
+            if done and not os.path.exists(done):
+                Executors.writeDone(done, self.lostCode)
+            if key:
+                if recorded[key] > 0:
+                    recorded[key] -= 1
                 else:
-                    newwanted.append(w)
-            wanted = newwanted
-            # print "Now: {}".format(wanted)
-            if wanted:
-                time.sleep(5)
-        self.messagelf("{} jobs completed.".format(nwanted))
+                    ledger.append(job.jobid, key, self.lostCode)
+
+    def _failWait(self, pending, elapsed, failed, cancel):
+        cancelled = []
+        if cancel:
+            if type(cancel).__name__ == 'str':
+                cancel = [cancel]
+            for task in cancel:
+                cancelled += self.cancelJobs(task)
+        result = WaitFailure(pending, elapsed, failed, cancelled)
+        self.messagelf(str(result))
         self.message("\n")
-        return status
+        self.log.log(str(result))
+        return result
 
     def copy(self, filename, dest="", exclude=False, symlink=False):
         """Copy `filename' to the current directory. The filename is preserved unless `dest' is specified, in which case it is used as the new filename."""
@@ -876,27 +2026,405 @@ dictionaries, using the elements of `fields' as keys."""
             result.append(d)
         return result
 
-    def submit(self, scriptAndArgs, after=False, done=False, prefix=None, options=None, otherargs=None, task=None):
-        """Submit a script to the SGE queue with the submit command. `scriptAndArgs' is a string containing the qsub script that should be submitted and its arguments. If `after' is specified, schedule this job to run after the one whose jobid is the value of `after'. If `done' is a filename, the script will create a file with that name when done (use this in conjunction with the wait() method). Returns the jobid of the submitted job."""
-        cmdline = submitCmd
-        if otherargs:
-            cmdline += " " + otherargs
-        if after:
-            cmdline = cmdline + " -after " + after
-        if done:
-            cmdline = cmdline + " -done " + done
-        if options:
-            cmdline = cmdline + " -o " + options
+    def submit(self, scriptAndArgs, after=False, done=False, prefix=None, options=None, otherargs=None, task=None, ledger=False, heartbeat=False, runtime=None, retry=None, size=None, _attempts=1, _scratch=None, _since=None):
+        """Submit a script to the SGE queue with the submit command (or, more generally, run it with the executor returned by getExecutor()). `scriptAndArgs' is a string containing the qsub script that should be submitted and its arguments. If `after' is specified, schedule this job to run after the one whose jobid is the value of `after'. If `done' is a filename, the script will create a file with that name when done (use this in conjunction with the wait() method). If `ledger' is specified, the script is run through jobwrap.py, which appends a record to the completion ledger when the script terminates; the record's task is `ledger' if it is a string, or `task' otherwise (use this in conjunction with ledgerWaiter()). If `heartbeat' is True, the script is also run through jobwrap.py, which touches a heartbeat file while it runs: if the heartbeat stops for more than heartbeatTimeout seconds while waiting, the job is considered lost and is either failed (its done file or ledger record gets return code lostCode) or resubmitted, according to lostAction (onLostJob in the configuration). `runtime' is the expected runtime of the job in seconds, used by the hybrid executor to decide where to run it (see predictRuntime()). If `retry' is specified, a job that fails (as reported by its done file, ledger record, or by the scheduler) while waiting for it is resubmitted automatically, and wait() only sees the outcome of the last attempt; `retry' can be a RetryPolicy, the maximum number of attempts, or True to use the retryAttempts, retryBackoff, and retryMemFactor configuration entries (see getRetryPolicy()). `size' is the size of the job's input (e.g. in bytes), recorded in the history together with its runtime and memory usage; if resourceRequests is set, the walltime and memory that `options' does not request are added based on the history (see suggestResources()). Returns the jobid of the submitted job."""
+        after = self._implicitAfter(after)
+        retried = [ j for j in Executors.splitJobids(after) if j in self.jobinfo and self.jobinfo[j].retry ]
+        if retried:
+            self.log.log("Warning: a job of task {} depends on {}, submitted with a retry policy: if it is retried, the dependency still refers to the failed attempt.", task, ", ".join(retried))
+        options = self._requestResources(task, options, size)
+        args = {'after': after, 'done': done, 'prefix': prefix, 'options': options, 'otherargs': otherargs,
+                'task': task, 'ledger': ledger, 'heartbeat': heartbeat, 'runtime': runtime, 'retry': retry, 'size': size}
+        script = scriptAndArgs
+        wrap = ""
+        ledgerSpec = None
+        if ledger:
+            key = self._ledgerKey(ledger, task, prefix)
+            ledgerSpec = (self.getLedger().filename, key)
+            wrap += " -ledger {} -task {}".format(self.getLedger().filename, key)
+        hbfile = None
+        if heartbeat:
+            self.mkdir(self.heartbeatDir)
+            (fd, hbfile) = mkstemp(prefix="hb", dir=self.heartbeatDir)
+            os.close(fd)
+            os.remove(hbfile)   # Will be created by the job when it starts
+            hbfile = os.path.abspath(hbfile)
+            interval = self._heartbeatInterval()
+            wrap += " -heartbeat {} -interval {}".format(hbfile, interval)
+        if _scratch:
+            # A speculative copy: it runs in a scratch directory, and writes its own done file
+            wrap += " -scratch {}".format(_scratch)
+            if _since != None:
+                # Only the files that existed before the original job started are inputs
+                wrap += " -since {:.0f}".format(_since)
+            if done:
+                wrap += " -done {}".format(_scratch + ".done")
+        if wrap:
+            scriptAndArgs = jobwrapCmd + wrap + " " + scriptAndArgs
         if prefix == None:
             prefix = self.prefix
-        if prefix != None:
-            cmdline = cmdline + " -p " + prefix
-        cmdline = cmdline + " " + scriptAndArgs
-        jobid = self.execute(cmdline)
+        spec = Executors.JobSpec(scriptAndArgs, after=after, done=None if _scratch else done, prefix=prefix, options=options, otherargs=otherargs, ledger=ledgerSpec,
+                                 task=task, runtime=runtime, size=size)
+        tokens = self._acquireSlots(1, spec)
+        try:
+            jobid = self.getExecutor().submit(spec)
+        except Exception:
+            if tokens:
+                self._slots.release(tokens)
+            raise
+        for t in tokens:
+            self._slots.assign(t, jobid)
         if task:
             self.jobs[task].append(jobid)
+        job = Job(jobid, script, args, attempts=_attempts)
+        job.heartbeat = hbfile
+        job.retry = self.getRetryPolicy(retry)
+        self.jobinfo[jobid] = job
+        if self.collected != None:
+            self.collected.append(jobid)
         return jobid
 
+    def startCollecting(self, after=None):
+        """Start collecting the IDs of the submitted jobs (see stopCollecting()). If `after' is a list of job IDs, all jobs submitted until stopCollecting() is called will depend on them, in addition to their own `after' argument. This is used by the Director to run Lines that declare their inputs and outputs."""
+        self.collected = []
+        self.defaultAfter = after or None
+
+    def stopCollecting(self):
+        """Returns the IDs of the jobs submitted since startCollecting() was called, and stops collecting them."""
+        jobids = self.collected or []
+        self.collected = None
+        self.defaultAfter = None
+        return jobids
+
+    def _implicitAfter(self, after):
+        if not self.defaultAfter:
+            return after
+        jobids = Executors.splitJobids(after)
+        return ",".join(jobids + [ j for j in self.defaultAfter if j not in jobids ])
+
+    def getSlots(self):
+        """Returns the Slots.JobSlots object that limits the number of jobs in flight to maxJobs (from the configuration), shared with other runs through slotFile if specified, or None if there is no limit. The slots of runs on other hosts that were not refreshed for slotExpire seconds (default: 3600) are freed."""
+        if self._slots == None:
+            limit = self.getConfInt("maxJobs", default=self.maxJobs) if self.Conf else self.maxJobs
+            filename = self.getConf("slotFile", default=self.slotFile) if self.Conf else self.slotFile
+            expire = self.getConfInt("slotExpire", default=self.slotExpire) if self.Conf else self.slotExpire
+            self._slots = Slots.JobSlots(limit, filename, expire=expire) if limit else False
+        return self._slots or None
+
+    def _acquireSlots(self, n, spec):
+        """Wait until `n' job slots are available for the job described by `spec', and return their tokens. Returns an empty list if there is no limit on the number of jobs, or if the executor does not run the job on the cluster."""
+        slots = self.getSlots()
+        if not slots or not self.getExecutor().limits(spec):
+            return []
+        tokens = slots.acquire(n)
+        if tokens:
+            return tokens
+        self.log.log("Maximum number of jobs ({}) reached, waiting for a free slot.", slots.limit)
+        policy = Notify.PollPolicy(initial=1.0, maximum=self.slotPoll)
+        while True:
+            self._releaseSlots(force=True)
+            tokens = slots.acquire(n)
+            if tokens:
+                return tokens
+            time.sleep(policy.next())
+
+    def _releaseSlots(self, force=False):
+        """Free the slots of our jobs that have completed, and refresh the timestamps of the others. Unless `force' is True, this is done at most once every slotPoll seconds."""
+        slots = self._slots
+        if not slots or (not force and time.time() - self._lastSlotCheck < self.slotPoll):
+            return
+        self._lastSlotCheck = time.time()
+        held = slots.held()
+        if not held:
+            return
+        states = self._jobQuery().query(list(set(held.values())))
+        if states:
+            slots.release([ t for (t, j) in held.items() if j in states and states[j].finished() ])
+        slots.refresh()
+
+    def submitPool(self, workers=None, rate=None, retries=None):
+        """Returns a Pool.SubmitPool that runs submit() concurrently on `workers' threads (default: the submitWorkers configuration entry, or 4), starting at most `rate' submissions per second (submitRate, default 10; 0 means no limit), and retrying up to `retries' times (submitRetries, default 3) when the submit command fails. The pool's submit() method accepts the same arguments as submit() and returns a Future that resolves to the job ID; job IDs are recorded in self.jobs as usual. Use it as a context manager to wait for all submissions:
+
+  with ACT.submitPool() as pool:
+      futures = [ pool.submit("align.qsub " + s, task="align") for s in samples ]
+  jobids = [ f.result() for f in futures ]
+"""
+        if workers == None:
+            workers = self.getConfInt("submitWorkers", default=self.submitWorkers) if self.Conf else self.submitWorkers
+        if rate == None:
+            rate = self.getConfFloat("submitRate", default=self.submitRate) if self.Conf else self.submitRate
+        if retries == None:
+            retries = self.getConfInt("submitRetries", default=self.submitRetries) if self.Conf else self.submitRetries
+        # The workers share these objects, so they must exist before the first submission
+        self.getExecutor()
+        self.getLedger()
+        self.getSlots()
+        self.getHistory()
+        return Pool.SubmitPool(self.submit, workers=workers, rate=rate, retries=retries)
+
+    def getExecutor(self):
+        """Returns the executor used to run jobs, creating it if necessary. The executor is determined by the `executor' configuration entry: submit (the default) uses the submit command; local runs jobs on this machine, using at most localCpus CPUs and localMem MB of memory (defaulting to the whole machine); hybrid runs the jobs whose predicted runtime is below localThreshold seconds (default: 60) on this machine, using at most localCpus CPUs (default: 2), and submits the others; pilot puts the jobs in a queue directory (pilotDir, default .pilots), from which they are run by `pilots' pilot jobs (default: 4), each running pilotParallel jobs at a time (default: 1) and submitted with pilotOptions, or run locally if pilotBackend is local; dry only records the jobs, and pretends that they succeeded."""
+        if not self.executor:
+            name = self.getConf("executor", default="submit") if self.Conf else "submit"
+            cpus = self.getConfInt("localCpus") if self.Conf else None
+            if name == "hybrid" and not cpus:
+                cpus = self.localCpus
+            self.executor = Executors.makeExecutor(name, execute=self.execute, command=submitCmd,
+                                                   cancelCmd=self.getConf("cancelCmd") if self.Conf else None,
+                                                   cpus=cpus,
+                                                   mem=self.getConfInt("localMem") if self.Conf else None,
+                                                   log=self.log.log,
+                                                   predict=self.predictRuntime,
+                                                   threshold=self.getConfFloat("localThreshold", default=self.localThreshold) if self.Conf else self.localThreshold,
+                                                   queryCmd=self.getConf("queryCmd") if self.Conf else None,
+                                                   queryGrace=self._queryGrace(),
+                                                   pilot=self._pilotConf())
+            if isinstance(self.executor, Executors.HybridExecutor):
+                self.executor.local.onFinish = self._localRuntime
+        return self.executor
+
+    def _pilotConf(self):
+        conf = {'queuedir': self.pilotDir}
+        if self.Conf:
+            for (key, entry, getter) in [('queuedir', "pilotDir", self.getConf), ('pilots', "pilots", self.getConfInt),
+                                         ('parallel', "pilotParallel", self.getConfInt), ('options', "pilotOptions", self.getConf),
+                                         ('idle', "pilotIdle", self.getConfFloat), ('backend', "pilotBackend", self.getConf)]:
+                v = getter(entry)
+                if v != None:
+                    conf[key] = v
+        return conf
+
+    def getHistory(self):
+        """Returns the History object storing the runtimes of past jobs (in the file specified by the historyFile configuration entry, default ~/.damon-history.db), or None if the history cannot be used."""
+        if self._history == None:
+            filename = self.getConf("historyFile") if self.Conf else None
+            try:
+                self._history = History.History(filename)
+            except Exception as e:
+                self.log.log("Runtime history disabled: {}".format(e))
+                self._history = False
+        return self._history or None
+
+    def predictRuntime(self, spec):
+        """Returns the expected runtime in seconds of the job described by Executors.JobSpec `spec', or None if unknown. This is the `runtime' argument passed to submit(), if any; otherwise, the entry for the job's task in the Runtimes section of the configuration file; otherwise, a high quantile of the runtimes of the same task in past runs."""
+        if spec.runtime != None:
+            return spec.runtime
+        if not spec.task:
+            return None
+        if self.Conf:
+            rt = self.getConfFloat(spec.task, section="Runtimes")
+            if rt != None:
+                return rt
+        hist = self.getHistory()
+        if hist:
+            return hist.predict(spec.task, size=spec.size)
+        return None
+
+    def suggestResources(self, task, size=None):
+        """Returns a tuple (walltime, mem) with the walltime in seconds and the memory in MB that a job of `task' should request, or None for the values that cannot be determined. The entries for `task' in the Walltime and Memory sections of the configuration file (e.g. 2:00:00 and 16G; plain numbers are seconds and MB) take precedence. Otherwise, the values are the resourceQuantile quantile (default: 0.95) of the runtimes and memory usage of the past jobs of `task', increased by resourceMargin (default: 0.25). The walltime is scaled to the input `size' if given (see History.predict()); the memory is scaled only if `task' matches one of the patterns in memoryScaling, since the memory used by many programs does not grow with the size of their input."""
+        walltime = None
+        mem = None
+        if self.Conf:
+            w = self.getConf(task, section="Walltime")
+            if w:
+                walltime = Scheduler.parseDuration(w)
+            m = self.getConf(task, section="Memory")
+            if m:
+                mem = Scheduler.parseMemory(m) if m[-1].isalpha() else float(m)
+            q = self.getConfFloat("resourceQuantile", default=self.resourceQuantile)
+            margin = self.getConfFloat("resourceMargin", default=self.resourceMargin)
+            scaling = self.getConfList("memoryScaling", default=self.memoryScaling)
+        else:
+            (q, margin, scaling) = (self.resourceQuantile, self.resourceMargin, self.memoryScaling)
+        hist = self.getHistory()
+        if hist:
+            if walltime == None:
+                walltime = hist.predict(task, q, size=size)
+                if walltime != None:
+                    walltime *= 1 + margin
+            if mem == None:
+                scaled = [ p for p in scaling if fnmatch.fnmatchcase(task, p.replace("@", "*")) ]
+                mem = hist.predictMemory(task, q, size=size if scaled else None)
+                if mem != None:
+                    mem *= 1 + margin
+        return (walltime, mem)
+
+    def _requestResources(self, task, options, size):
+        """Returns `options' with the walltime and memory suggested by suggestResources() added (using the walltimeArgs and memArgs formats), for the values that it does not request already. This is done only if resourceRequests is set; if it is suggest, the suggested values are logged (once for each task) and `options' is not changed."""
+        mode = self.getConf("resourceRequests", default=self.resourceRequests) if self.Conf else self.resourceRequests
+        if not task or mode not in ["suggest", "set"]:
+            return options
+        (walltime, mem) = self.suggestResources(task, size)
+        if walltime == None and mem == None:
+            return options
+        reqTime = Executors.parseWalltime(options)
+        reqMem = Executors.parseResources(options)[1]
+        timeFmt = self.getConf("walltimeArgs", default=walltimeArgs) if self.Conf else walltimeArgs
+        memFmt = self.getConf("memArgs", default=memArgs) if self.Conf else memArgs
+        if mode == "set" and options and re.search("(^|\\s)-l\\s", options) and not (timeFmt.startswith("-l") and memFmt.startswith("-l")):
+            # Resource lists (-l, as in PBS and SGE) may request these values in forms that are not recognized
+            if task not in self._suggested:
+                self._suggested.add(task)
+                self.log.log("Not adding resource requests to the -l options of task {}: {}", task, options)
+            return options
+        if mode == "suggest":
+            if task not in self._suggested:
+                self._suggested.add(task)
+                self.log.log("Suggested resources for task {}: walltime {}, memory {} (requested: {}, {}).", task,
+                             "-" if walltime == None else self.printDuration(walltime), "-" if mem == None else "{:.0f}M".format(mem),
+                             "-" if reqTime == None else self.printDuration(reqTime), "-" if reqMem == None else "{}M".format(reqMem))
+            return options
+        extra = []
+        if walltime != None and reqTime == None:
+            extra.append(timeFmt.format(int(math.ceil(walltime / 60.0))))
+        if mem != None and reqMem == None:
+            extra.append(memFmt.format(int(math.ceil(mem))))
+        if extra:
+            options = " ".join(([options] if options else []) + extra)
+        return options
+
+    def _recordRuntime(self, task, runtime, code, size=None):
+        hist = self.getHistory()
+        if hist and task:
+            try:
+                hist.record(task, runtime, size=size, code=code)
+            except Exception as e:
+                self.log.log("Error recording runtime of {}: {}".format(task, e))
+
+    def _localRuntime(self, job):
+        """Called by the local executor when a job terminates. Jobs that write to the ledger are recorded when their ledger record is read, and bundles are not recorded, since their runtime is not the one of a single task."""
+        info = self.jobinfo.get(job.jobid)
+        if not job.spec.ledger and not (info and info.bundle):
+            self._recordRuntime(job.spec.task, job.finished - job.started, job.code, size=job.spec.size)
+
+    def _ledgerRuntime(self, rec):
+        """Record the runtime in ledger record `rec' under the task of its job, and also under the ledger task if it is different (e.g. line:item for scattered Lines)."""
+        job = self.jobinfo.get(rec.jobid)
+        if rec.elapsed != None:
+            size = job.args.get('size') if job else None
+            self._recordRuntime(job.task if job else rec.task, rec.elapsed, rec.code, size=size)
+            if job and job.task and rec.task != job.task:
+                self._recordRuntime(rec.task, rec.elapsed, rec.code, size=size)
+
+    def submitArray(self, commands, after=False, done=None, prefix=None, options=None, otherargs=None, task=None, ledger=False, maxsize=None, retry=None):
+        """Submit the command lines in the list `commands' as one array job, instead of one job for each of them. Each element of the array runs its command line through jobwrap.py. If `done' is specified, it should be a list of filenames, one for each command; each element writes its return code to the corresponding file. `ledger' is as in submit(), and can also be a list of ledger task names, one for each command. Arrays larger than `maxsize' elements (default: the maxArraySize configuration entry, or 1000), or than maxJobs if set, are split into multiple array jobs. The other arguments are as in submit(), and apply to all elements; failed elements are retried individually. Returns the list of the IDs of the array elements (built from the array ID and index with the arrayElementId configuration entry, default: {}_{}), which are also added to self.jobs[task]. If the executor does not support array jobs, each command is submitted as a separate job, still run through jobwrap.py."""
+        (done, ledger) = self._taskLists(commands, done, ledger, task, prefix)
+        if not self.getExecutor().arrays:
+            return [ self._submitElement(commands[i], done=done[i], ledger=ledger[i], after=after, prefix=prefix, options=options,
+                                         otherargs=otherargs, task=task, retry=retry) for i in range(len(commands)) ]
+        after = self._implicitAfter(after)
+        if maxsize == None:
+            maxsize = self.getConfInt("maxArraySize", default=self.maxArraySize) if self.Conf else self.maxArraySize
+        if self.getSlots():
+            maxsize = min(maxsize, self.getSlots().limit)       # Each element takes a slot
+        arrayOpt = self.getConf("arrayArgs", default=arrayArgs) if self.Conf else arrayArgs
+        elementId = self.getConf("arrayElementId", default=arrayElementId) if self.Conf else arrayElementId
+        wrap = ""
+        if any(ledger):
+            wrap = " -ledger " + self.getLedger().filename
+        jobids = []
+        for start in range(0, len(commands), maxsize):
+            chunk = range(start, min(start + maxsize, len(commands)))
+            taskfile = self._writeTaskFile(task or "array", chunk, commands, done, ledger)
+            extra = arrayOpt.format(1, len(chunk))
+            if otherargs:
+                extra = otherargs + " " + extra
+            spec = Executors.JobSpec(jobwrapCmd + " -array " + os.path.abspath(taskfile) + wrap, after=after,
+                                     prefix=self.prefix if prefix == None else prefix, options=options, otherargs=extra)
+            tokens = self._acquireSlots(len(chunk), spec)
+            try:
+                arrayid = self.getExecutor().submit(spec)
+            except Exception:
+                if tokens:
+                    self._slots.release(tokens)
+                raise
+            for n, i in enumerate(chunk):
+                jobid = elementId.format(arrayid, n+1)
+                if tokens:
+                    self._slots.assign(tokens[n], jobid)
+                jobids.append(jobid)
+                self.jobinfo[jobid] = Job(jobid, commands[i], {'after': after, 'done': done[i], 'prefix': prefix, 'options': options,
+                                                               'otherargs': otherargs, 'task': task, 'ledger': ledger[i], 'retry': retry})
+                self.jobinfo[jobid].retry = self.getRetryPolicy(retry)
+                self.jobinfo[jobid].element = True
+        if task:
+            self.jobs[task] += jobids
+        if self.collected != None:
+            self.collected += jobids
+        return jobids
+
+    def _submitElement(self, command, done=None, ledger=None, _attempts=1, _scratch=None, _since=None, **args):
+        """Submit `command', one element of an array job, as a job of its own. As within the array, it is run by jobwrap.py with a shell, and writes its return code to `done' and to the ledger with task `ledger' (if not None). The other arguments are passed to submit(). Returns the job ID."""
+        # A speculative copy writes its done file itself (see submit())
+        taskfile = self._writeTaskFile(args.get('task') or "element", [0], [command], [None if _scratch else done], [ledger])
+        wrap = " -ledger " + self.getLedger().filename if ledger else ""
+        jobid = self.submit(jobwrapCmd + " -bundle " + taskfile + wrap, done=done if _scratch else False, _attempts=_attempts, _scratch=_scratch, _since=_since, **args)
+        job = self.jobinfo[jobid]
+        job.script = command
+        job.args = dict(job.args, done=done, ledger=ledger)
+        job.element = True
+        return jobid
+
+    def _taskLists(self, commands, done, ledger, task, prefix=None):
+        """Returns the done files and the ledger tasks for `commands', as lists with one element for each command."""
+        if done == None:
+            done = [None] * len(commands)
+        if type(ledger).__name__ != 'list':
+            key = self._ledgerKey(ledger, task, prefix) if ledger else None
+            ledger = [key] * len(commands)
+        return (done, ledger)
+
+    def _ledgerKey(self, ledger, task, prefix=None):
+        """Returns the ledger task for the `ledger' argument of submit(): `ledger' itself if it is a string, otherwise `task', or the job prefix if there is no task."""
+        if type(ledger).__name__ == 'str':
+            return ledger
+        key = task or prefix or self.prefix
+        if not key:
+            raise ActorError("A job that writes to the ledger needs a task, a prefix, or a ledger task name.")
+        return key
+
+    def _writeTaskFile(self, name, indexes, commands, done, ledger):
+        """Write the task file read by jobwrap.py -array or -bundle for the commands at positions `indexes', and return its absolute path."""
+        self.mkdir(self.arrayDir)
+        (fd, taskfile) = mkstemp(prefix=name + "-", suffix=".tasks", dir=self.arrayDir)
+        with os.fdopen(fd, "w") as out:
+            for i in indexes:
+                out.write("{}\t{}\t{}\n".format(done[i] or "-", ledger[i] or "-", commands[i]))
+        return os.path.abspath(taskfile)
+
+    def getBundleSize(self, task=None, parallel=1):
+        """Returns the number of tasks to pack in each bundle by submitBundle(). If the runtime of `task' can be predicted (see predictRuntime()), this is the number of tasks that fill bundleTime seconds (default: 1800) when running `parallel' at a time; otherwise it is the bundleSize configuration entry (default: 10), and at least `parallel'."""
+        target = self.getConfFloat("bundleTime", default=self.bundleTime) if self.Conf else self.bundleTime
+        runtime = self.predictRuntime(Executors.JobSpec("", task=task)) if task else None
+        if runtime:
+            return max(1, int(target / runtime)) * parallel
+        size = self.getConfInt("bundleSize", default=self.bundleSize) if self.Conf else self.bundleSize
+        return max(size, parallel)
+
+    def submitBundle(self, commands, after=False, done=None, prefix=None, options=None, otherargs=None, task=None, ledger=False, heartbeat=False,
+                     size=None, parallel=None):
+        """Submit the command lines in the list `commands' packed in bundles of `size' commands, each of which is run as a single job. This reduces the load on the scheduler when there are many short tasks. Within a bundle, commands are run by jobwrap.py `parallel' at a time (default: the bundleCores configuration entry, or 1; `options' should request the corresponding number of cores). If `size' is not specified, it is computed by getBundleSize(). Each command still writes its own done file and ledger record: `done' and `ledger' are as in submitArray(). The other arguments are as in submit(), and apply to all bundles. Returns the list of job IDs, one for each command (commands in the same bundle have the same job ID)."""
+        if parallel == None:
+            parallel = self.getConfInt("bundleCores", default=self.bundleCores) if self.Conf else self.bundleCores
+        if size == None:
+            size = self.getBundleSize(task, parallel)
+        (done, ledger) = self._taskLists(commands, done, ledger, task, prefix)
+        wrap = " -parallel {}".format(parallel)
+        if any(ledger):
+            wrap += " -ledger " + self.getLedger().filename
+        runtime = self.predictRuntime(Executors.JobSpec("", task=task)) if task else None
+        jobids = []
+        for start in range(0, len(commands), size):
+            chunk = range(start, min(start + size, len(commands)))
+            taskfile = self._writeTaskFile(task or "bundle", chunk, commands, done, ledger)
+            jobid = self.submit(jobwrapCmd + " -bundle " + taskfile + wrap, after=after, prefix=prefix, options=options, otherargs=otherargs,
+                                task=task, heartbeat=heartbeat,
+                                runtime=runtime * ((len(chunk) + parallel - 1) // parallel) if runtime else None)
+            self.jobinfo[jobid].bundle = len(chunk)
+            self.jobinfo[jobid].tasks = [ (done[i], ledger[i]) for i in chunk ]
+            jobids += [jobid] * len(chunk)
+        return jobids
+
 # Methods section
 
     def addMethods(self, text):
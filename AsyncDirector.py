@@ -0,0 +1,85 @@
+# (c) 2015, A. Riva, DiBiG, ICBR Bioinformatics
+# University of Florida
+
+# A Director that runs the Execute methods of Lines in an asyncio event
+# loop. Requires Python 3.
+
+import asyncio
+
+from Director import Director
+from Actor import WaitPause
+
+async def waitAsync(actor, wanted, **kwargs):
+    """Awaitable version of Actor.wait(): sleeps with asyncio.sleep() between polls,
+so other coroutines can run."""
+    status = True
+    for w in actor._waitSteps(wanted, pauses=True, **kwargs):
+        if isinstance(w, WaitPause):
+            await asyncio.sleep(w.delay)
+        elif not w:
+            return w
+        elif w.code != 0:
+            status = False
+    return status
+
+async def performAsync(line, method):
+    """Call `method' on `line', awaiting it if it is a coroutine. Synchronous methods are
+called directly in the event loop thread, so they block other Lines while they run."""
+    m = getattr(line, method)
+    if asyncio.iscoroutinefunction(m):
+        return await m()
+    return m()
+
+class AsyncDirector(Director):
+    """A Director whose ExecuteAll() runs in an asyncio event loop. Lines can define
+Execute() as a coroutine (async def), and use `await self.actor.waitAsync(...)' instead of
+self.actor.wait(). Consecutive Lines whose `independent' attribute is True and whose
+Execute() is a coroutine run concurrently; all other Lines run in order, after the ones
+before them have completed, as with the standard Director (scoped Lines are executed
+with Director.scatter()). Everything runs in a single thread, so Lines can write to the
+report without interfering with each other. The inputs and outputs declared by Lines are
+not used (see Director.ExecuteDAG)."""
+
+    def ExecuteAll(self):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.ExecuteAllAsync())
+        finally:
+            loop.close()
+
+    async def ExecuteAllAsync(self):
+        running = []            # Tasks of the independent Lines currently executing
+        good = True
+        for l in self.steps:
+            concurrent = l.independent and not l.scope and asyncio.iscoroutinefunction(l.Execute)
+            if not concurrent and running:
+                good = await self.gatherLines(running)
+                running = []
+                if not good:
+                    return False
+            self.actor.log.log("Director: performing Execute on `{}'.", l.name)
+            if concurrent:
+                running.append((l, asyncio.ensure_future(performAsync(l, 'Execute'))))
+            elif not (self.perform(l, 'Execute') if l.scope else await performAsync(l, 'Execute')):
+                self.actor.log.log("Error in Execute: {}: {}".format(l.name, l.status))
+                return False
+            if l.key == self.stopAt:
+                self.actor.log.log("Stop requested at step {}.".format(l.key))
+                break
+        if running:
+            good = await self.gatherLines(running)
+        return good
+
+    async def gatherLines(self, running):
+        """Wait for the Lines in `running' (a list of (line, task) tuples) to complete.
+Returns False if any of them failed."""
+        results = await asyncio.gather(*[ t for (l, t) in running ], return_exceptions=True)
+        good = True
+        for ((l, t), r) in zip(running, results):
+            if isinstance(r, Exception):
+                self.actor.log.log("Error in Execute: {}: {}".format(l.name, r))
+                good = False
+            elif not r:
+                self.actor.log.log("Error in Execute: {}: {}".format(l.name, l.status))
+                good = False
+        return good
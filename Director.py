@@ -1,13 +1,24 @@
 # (c) 2015, A. Riva, DiBiG, ICBR Bioinformatics
 # University of Florida
 
+import os
 import sys
+import time
 import importlib
 from inspect import getmro
 
+import Pool
+import Actor
+
 PY3 = (sys.version_info.major == 3)
 CLASSID = "type" if PY3 else "classobj"
 
+def timedCall(fn):
+    """Call `fn' and return a tuple containing its result and the time it took."""
+    start = time.time()
+    result = fn()
+    return (result, time.time() - start)
+
 class Director():
     """This class coordinates the execution of the pipeline."""
 
@@ -16,6 +27,7 @@ class Director():
     steps = []                  # Actual step objects
     registry = {}
     stopAt = ""
+    verifyWorkers = 8           # Number of Verify methods run concurrently
 
     def __init__(self, actor, library="Library"):
         self.actor = actor
@@ -145,18 +157,154 @@ from `startkey' onwards will be set to not-dry."""
             if ACT.begin(timestamp=False):
                 ACT.initFiles()
                 self.RunScript()
-                ACT.cleanup()
+                if not ACT.complete:
+                    ACT.abort("pipeline stopped because of an error")
                 return True
         return False
 
+    def perform(self, l, method):
+        """Call `method' on Line `l'. Execute is replaced by scatter() for Lines that have a scope."""
+        if method == 'Execute' and l.scope:
+            return self.scatter(l)
+        return getattr(l, method)()
+
+    def scopeItems(self, scope):
+        """Returns the items of the actor's SampleCollection in `scope', or None if the scope is unknown."""
+        sc = getattr(self.actor, "sc", None)
+        if sc == None:
+            return []
+        if scope == "readset":
+            return [ rs for rs in sc.readsets if not rs.get('bad') ]
+        elif scope == "sample":
+            return sc.samples
+        elif scope == "condition":
+            return sc.conditions
+        elif scope == "contrast":
+            return sc.contrasts
+        return None
+
+    def scatter(self, l, wait=True):
+        """Execute scoped Line `l': submit a job for each item in its scope, with the command
+line returned by its ExecuteItem() method, and the `options' property of the Line. At most
+`concurrency' jobs (a property of the Line, or the scatterConcurrency configuration entry;
+0 means no limit) are run at the same time. Each job records its completion in the ledger.
+When all jobs have completed, returns the result of the Line's GatherItems() method.
+If `wait' is False, all jobs are submitted and the method returns immediately. Nothing is
+submitted if the Line is dry."""
+        if l.dry:
+            self.actor.log.log("Director: `{}' is dry, not submitting its jobs.", l.name)
+            return True
+        items = self.scopeItems(l.scope)
+        if items == None:
+            return l.error("Unknown scope `{}' in step `{}'.", l.scope, l.name)
+        limit = l.properties.get('concurrency')
+        if limit == None:
+            limit = self.actor.getConfInt("scatterConcurrency", default=0) if self.actor.Conf else 0
+        pending = []
+        for item in items:
+            cmd = l.ExecuteItem(item)
+            if cmd:
+                pending.append((item, cmd))
+        pending = self.criticalPathOrder(l, pending)
+        self.actor.log.log("Director: submitting {} jobs for `{}' ({} scope).", len(pending), l.name, l.scope)
+        if not wait:
+            for (item, cmd) in pending:
+                self.submitItem(l, item, cmd)
+            return True
+        # A single wait loop for all the jobs: new ones join it as the previous ones complete
+        group = Actor.WaitGroup()
+        inflight = {}           # waiter -> item
+        results = []
+        waiting = self.actor.waitIter(group)
+        try:
+            while pending or inflight:
+                while pending and (not limit or len(inflight) < limit):
+                    (item, cmd) = pending.pop(0)
+                    w = self.submitItem(l, item, cmd)
+                    inflight[w] = item
+                    group.add(w)
+                w = next(waiting)
+                if not w:
+                    return l.error("Step `{}' interrupted: {}", l.name, w)
+                results.append((inflight.pop(w), w.code))
+        finally:
+            waiting.close()
+        l.results = results
+        return l.GatherItems(results)
+
+    def submitItem(self, l, item, cmd):
+        """Submit the job running `cmd' for `item' in scoped Line `l', and return the waiter for its ledger record."""
+        key = "{}:{}".format(l.key, item['name'])
+        self.actor.submit(cmd, options=l.properties.get('options'), task=l.key, ledger=key, size=self.itemSize(item) or None)
+        return self.actor.ledgerWaiter(key)
+
+    def itemSize(self, item):
+        """Returns the total size of the fastq files of a readset, sample, or condition `item'."""
+        if 'left' in item:
+            size = 0
+            for f in [item['left'], item.get('right')]:
+                try:
+                    size += os.path.getsize(f) if f else 0
+                except OSError:
+                    pass
+            return size
+        elif 'readsets' in item:
+            return sum([ self.itemSize(rs) for rs in item['readsets'] ])
+        elif 'samples' in item:
+            sc = getattr(self.actor, "sc", None)
+            return sum([ self.itemSize(sc.findSample(s) or {}) for s in item['samples'] ]) if sc else 0
+        return 0
+
+    def estimateRuntime(self, l, item):
+        """Returns the expected runtime of the job for `item' in scoped Line `l', from the runtime history
+of the same item if available, or of the Line otherwise. Returns None if unknown."""
+        hist = self.actor.getHistory()
+        if not hist:
+            return None
+        rt = hist.predict("{}:{}".format(l.key, item['name']))
+        if rt != None:
+            return rt
+        return hist.predict(l.key)
+
+    def successors(self, l):
+        """Returns the scoped Lines that process the output of scoped Line `l' for the same items: those
+that read its outputs, if it declares them, or otherwise the next Line with the same scope."""
+        following = [ s for s in self.steps[self.steps.index(l)+1:] if s.scope == l.scope ]
+        if l.declaresIO():
+            return [ s for s in following if l.produces(s) ]
+        return following[:1]
+
+    def criticalPath(self, l, item, memo=None):
+        """Returns the expected runtime of the longest chain of jobs for `item' starting at Line `l'."""
+        if memo == None:
+            memo = {}
+        if l.key not in memo:
+            rest = [ self.criticalPath(s, item, memo) for s in self.successors(l) ]
+            memo[l.key] = (self.estimateRuntime(l, item) or 0) + max(rest + [0])
+        return memo[l.key]
+
+    def criticalPathOrder(self, l, pending):
+        """Sort the (item, command) tuples in `pending' so that the items with the longest remaining critical
+path are submitted first. Items with the same critical path (e.g. because no runtimes are known) are
+sorted by size, largest first."""
+        if len(pending) < 2:
+            return pending
+        paths = [ self.criticalPath(l, item) for (item, cmd) in pending ]
+        sizes = [ self.itemSize(item) for (item, cmd) in pending ]
+        if not any(paths) and not any(sizes):
+            return pending
+        order = sorted(range(len(pending)), key=lambda i: (-paths[i], -sizes[i], i))
+        self.actor.log.log("Director: submission order for `{}': {}", l.name,
+                           ", ".join([ "{} ({:.0f}s)".format(pending[i][0]['name'], paths[i]) for i in order ]))
+        return [ pending[i] for i in order ]
+
     def PerformAll(self, method, immediatestop=False):
         good = True
         doit = True
         for l in self.steps:
             if doit:
                 self.actor.log.log("Director: performing {} on `{}'.", method, l.name)
-                m = getattr(l, method)
-                f = m()
+                f = self.perform(l, method)
                 if not f:
                     self.actor.log.log("Error in {}: {}: {}".format(method, l.name, l.status))
                     if immediatestop:
@@ -169,14 +317,105 @@ from `startkey' onwards will be set to not-dry."""
         return good
 
     def VerifyAll(self):
-        return self.PerformAll('Verify')
+        """Call the Verify method of all steps concurrently, on a pool of verifyWorkers
+threads (from the configuration, default 8). Errors are reported in step order, followed
+by the time taken by each step."""
+        steps = []
+        for l in self.steps:
+            steps.append(l)
+            if l.key == self.stopAt:
+                break
+        workers = self.actor.getConfInt("verifyWorkers", default=self.verifyWorkers) if self.actor.Conf else self.verifyWorkers
+        self.actor.log.log("Director: performing Verify on {} steps.", len(steps))
+        start = time.time()
+        with Pool.ThreadPool(min(workers, len(steps))) as pool:
+            futures = [ pool.submit(timedCall, l.Verify) for l in steps ]
+        good = True
+        timings = []
+        for (l, fut) in zip(steps, futures):
+            try:
+                (f, elapsed) = fut.result()
+            except Exception as e:
+                (f, elapsed) = (l.error("{}", e), None)
+            if not f:
+                self.actor.log.log("Error in Verify: {}: {}".format(l.name, l.status))
+                good = False
+            timings.append((l, elapsed))
+        self.actor.log.log("Director: Verify completed in {:.2f}s.", time.time() - start)
+        for (l, elapsed) in timings:
+            self.actor.log.log("  {:>8}  {}", "error" if elapsed == None else "{:.2f}s".format(elapsed), l.name)
+        return good
 
     def PreExecuteAll(self):
         return self.PerformAll('PreExecute')
 
     def ExecuteAll(self):
+        """Call the Execute method of all steps. If some Lines declare their inputs and
+outputs, the steps are executed with ExecuteDAG() instead of one after the other."""
+        if [ l for l in self.steps if l.declaresIO() ]:
+            return self.ExecuteDAG()
         return self.PerformAll('Execute', immediatestop=True)
 
+    def ExecuteDAG(self):
+        """Execute all steps without waiting for the jobs of Lines that declare their inputs
+and outputs. The jobs submitted by each of these Lines are made to depend (with `after')
+on the jobs of the earlier Lines that produce its inputs, so independent branches of the
+pipeline run concurrently. Lines that do not declare their inputs and outputs act as
+barriers: they are executed only after the jobs of all the previous Lines have completed,
+and the jobs of all the following Lines depend on theirs. Only the jobs that have not
+terminated yet are added to the dependencies of a Line. Scoped Lines that declare their
+inputs and outputs submit all their jobs without waiting for them, so their GatherItems()
+method is not called. Before returning, waits for the jobs that no barrier waited for."""
+        doit = True
+        producers = []          # Lines that declare I/O since the last barrier
+        outstanding = []        # Jobs of these Lines
+        barrier = []            # Jobs of the last barrier
+        for l in self.steps:
+            if not doit:
+                break
+            if l.declaresIO():
+                deps = set(barrier)
+                for p in producers:
+                    if p.produces(l):
+                        deps.update(p.jobids)
+                l.after = self.actor.activeJobs(sorted(deps))
+            else:
+                if outstanding:
+                    self.actor.log.log("Director: waiting for {} jobs before `{}'.", len(outstanding), l.name)
+                    if not self.actor.wait(Actor.SchedulerWaiter(l.key, outstanding)):
+                        self.actor.log.log("Error in Execute: jobs failed before {}".format(l.name))
+                        return False
+                l.after = self.actor.activeJobs(barrier)
+                producers = []
+                outstanding = []
+            self.actor.log.log("Director: performing Execute on `{}'.", l.name)
+            self.actor.startCollecting(l.after)
+            try:
+                if l.scope:
+                    f = self.scatter(l, wait=not l.declaresIO())
+                else:
+                    f = l.Execute()
+            finally:
+                l.jobids = self.actor.stopCollecting()
+            if not f:
+                self.actor.log.log("Error in Execute: {}: {}".format(l.name, l.status))
+                return False
+            if l.declaresIO():
+                producers.append(l)
+                outstanding += l.jobids
+            else:
+                barrier = l.jobids or barrier
+            if l.key == self.stopAt:
+                self.actor.log.log("Stop requested at step {}.".format(l.key))
+                doit = False
+        # The jobs of the last Lines have no barrier after them: wait for them here
+        if outstanding:
+            self.actor.log.log("Director: waiting for {} jobs of the last steps.", len(outstanding))
+            if not self.actor.wait(Actor.SchedulerWaiter("pipeline", outstanding)):
+                self.actor.log.log("Error in Execute: jobs of the last steps failed")
+                return False
+        return True
+
     def PostExecuteAll(self):
         return self.PerformAll('PostExecute')
 
@@ -195,3 +434,4 @@ from `startkey' onwards will be set to not-dry."""
         if not self.ReportAll():
             return False
         self.actor.complete = True
+        return True
@@ -0,0 +1,770 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# Executors are the backends that Actor.submit() uses to run jobs.
+# SubmitExecutor passes them to the submit command (the original
+# behavior), LocalExecutor runs them on the local machine with a CPU and
+# memory budget, and DryExecutor only records them. HybridExecutor
+# runs the jobs that are expected to be short locally, and sends the
+# others to the cluster. PilotExecutor puts jobs in a queue directory
+# served by long-lived pilot jobs (see pilot.py).
+
+import os
+import re
+import time
+import threading
+import subprocess
+
+import Scheduler
+from Ledger import Ledger
+from pilot import TaskQueue
+
+# Globals
+
+pilotCmd = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pilot.py")
+
+# Utils
+
+class JobSpec():
+    """What to run, and how. The attributes correspond to the arguments of Actor.submit()."""
+    script = ""                 # Script and arguments (already wrapped, if needed)
+    after = None                # ID(s) of the jobs this one depends on
+    done = None                 # File to write the return code to
+    prefix = None
+    options = None              # Resource options for the submit command
+    otherargs = None
+    ledger = None               # (ledger file, task) if the job writes to a ledger
+    task = None                 # Task name, used to look up past runtimes
+    runtime = None              # Expected runtime in seconds, if known
+    size = None                 # Size of the job's input, if known
+
+    def __init__(self, script, after=None, done=None, prefix=None, options=None, otherargs=None, ledger=None, task=None, runtime=None, size=None):
+        self.script = script
+        self.after = after
+        self.done = done
+        self.prefix = prefix
+        self.options = options
+        self.otherargs = otherargs
+        self.ledger = ledger
+        self.task = task
+        self.runtime = runtime
+        self.size = size
+
+def splitJobids(after):
+    """Returns the list of job IDs in an `after' argument (separated by commas or colons)."""
+    if not after:
+        return []
+    return [ j for j in re.split("[,:]", after) if j ]
+
+def parseResources(options):
+    """Returns the number of CPUs and the memory in MB requested by a string of submit
+`options' (e.g. "--cpus-per-task=4 --mem=16G" or "nodes=1:ppn=4,mem=16gb"). Missing
+values are returned as None."""
+    cpus = None
+    mem = None
+    if options:
+        m = re.search("(?:cpus-per-task|ppn|ncpus|ntasks|-c)[= :]?(\\d+)", options)
+        if m:
+            cpus = int(m.group(1))
+        m = re.search("(?:^|[^a-z])mem[= :]?(\\d+(?:\\.\\d+)?)([kmgt]?)", options, re.IGNORECASE)
+        if m:
+            mult = {'k': 1.0/1024, 'm': 1, 'g': 1024, 't': 1048576, '': 1}
+            mem = int(float(m.group(1)) * mult[m.group(2).lower()])
+    return (cpus, mem)
+
+def parseWalltime(options):
+    """Returns the walltime in seconds requested by a string of submit `options' (e.g.
+"--time=2:00:00", "-t 120", "-l walltime=7200", or "-l h_rt=2:00:00"), or None. Plain
+numbers are minutes for time and -t (as in slurm), and seconds for walltime (as in PBS)
+and h_rt or s_rt (as in SGE)."""
+    if options:
+        m = re.search("(--time|(?:^|\\s)-t|walltime|h_rt|s_rt)[= ]?(\\d[\\d:-]*)", options)
+        if m:
+            value = m.group(2)
+            if ":" in value or "-" in value:
+                return Scheduler.parseDuration(value)
+            return float(value) * (60 if m.group(1).strip() in ["--time", "-t"] else 1)
+    return None
+
+def scaleMemory(options, factor):
+    """Returns `options' with the amount of memory requested multiplied by `factor' (the unit
+is preserved). Returns `options' unchanged if it does not request memory."""
+    if not options:
+        return options
+    m = re.search("((?:^|[^a-z])mem[= :]?)(\\d+(?:\\.\\d+)?)", options, re.IGNORECASE)
+    if not m:
+        return options
+    value = float(m.group(2)) * factor
+    value = str(int(value)) if value == int(value) else "{:.1f}".format(value)
+    return options[:m.start(2)] + value + options[m.end(2):]
+
+def cpuCount():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+def memTotal():
+    """Returns the total memory of this machine in MB."""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except (IOError, ValueError):
+        pass
+    return 0
+
+def writeDone(filename, code):
+    with open(filename, "w") as out:
+        out.write("{}\n".format(code))
+
+# Executors
+
+class Executor():
+    """Base class for executors."""
+    name = ""
+    arrays = False              # True if submitArray() is supported
+    limited = False             # True if jobs count towards Actor.maxJobs
+    aliases = {}                # Maps the IDs that jobs see to the ones returned by submit(), when they differ
+
+    def submit(self, spec):
+        """Run the job described by JobSpec `spec'. Returns its job ID."""
+        return None
+
+    def cancel(self, jobids):
+        """Cancel the jobs in `jobids'."""
+        return True
+
+    def query(self, jobids):
+        """Returns a dictionary mapping each job ID in `jobids' to a Scheduler.JobState,
+or None if this executor relies on the scheduler query command."""
+        return None
+
+    def usage(self, jobids):
+        """Returns a dictionary mapping the IDs in `jobids' of the jobs that this executor
+runs itself to Scheduler.JobUsage objects. The usage of the other jobs is obtained with
+the scheduler's accounting command."""
+        return {}
+
+    def limits(self, spec):
+        """Returns True if the job described by JobSpec `spec' counts towards Actor.maxJobs."""
+        return self.limited
+
+    def poll(self):
+        """Called at each wait cycle, to let the executor do its periodic work."""
+        pass
+
+    def resolve(self, jobid):
+        """Returns the ID under which the scheduler knows job `jobid'."""
+        return jobid
+
+    def close(self):
+        """Called when the Actor terminates."""
+        pass
+
+class SubmitExecutor(Executor):
+    """Passes jobs to the submit command. `execute' is the function used to run the command line
+(normally Actor.execute), and `cancelCmd' is the scheduler's cancel command."""
+    name = "submit"
+    arrays = True
+    limited = True
+    command = "submit"
+
+    def __init__(self, execute, command="submit", cancelCmd=None):
+        self.execute = execute
+        self.command = command
+        self.cancelCmd = cancelCmd
+
+    def cmdline(self, spec):
+        cmdline = self.command
+        if spec.otherargs:
+            cmdline += " " + spec.otherargs
+        if spec.after:
+            cmdline = cmdline + " -after " + spec.after
+        if spec.done:
+            cmdline = cmdline + " -done " + spec.done
+        if spec.options:
+            cmdline = cmdline + " -o " + spec.options
+        if spec.prefix != None:
+            cmdline = cmdline + " -p " + spec.prefix
+        return cmdline + " " + spec.script
+
+    def submit(self, spec):
+        return self.execute(self.cmdline(spec))
+
+    def cancel(self, jobids):
+        return Scheduler.cancelJobs(jobids, self.cancelCmd)
+
+class LocalJob():
+    jobid = ""
+    spec = None
+    cpus = 1
+    mem = 0
+    deps = []
+    state = Scheduler.ACTIVE
+    code = None
+    proc = None
+    started = None
+    finished = None
+    rusage = None               # Resources used by the process, from os.wait4()
+
+    def __init__(self, jobid, spec, cpus, mem):
+        self.jobid = jobid
+        self.spec = spec
+        self.cpus = cpus
+        self.mem = mem
+        self.deps = splitJobids(spec.after)
+
+class LocalExecutor(Executor):
+    """Runs jobs as local processes, as soon as the jobs they depend on (`after') have
+completed successfully and the CPUs and memory they request (parsed from `options')
+fit within the budget of `cpus' CPUs and `mem' MB. A job whose dependencies fail is
+not run, and gets return code 1; a cancelled job gets return code 143. In both cases the
+code is also written to the job's done file and ledger. The output of each job is written to jobid.out.
+Dependencies on jobs that were not submitted here are assumed to be satisfied, unless
+`depQuery' is a Scheduler.JobQuery, in which case their state is checked every
+`depInterval' seconds. If `onFinish' is specified, it is called with each LocalJob
+that ran to completion."""
+    name = "local"
+    cpus = 1
+    mem = 0
+    used = [0, 0]
+    depQuery = None
+    depInterval = 5
+    onFinish = None
+
+    def __init__(self, cpus=None, mem=None, log=None, depQuery=None, onFinish=None):
+        self.cpus = cpus or cpuCount()
+        self.mem = mem or memTotal()
+        self.log = log
+        self.depQuery = depQuery
+        self.onFinish = onFinish
+        self.used = [0, 0]
+        self.jobs = {}
+        self.queue = []
+        self.foreign = {}       # States of the dependencies that are not ours
+        self.counter = 0
+        self.cond = threading.Condition()
+        t = threading.Thread(target=self._dispatch)
+        t.daemon = True
+        t.start()
+
+    def submit(self, spec):
+        (cpus, mem) = parseResources(spec.options)
+        with self.cond:
+            self.counter += 1
+            jobid = "local{}".format(self.counter)
+            # A job cannot request more than the whole budget, or it would never start
+            job = LocalJob(jobid, spec, min(cpus or 1, self.cpus), min(mem or 0, self.mem))
+            self.jobs[jobid] = job
+            self.queue.append(job)
+            self.cond.notify_all()
+        return jobid
+
+    def _depsState(self, job):
+        """Returns ACTIVE if `job' has to wait for its dependencies, DONE if they all
+completed successfully, FAILED if any of them failed."""
+        for d in job.deps:
+            dep = self.jobs.get(d)
+            if dep == None:
+                if not self.depQuery:
+                    continue    # Not ours: assume it's done
+                dep = self.foreign.get(d)
+                if dep == None or dep.state == Scheduler.ACTIVE:
+                    return Scheduler.ACTIVE
+                if dep.returnCode() != 0:
+                    return Scheduler.FAILED
+            elif dep.state == Scheduler.ACTIVE:
+                return Scheduler.ACTIVE
+            elif dep.code != 0:
+                return Scheduler.FAILED
+        return Scheduler.DONE
+
+    def _foreignDeps(self):
+        return set([ d for job in self.queue for d in job.deps
+                     if d not in self.jobs and (d not in self.foreign or self.foreign[d].state == Scheduler.ACTIVE) ])
+
+    def _dispatch(self):
+        pending = set()
+        while True:
+            if pending:
+                # Query the scheduler outside the lock, it may take a while
+                states = self.depQuery.query(list(pending)) or {}
+                with self.cond:
+                    for (j, st) in states.items():
+                        self.foreign[j] = st
+            with self.cond:
+                for job in list(self.queue):
+                    ds = self._depsState(job)
+                    if ds == Scheduler.FAILED:
+                        self.queue.remove(job)
+                        self._finish(job, 1, record=True)
+                    elif ds == Scheduler.DONE and self.used[0] + job.cpus <= self.cpus and self.used[1] + job.mem <= self.mem:
+                        self.queue.remove(job)
+                        self._start(job)
+                pending = self._foreignDeps() if self.depQuery else set()
+                if pending:
+                    self.cond.wait(self.depInterval)
+                else:
+                    self.cond.wait()
+
+    def _command(self, script):
+        """Returns the words of `script', run the way the submit command would: from the current directory, through bash if it is not executable."""
+        cmd = script.split(" ")
+        if os.path.isfile(cmd[0]):
+            cmd[0] = os.path.abspath(cmd[0])
+            if not os.access(cmd[0], os.X_OK):
+                cmd = ["bash"] + cmd
+        return cmd
+
+    def _start(self, job):
+        self.used[0] += job.cpus
+        self.used[1] += job.mem
+        job.started = time.time()
+        env = dict(os.environ)
+        env["DAMON_JOB_ID"] = job.jobid
+        if self.log:
+            self.log("Starting local job {}: {}".format(job.jobid, job.spec.script))
+        try:
+            out = open(job.jobid + ".out", "w")
+            job.proc = subprocess.Popen(self._command(job.spec.script), stdout=out, stderr=subprocess.STDOUT, env=env)
+            out.close()
+        except (IOError, OSError) as e:
+            if self.log:
+                self.log("Error starting local job {}: {}".format(job.jobid, e))
+            self._release(job)
+            self._finish(job, 127, record=True)
+            return
+        t = threading.Thread(target=self._watch, args=(job,))
+        t.daemon = True
+        t.start()
+
+    def _watch(self, job):
+        try:
+            (pid, status, job.rusage) = os.wait4(job.proc.pid, 0)
+            code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            job.proc.returncode = code
+        except OSError:         # Already reaped
+            code = job.proc.wait()
+        if code < 0:
+            code = 128 - code
+        with self.cond:
+            self._release(job)
+            completed = job.state == Scheduler.ACTIVE
+            if completed:
+                self._finish(job, code)
+            self.cond.notify_all()
+        # Outside the lock, since it may take a while (e.g. writing to the history)
+        if completed and self.onFinish:
+            self.onFinish(job)
+
+    def _release(self, job):
+        self.used[0] -= job.cpus
+        self.used[1] -= job.mem
+
+    def _finish(self, job, code, state=None, record=False):
+        """Set the outcome of `job'. If `record' is True the job did not run to completion,
+so its ledger record (normally appended by jobwrap.py) is written here."""
+        job.code = code
+        job.finished = time.time()
+        job.state = state or (Scheduler.DONE if code == 0 else Scheduler.FAILED)
+        if job.spec.done:
+            writeDone(job.spec.done, code)
+        if record and job.spec.ledger:
+            Ledger(job.spec.ledger[0]).append(job.jobid, job.spec.ledger[1], code)
+        self.cond.notify_all()
+
+    def cancel(self, jobids):
+        with self.cond:
+            for j in jobids:
+                job = self.jobs.get(j)
+                if job == None or job.state != Scheduler.ACTIVE:
+                    continue
+                if job in self.queue:
+                    self.queue.remove(job)
+                elif job.proc:
+                    job.proc.terminate()
+                self._finish(job, 143, record=True)
+        return True
+
+    def query(self, jobids):
+        result = {}
+        with self.cond:
+            for j in jobids:
+                job = self.jobs.get(j)
+                if job:
+                    result[j] = Scheduler.JobState(j, job.state, job.code, running=job.proc != None and job.state == Scheduler.ACTIVE)
+                else:
+                    result[j] = Scheduler.JobState(j, Scheduler.DONE)
+        return result
+
+    def usage(self, jobids):
+        result = {}
+        with self.cond:
+            for j in jobids:
+                job = self.jobs.get(j)
+                if not job:
+                    continue
+                u = Scheduler.JobUsage(j)
+                if job.started and job.finished:
+                    u.walltime = job.finished - job.started
+                if job.rusage:
+                    u.cputime = job.rusage.ru_utime + job.rusage.ru_stime
+                    u.maxrss = job.rusage.ru_maxrss / 1024.0      # KB on Linux
+                result[j] = u
+        return result
+
+    def running(self):
+        """Returns the number of jobs that are queued or running."""
+        with self.cond:
+            return len([ j for j in self.jobs.values() if j.state == Scheduler.ACTIVE ])
+
+class DryExecutor(Executor):
+    """Does not run anything: records the jobs in `recorded' (and in the log, if any), and
+pretends they completed successfully, writing 0 to their done files and ledger."""
+    name = "dry"
+
+    def __init__(self, log=None):
+        self.log = log
+        self.recorded = []
+        self.formatter = SubmitExecutor(None)
+
+    def submit(self, spec):
+        jobid = "dry{}".format(len(self.recorded) + 1)
+        self.recorded.append((jobid, spec))
+        if self.log:
+            self.log("Dry run, job {}: {}".format(jobid, self.formatter.cmdline(spec)))
+        if spec.done:
+            writeDone(spec.done, 0)
+        if spec.ledger:
+            Ledger(spec.ledger[0]).append(jobid, spec.ledger[1], 0)
+        return jobid
+
+    def query(self, jobids):
+        return dict([ (j, Scheduler.JobState(j, Scheduler.DONE, 0)) for j in jobids ])
+
+    def usage(self, jobids):
+        return dict([ (j, Scheduler.JobUsage(j)) for j in jobids ])
+
+class HybridExecutor(Executor):
+    """Runs the jobs whose predicted runtime is at most `threshold' seconds with the
+LocalExecutor `local', and all other jobs (including those whose runtime cannot be
+predicted) with the executor `cluster'. `predict' is a function that receives a JobSpec
+and returns its expected runtime in seconds, or None. Cluster jobs cannot depend on
+local jobs through the scheduler, so a cluster job that depends on local jobs is given
+a placeholder ID (hybridN) and submitted by a background thread once they are done (or
+failed without running, if any of them failed); `jobquery' is used to check the state of
+the cluster jobs. Local jobs that depend on cluster jobs are held by the local executor
+until they are reported as completed (the local executor should use an ExecutorQuery on
+this executor as its `depQuery')."""
+    name = "hybrid"
+    arrays = False
+    limited = True
+    threshold = 60
+
+    def __init__(self, cluster, local, predict, threshold=60, log=None, jobquery=None):
+        self.cluster = cluster
+        self.local = local
+        self.predict = predict
+        self.threshold = threshold
+        self.log = log
+        self.jobquery = jobquery or Scheduler.JobQuery()
+        self.counter = 0
+        self.deferred = {}      # placeholder -> JobSpec of the jobs waiting to be submitted
+        self.resolved = {}      # placeholder -> ID of the submitted job
+        self.aliases = {}       # ID of the submitted job -> placeholder
+        self.failed = {}        # placeholder -> return code of the jobs that were never submitted
+        t = threading.Thread(target=self._submitDeferred)
+        t.daemon = True
+        t.start()
+
+    def isLocal(self, jobid):
+        return self.resolve(jobid) in self.local.jobs
+
+    def resolve(self, jobid):
+        return self.resolved.get(jobid, jobid)
+
+    def limits(self, spec):
+        """Only the jobs that go to the cluster executor count towards Actor.maxJobs."""
+        runtime = self.predict(spec)
+        return runtime == None or runtime > self.threshold
+
+    def submit(self, spec):
+        runtime = self.predict(spec)
+        if runtime != None and runtime <= self.threshold:
+            if self.log:
+                self.log("Running {} locally (expected runtime: {:.1f}s)".format(spec.task or spec.script, runtime))
+            return self.local.submit(spec)
+        with self.local.cond:
+            deps = self._clusterDeps(spec.after)
+            if deps == None or deps[0]:
+                # Submitted by _submitDeferred() when the local jobs it depends on are done
+                self.counter += 1
+                jobid = "hybrid{}".format(self.counter)
+                self.deferred[jobid] = spec
+                self.local.cond.notify_all()
+                return jobid
+        spec.after = ",".join(deps[1]) or None
+        return self.cluster.submit(spec)
+
+    def _clusterDeps(self, after):
+        """Returns None if some of the jobs in `after' are local jobs (or deferred cluster jobs)
+that have not terminated yet. Otherwise, returns a tuple (failed, deps), where `failed' is
+True if any of the local jobs failed, and `deps' is the list of the IDs of the cluster
+jobs. Called with the lock of the local executor held."""
+        failed = False
+        deps = []
+        for d in splitJobids(after):
+            if d in self.deferred:
+                return None
+            if d in self.failed:
+                failed = True
+                continue
+            d = self.resolve(d)
+            job = self.local.jobs.get(d)
+            if job == None:
+                deps.append(d)
+            elif job.state == Scheduler.ACTIVE:
+                return None
+            elif job.code != 0:
+                failed = True
+        return (failed, deps)
+
+    def _submitDeferred(self):
+        while True:
+            with self.local.cond:
+                ready = None
+                while ready == None:
+                    for (jobid, spec) in sorted(self.deferred.items()):
+                        deps = self._clusterDeps(spec.after)
+                        if deps != None:
+                            ready = (jobid, spec, deps)
+                            break
+                    else:
+                        self.local.cond.wait()
+            (jobid, spec, (failed, deps)) = ready
+            if failed:
+                self._abandon(jobid, 1)
+                continue
+            # Submit outside the lock, the submit command may take a while
+            spec.after = ",".join(deps) or None
+            try:
+                realid = self.cluster.submit(spec)
+            except Exception as e:
+                if self.log:
+                    self.log("Error submitting {}: {}".format(jobid, e))
+                self._abandon(jobid, 1)
+                continue
+            with self.local.cond:
+                cancelled = jobid not in self.deferred
+                self.deferred.pop(jobid, None)
+                self.resolved[jobid] = realid
+                self.aliases[realid] = jobid
+                self.local.cond.notify_all()
+            if self.log:
+                self.log("Submitted {} as {}".format(jobid, realid))
+            if cancelled:
+                self.cluster.cancel([realid])
+
+    def _abandon(self, jobid, code):
+        """Deferred job `jobid' will not be submitted: record return code `code' in its done file and ledger."""
+        with self.local.cond:
+            spec = self.deferred.pop(jobid, None)
+            if spec == None:
+                return
+            self.failed[jobid] = code
+            self.local.cond.notify_all()
+        if spec.done:
+            writeDone(spec.done, code)
+        if spec.ledger:
+            Ledger(spec.ledger[0]).append(jobid, spec.ledger[1], code)
+
+    def cancel(self, jobids):
+        for j in [ j for j in jobids if j in self.deferred ]:
+            self._abandon(j, 143)
+        jobids = [ self.resolve(j) for j in jobids if j not in self.failed ]
+        self.local.cancel([ j for j in jobids if self.isLocal(j) ])
+        remote = [ j for j in jobids if not self.isLocal(j) ]
+        if remote:
+            return self.cluster.cancel(remote)
+        return True
+
+    def query(self, jobids):
+        result = {}
+        real = {}
+        with self.local.cond:
+            for j in jobids:
+                if j in self.deferred:
+                    result[j] = Scheduler.JobState(j, Scheduler.ACTIVE)
+                elif j in self.failed:
+                    result[j] = Scheduler.JobState(j, Scheduler.FAILED, self.failed[j])
+                else:
+                    real[j] = self.resolve(j)
+        states = self.local.query([ r for r in real.values() if self.isLocal(r) ])
+        remote = [ r for r in real.values() if not self.isLocal(r) ]
+        if remote:
+            rstates = self.jobquery.query(remote)
+            if rstates == None:
+                return None     # Let the JobIndex keep the states it already knows
+            states.update(rstates)
+        for (j, r) in real.items():
+            st = states[r]
+            result[j] = Scheduler.JobState(j, st.state, st.code, running=st.running)
+        return result
+
+    def usage(self, jobids):
+        result = {}
+        for j in jobids:
+            if self.isLocal(j):
+                for u in self.local.usage([self.resolve(j)]).values():
+                    u.jobid = j
+                    result[j] = u
+        return result
+
+class PilotExecutor(Executor):
+    """Writes jobs to the queue directory `queuedir', from which they are taken by `pilots'
+pilot jobs, each running up to `parallel' jobs at a time. Pilots are started by the
+executor `backend' (a SubmitExecutor to run them on the cluster, or a LocalExecutor) with
+the resource `options' given, as soon as the first job is submitted, and whenever fewer
+than `pilots' of them are alive while jobs are waiting (checked at each wait cycle). They exit when the executor is
+closed and the queue is empty, or after `idle' seconds without work. The jobs being run
+by a pilot that stops updating its heartbeat for `timeout' seconds are put back in the
+queue."""
+    name = "pilot"
+    pilots = 4
+    parallel = 1
+    idle = 300
+    timeout = 600
+
+    def __init__(self, backend, queuedir=".pilots", pilots=4, parallel=1, options=None, idle=300, timeout=600, log=None):
+        self.backend = backend
+        self.queue = TaskQueue(queuedir)
+        self.queue.stop(False)
+        self.pilots = pilots
+        self.parallel = parallel
+        self.options = options
+        self.idle = idle
+        self.timeout = timeout
+        self.log = log
+        self.stamp = int(time.time())
+        self.counter = 0
+        self.launched = []      # Names of the pilots started by this executor
+        self.seen = set()       # Pilots that registered at least once
+        self.lock = threading.Lock()
+
+    def submit(self, spec):
+        with self.lock:
+            self.counter += 1
+            jobid = "p{}.{:06d}".format(self.stamp, self.counter)
+        self.queue.put(jobid, spec.script, done=spec.done and os.path.abspath(spec.done), after=spec.after)
+        self.checkPilots()
+        return jobid
+
+    def checkPilots(self):
+        """Put back in the queue the jobs of dead pilots, and start new pilots if needed."""
+        with self.lock:
+            registered = self.queue.pilots()
+            alive = 0
+            for name in self.launched:
+                if name in registered:
+                    (age, jobids) = registered[name]
+                    self.seen.add(name)
+                    if age < self.timeout:
+                        alive += 1
+                    else:
+                        if self.log:
+                            self.log("Pilot {} lost, requeueing {} jobs".format(name, len(jobids)))
+                        for j in jobids:
+                            self.queue.requeue(j)
+                        self.queue.unregister(name)
+                elif name not in self.seen:
+                    alive += 1  # Not started yet
+            waiting = len(self.queue.waiting())
+            while alive < self.pilots and waiting > alive * self.parallel:
+                self._launch()
+                alive += 1
+
+    def _launch(self):
+        name = "pilot{}.{}".format(self.stamp, len(self.launched) + 1)
+        cmd = "{} -queue {} -name {} -parallel {} -idle {}".format(pilotCmd, self.queue.path, name, self.parallel, self.idle)
+        self.backend.submit(JobSpec(cmd, options=self.options))
+        self.launched.append(name)
+        if self.log:
+            self.log("Started pilot {}".format(name))
+
+    def cancel(self, jobids):
+        for j in jobids:
+            self.queue.cancel(j)
+        return True
+
+    def poll(self):
+        self.checkPilots()
+
+    def query(self, jobids):
+        result = {}
+        for j in jobids:
+            # Check pending first: pilots write the result before leaving running/, so a
+            # task that is no longer pending always has its result by now.
+            if self.queue.isPending(j):
+                result[j] = Scheduler.JobState(j, Scheduler.ACTIVE, running=self.queue.isRunning(j))
+                continue
+            code = self.queue.result(j)
+            if code != None:
+                result[j] = Scheduler.JobState(j, Scheduler.DONE if code == 0 else Scheduler.FAILED, code)
+            else:
+                result[j] = Scheduler.JobState(j, Scheduler.UNKNOWN)
+        return result
+
+    def usage(self, jobids):
+        # Tasks are not scheduler jobs, and pilots do not measure them
+        return dict([ (j, Scheduler.JobUsage(j)) for j in jobids ])
+
+    def close(self):
+        self.queue.stop()
+
+# Query adapter, to use an executor's job states in a SchedulerWaiter
+
+class ExecutorQuery(Scheduler.JobQuery):
+    """A JobQuery that asks `executor' for the state of its jobs."""
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def query(self, jobids):
+        return self.executor.query(jobids)
+
+def makeExecutor(name, execute=None, command="submit", cancelCmd=None, cpus=None, mem=None, log=None,
+                 predict=None, threshold=60, queryCmd=None, queryGrace=None, pilot={}):
+    """Returns the executor called `name' (submit, local, hybrid, pilot, or dry). For hybrid,
+`cpus' and `mem' are the budget of the local executor, `predict' and `threshold' are
+as in HybridExecutor, and `queryCmd' is used to check the state of cluster jobs (see
+Scheduler.JobQuery for `queryGrace'). For
+pilot, `pilot' is a dictionary of arguments for PilotExecutor; its `backend' entry
+can be submit (the default) or local."""
+    if name == "local":
+        return LocalExecutor(cpus=cpus, mem=mem, log=log)
+    elif name == "hybrid":
+        cluster = SubmitExecutor(execute, command=command, cancelCmd=cancelCmd)
+        local = LocalExecutor(cpus=cpus, mem=mem, log=log)
+        hybrid = HybridExecutor(cluster, local, predict or (lambda spec: spec.runtime), threshold=threshold, log=log,
+                                jobquery=Scheduler.JobQuery(queryCmd, grace=queryGrace))
+        local.depQuery = ExecutorQuery(hybrid)
+        return hybrid
+    elif name == "pilot":
+        args = dict(pilot)
+        if args.pop("backend", "submit") == "local":
+            backend = LocalExecutor(cpus=cpus, mem=mem, log=log)
+        else:
+            backend = SubmitExecutor(execute, command=command, cancelCmd=cancelCmd)
+        return PilotExecutor(backend, log=log, **args)
+    elif name == "dry":
+        return DryExecutor(log=log)
+    else:
+        return SubmitExecutor(execute, command=command, cancelCmd=cancelCmd)
@@ -0,0 +1,107 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# A local database of the runtimes and memory usage of past jobs, used
+# to predict how long a task will take and how much memory it needs. Each
+# run can record the size of its input, so that predictions can be scaled
+# to the size of a new input. It is stored in an sqlite3 file that persists
+# across runs (by default, ~/.damon-history.db).
+
+import os
+import time
+import sqlite3
+
+# Globals
+
+historyFile = "~/.damon-history.db"
+
+schema = """CREATE TABLE IF NOT EXISTS runs (
+  task TEXT,
+  runtime REAL,
+  size REAL,
+  mem REAL,
+  code INTEGER,
+  timestamp REAL)"""
+
+def quantile(values, q):
+    """Returns the `q' quantile (0 <= q <= 1) of the list `values', by linear interpolation."""
+    values = sorted(values)
+    if not values:
+        return None
+    pos = q * (len(values) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+class History():
+    """Runtime history. Each operation opens its own connection, so a History object can
+be used from multiple threads."""
+    filename = ""
+    limit = 100                 # Number of recent runs used for predictions
+    minimum = 3                 # Minimum number of runs needed to make a prediction
+
+    def __init__(self, filename=None):
+        self.filename = os.path.expanduser(filename or historyFile)
+        conn = self._connect()
+        try:
+            conn.execute(schema)
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_task ON runs (task)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.filename, timeout=30)
+
+    def record(self, task, runtime, size=None, mem=None, code=0):
+        """Record a run of `task' that took `runtime' seconds."""
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)", (task, runtime, size, mem, code, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _values(self, column, task):
+        """Returns (value, size) for the most recent successful runs of `task' that recorded `column'."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT {0}, size FROM runs WHERE task = ? AND code = 0 AND {0} IS NOT NULL ORDER BY timestamp DESC LIMIT ?".format(column),
+                                (task, self.limit)).fetchall()
+        finally:
+            conn.close()
+        return rows
+
+    def runtimes(self, task):
+        """Returns the runtimes of the most recent successful runs of `task'."""
+        return [ r[0] for r in self._values("runtime", task) ]
+
+    def memory(self, task):
+        """Returns the memory (in MB) used by the most recent successful runs of `task'."""
+        return [ r[0] for r in self._values("mem", task) ]
+
+    def _predict(self, column, task, q, size):
+        rows = self._values(column, task)
+        if size:
+            # Scale each value linearly from the size of its input to `size'
+            scaled = [ v * size / s for (v, s) in rows if s ]
+            if len(scaled) >= self.minimum:
+                return quantile(scaled, q)
+        if len(rows) < self.minimum:
+            return None
+        return quantile([ r[0] for r in rows ], q)
+
+    def predict(self, task, q=0.9, size=None):
+        """Returns the `q' quantile of the recent runtimes of `task', or None if there are
+not enough of them. If `size' is specified and enough runs recorded the size of their
+input, their runtimes are first scaled to an input of `size'."""
+        return self._predict("runtime", task, q, size)
+
+    def predictMemory(self, task, q=0.9, size=None):
+        """Like predict(), for the memory used by `task' in MB."""
+        return self._predict("mem", task, q, size)
@@ -0,0 +1,136 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# A completion ledger is a single append-only file to which each job
+# adds one line when it terminates, instead of creating its own
+# sentinel file. Each line contains four tab-delimited fields, plus
+# an optional fifth one with the runtime of the job in seconds:
+#
+#   jobid  task  returncode  timestamp  [elapsed]
+#
+# The controller reads the ledger incrementally, starting from the
+# offset it reached the previous time, so each line is read only once.
+
+import os
+import time
+import fcntl
+import fnmatch
+
+class LedgerRecord():
+    jobid = ""
+    task = ""
+    code = 0
+    timestamp = 0
+    elapsed = None
+
+    def __init__(self, jobid, task, code, timestamp, elapsed=None):
+        self.jobid = jobid
+        self.task = task
+        self.code = code
+        self.timestamp = timestamp
+        self.elapsed = elapsed
+
+def parseRecord(line):
+    fields = line.rstrip("\r\n").split("\t")
+    if len(fields) < 4:
+        return None
+    try:
+        elapsed = float(fields[4]) if len(fields) > 4 else None
+        return LedgerRecord(fields[0], fields[1], int(fields[2]), float(fields[3]), elapsed)
+    except ValueError:
+        return None
+
+class Ledger():
+    filename = ""
+    offset = 0                  # Number of bytes already read
+    records = []                # All records read so far, in order
+    consumed = set()            # Records that were deleted by a waiter
+    aliases = {}                # Job IDs written by jobs -> IDs they are known by (see Executors.HybridExecutor)
+
+    def __init__(self, filename, aliases=None):
+        self.filename = filename
+        self.offset = 0
+        self.records = []
+        self.consumed = set()
+        self.aliases = aliases if aliases != None else {}
+
+    def parse(self, line):
+        """Parse `line' into a LedgerRecord (or None), translating its job ID through the aliases."""
+        rec = parseRecord(line)
+        if rec:
+            rec.jobid = self.aliases.get(rec.jobid, rec.jobid)
+        return rec
+
+    def append(self, jobid, task, code, timestamp=None, elapsed=None):
+        """Add a record to the ledger. The file is locked with fcntl while the line is written:
+O_APPEND alone does not keep the records of concurrent jobs from overwriting each other
+on NFS, where the client computes the offset of the end of the file itself."""
+        if timestamp == None:
+            timestamp = time.time()
+        line = "{}\t{}\t{}\t{:.3f}".format(jobid, task, code, timestamp)
+        if elapsed != None:
+            line += "\t{:.3f}".format(elapsed)
+        line += "\n"
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)        # Also releases the lock
+
+    def skipExisting(self):
+        """Ignore the records already in the ledger (e.g. left over from a previous run)."""
+        if os.path.isfile(self.filename):
+            self.offset = os.path.getsize(self.filename)
+
+    def update(self):
+        """Read the records added since the last call, and return them as a list.
+Incomplete lines at the end of the file are left for the next call."""
+        new = []
+        try:
+            if os.path.getsize(self.filename) <= self.offset:
+                return new
+            with open(self.filename, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except (IOError, OSError):
+            return new
+        end = data.rfind(b"\n")
+        if end < 0:
+            return new
+        self.offset += end + 1
+        for line in data[:end].decode().split("\n"):
+            rec = self.parse(line)
+            if rec:
+                new.append(rec)
+        self.records += new
+        return new
+
+    def scan(self, jobid=None):
+        """Returns all the records in the ledger file (only those of job `jobid', if specified),
+including those that update() has not read yet."""
+        try:
+            with open(self.filename, "r") as f:
+                lines = f.read().split("\n")[:-1]      # The last line may be incomplete
+        except (IOError, OSError):
+            return []
+        return [ r for r in [ self.parse(line) for line in lines ] if r and (jobid == None or r.jobid == jobid) ]
+
+    def query(self, pattern):
+        """Returns the records whose task matches `pattern' (a glob-style pattern)."""
+        return [ r for r in self.records if r not in self.consumed and fnmatch.fnmatchcase(r.task, pattern) ]
+
+    def count(self, pattern):
+        return len(self.query(pattern))
+
+    def maxCode(self, pattern):
+        return max([ r.code for r in self.query(pattern) ] + [0])
+
+    def consume(self, records):
+        """Mark `records' as consumed: they will not be returned by query() anymore."""
+        self.consumed.update(records)
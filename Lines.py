@@ -2,6 +2,7 @@
 # University of Florida
 
 import os
+import fnmatch
 import inspect
 
 class Line():
@@ -17,6 +18,13 @@ Its methods all do nothing and return True."""
     waiters = []
     properties = {}
     tempfiles = []
+    inputs = None               # Patterns of the files this Line reads (see Director.ExecuteAll)
+    outputs = None              # Patterns of the files this Line writes
+    after = []                  # IDs of the jobs this Line's jobs depend on, set by the Director
+    jobids = []                 # IDs of the jobs submitted by Execute()
+    independent = False         # If True, an AsyncDirector may execute this Line concurrently with others
+    scope = None                # readset, sample, condition, or contrast: see ExecuteItem()
+    results = []                # (item, return code) for each item of a scoped Line
 
     def __init__(self, act, key="", properties={}):
         self.actor = act
@@ -24,9 +32,20 @@ Its methods all do nothing and return True."""
         self.status = ""
         self.waiters = []
         self.tempfiles = []
+        self.after = []
+        self.jobids = []
+        self.results = []
         self.properties = properties
         if 'dry' in properties:
             self.dry = properties['dry']
+        if 'inputs' in properties:
+            self.inputs = properties['inputs']
+        if 'outputs' in properties:
+            self.outputs = properties['outputs']
+        if 'independent' in properties:
+            self.independent = properties['independent']
+        if 'scope' in properties:
+            self.scope = properties['scope']
         self.Setup()
 
     def tempfile(self, filename):
@@ -40,6 +59,20 @@ Its methods all do nothing and return True."""
             except:
                 pass
 
+    def declaresIO(self):
+        """Returns True if this Line declares its inputs and outputs."""
+        return self.inputs != None or self.outputs != None
+
+    def produces(self, line):
+        """Returns True if one of the outputs of this Line matches one of the inputs of `line'.
+Inputs and outputs are glob-style patterns, and two patterns match if either of them
+matches the other."""
+        for o in self.outputs or []:
+            for i in line.inputs or []:
+                if fnmatch.fnmatchcase(o, i) or fnmatch.fnmatchcase(i, o):
+                    return True
+        return False
+
     def error(self, message, *args):
         msg = message.format(*args)
         self.status = msg
@@ -74,6 +107,21 @@ operations (e.g., letting subsequent Lines know that this one will be executed).
 flag (if true, do everything except actually running the actions)."""
         return True
 
+    def ExecuteItem(self, item):
+        """If this Line has a `scope', the Director calls this method instead of Execute() for
+each item of the SampleCollection in that scope (a readset, sample, condition, or contrast
+dictionary). It should return the command line of the job that processes `item', or None
+if there is nothing to do for it. The Director submits the jobs and waits for them."""
+        return None
+
+    def GatherItems(self, results):
+        """Called by the Director when all the jobs of a scoped Line have completed. `results'
+is a list of (item, return code) tuples."""
+        failed = [ item['name'] for (item, code) in results if code != 0 ]
+        if failed:
+            return self.error("Step `{}' failed for: {}", self.name, ", ".join(failed))
+        return True
+
     def PostExecute(self):
         """The PostExecute method should take care of cleanup, checking for job completion, etc. 
 All PostExecute methods are called in order after the pipeline has finished executing."""
@@ -0,0 +1,224 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# Notification backends for Actor.wait(). A notifier is told which
+# directories the waiters are looking at, and its sleep() method
+# returns as soon as something happens in one of them (or when the
+# timeout expires). The PollNotifier simply sleeps, reproducing the
+# original behavior of wait(); the InotifyNotifier uses the Linux
+# inotify interface to wake up when a file is written in a watched
+# directory.
+
+import os
+import sys
+import time
+import errno
+import random
+import select
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+# Globals
+
+safetyInterval = 60             # Minimum seconds between checks when relying on events
+
+# Filesystems that do not deliver inotify events for changes made by
+# other hosts. Directories on these filesystems are always polled.
+remoteFilesystems = ["nfs", "nfs4", "lustre", "gpfs", "cifs", "smb3", "smbfs",
+                     "beegfs", "panfs", "ceph", "glusterfs", "afs", "9p"]
+
+# Constants from <sys/inotify.h>
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+
+# Utils
+
+def hasMagic(path):
+    """Returns True if `path' contains glob wildcards."""
+    return any(c in path for c in "*?[")
+
+def filesystemType(path):
+    """Returns the type of the filesystem containing `path' (e.g. 'ext4', 'nfs'),
+according to /proc/mounts. Returns None if it cannot be determined."""
+    path = os.path.realpath(path)
+    best = ""
+    fstype = None
+    try:
+        with open("/proc/mounts", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mnt = parts[1].replace("\\040", " ")
+                if path == mnt or path.startswith(mnt.rstrip("/") + "/"):
+                    if len(mnt) > len(best):
+                        best = mnt
+                        fstype = parts[2]
+    except IOError:
+        return None
+    return fstype
+
+def isRemote(path):
+    """Returns True if `path' is on a filesystem that does not deliver events for remote writes."""
+    fstype = filesystemType(path)
+    if fstype == None:
+        return True
+    return fstype in remoteFilesystems or fstype.startswith("fuse")
+
+def loadLibc():
+    if ctypes == None or not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+# Poll policy
+
+class PollPolicy():
+    """Determines how long wait() sleeps between checks. The first delay is `initial'
+seconds; each following one is multiplied by `factor', up to `maximum'. Each delay is
+randomly perturbed by up to +/- `jitter' (a fraction), so that concurrent runs do not
+hit the filesystem in lockstep. PollPolicy(5, 5, 1, 0) reproduces the original fixed
+5-second polling."""
+    initial = 1.0
+    maximum = 60.0
+    factor = 1.5
+    jitter = 0.1
+    current = 1.0
+
+    def __init__(self, initial=1.0, maximum=60.0, factor=1.5, jitter=0.1):
+        self.initial = initial
+        self.maximum = max(initial, maximum)
+        self.factor = max(1.0, factor)
+        self.jitter = min(max(0.0, jitter), 1.0)
+        self.reset()
+
+    def reset(self):
+        self.current = self.initial
+
+    def next(self):
+        """Returns the next delay, in seconds."""
+        delay = self.current
+        self.current = min(self.current * self.factor, self.maximum)
+        if self.jitter:
+            delay = delay * (1.0 + random.uniform(-self.jitter, self.jitter))
+        return delay
+
+# Notifiers
+
+class PollNotifier():
+    """A notifier that never receives events: sleep() always waits for the full interval."""
+    name = "poll"
+
+    def watch(self, dirs):
+        """Start watching directories `dirs'. Returns True if all of them can deliver events."""
+        return False
+
+    def sleep(self, interval, limit=None):
+        """Wait for `interval' seconds, or less if an event is received. A notifier that
+relies on events may sleep longer than `interval', but never longer than `limit'.
+Returns True if woken up by an event."""
+        time.sleep(interval)
+        return False
+
+    def close(self):
+        pass
+
+class InotifyNotifier(PollNotifier):
+    """A notifier based on Linux inotify. Directories that cannot be watched (because they
+don't exist yet, contain wildcards, or live on a network filesystem) cause sleep() to fall
+back to the regular polling interval. A directory of None stands for a waiter that
+cannot be watched at all."""
+    name = "inotify"
+    libc = None
+    fd = -1
+    watched = {}                # dir -> watch descriptor
+    unwatched = []              # dirs we have to poll
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO
+
+    def __init__(self, libc, trustRemote=False):
+        self.libc = libc
+        self.watched = {}
+        self.unwatched = []
+        self.trustRemote = trustRemote
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def watch(self, dirs):
+        for d in dirs:
+            if d in self.watched or d in self.unwatched:
+                continue
+            if d == None or hasMagic(d) or not os.path.isdir(d) or (isRemote(d) and not self.trustRemote):
+                self.unwatched.append(d)
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, d.encode(), self.mask)
+            if wd < 0:
+                self.unwatched.append(d)
+            else:
+                self.watched[d] = wd
+        return not self.unwatched
+
+    def sleep(self, interval, limit=None):
+        if self.unwatched:
+            timeout = interval
+        else:
+            timeout = max(interval, safetyInterval)
+        if limit != None:
+            timeout = min(timeout, limit)
+        try:
+            (r, w, x) = select.select([self.fd], [], [], timeout)
+        except select.error:
+            return False
+        if r:
+            self.drain()
+            return True
+        return False
+
+    def drain(self):
+        """Read and discard all pending events. We don't care which file changed, since all
+waiters are re-checked anyway."""
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    return
+            except OSError as e:
+                if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    return
+                raise
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def makeNotifier(mode="auto"):
+    """Returns a notifier for wait mode `mode': 'poll' always polls (the original behavior),
+'inotify' uses inotify and also trusts events on network filesystems, 'auto' uses inotify
+when available and polls directories on network filesystems."""
+    if mode != "poll":
+        libc = loadLibc()
+        if libc:
+            try:
+                return InotifyNotifier(libc, trustRemote=(mode == "inotify"))
+            except OSError:
+                pass
+    return PollNotifier()
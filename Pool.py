@@ -0,0 +1,171 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# A small thread pool with futures, used to run many job submissions
+# concurrently (the submissions themselves are external commands, so
+# threads are enough). SubmitPool adds a rate limit and retries on
+# transient errors of the submit command.
+
+import sys
+import time
+import random
+import threading
+import subprocess
+
+PY3 = (sys.version_info.major == 3)
+if PY3:
+    import queue
+else:
+    import Queue as queue
+
+class Future():
+    """The result of a call running in a ThreadPool."""
+    _result = None
+    _error = None
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the call to complete and return its value. If the call raised an
+exception, it is raised here."""
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise RuntimeError("Timeout waiting for future.")
+        if self._error:
+            raise self._error
+        return self._result
+
+    def exception(self, timeout=None):
+        self._event.wait(timeout)
+        return self._error
+
+    def addDoneCallback(self, fn):
+        """Call `fn' with this future as its argument when the call completes."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set(self, result, error):
+        with self._lock:
+            self._result = result
+            self._error = error
+            self._event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for fn in callbacks:
+            fn(self)
+
+def waitAll(futures):
+    """Wait for all `futures' to complete, and return the list of their results."""
+    return [ f.result() for f in futures ]
+
+class ThreadPool():
+    """Runs calls on `workers' threads. submit() returns a Future."""
+    workers = 4
+
+    def __init__(self, workers=4):
+        self.workers = max(1, workers)
+        self.tasks = queue.Queue()
+        self.threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _work(self):
+        while True:
+            item = self.tasks.get()
+            if item == None:
+                return
+            (future, fn, args, kwargs) = item
+            try:
+                future._set(fn(*args, **kwargs), None)
+            except Exception as e:
+                future._set(None, e)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.tasks.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """Stop the pool after all the calls submitted so far have completed."""
+        for t in self.threads:
+            self.tasks.put(None)
+        if wait:
+            for t in self.threads:
+                t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
+        return False
+
+class RateLimiter():
+    """Allows at most `rate' calls to acquire() per second (no limit if rate is 0)."""
+    rate = 0
+    nextTime = 0
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.nextTime = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(now, self.nextTime)
+            self.nextTime = start + 1.0 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+class SubmitPool(ThreadPool):
+    """Calls `submitfn' concurrently on `workers' threads, starting at most `rate' calls
+per second. A call that fails with a CalledProcessError (e.g. because the scheduler is
+temporarily unavailable) is retried up to `retries' times, waiting `backoff' seconds
+before the first retry and doubling the wait each time."""
+    retries = 3
+    backoff = 2.0
+
+    def __init__(self, submitfn, workers=4, rate=0, retries=3, backoff=2.0):
+        ThreadPool.__init__(self, workers)
+        self.submitfn = submitfn
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+
+    def _call(self, args, kwargs):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                return self.submitfn(*args, **kwargs)
+            except subprocess.CalledProcessError:
+                if attempt >= self.retries:
+                    raise
+            delay = self.backoff * (2 ** attempt)
+            time.sleep(delay * random.uniform(0.8, 1.2))
+            attempt += 1
+
+    def submit(self, *args, **kwargs):
+        """Submit a job with the same arguments as Actor.submit(). Returns a Future that
+resolves to the job ID."""
+        return ThreadPool.submit(self, self._call, args, kwargs)
@@ -0,0 +1,269 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# Interface to the cluster scheduler. Commands are pluggable: each one
+# is a shell command line in which {} is replaced by the job IDs (comma
+# separated). If the command line contains no {}, the job IDs are
+# appended to it, separated by spaces. A local stand-in script can be
+# used in place of the real scheduler commands for testing.
+
+import time
+import subprocess
+
+# Globals
+
+# Should print one line per job: jobid state [exitcode], with fields
+# separated by whitespace or |. Exit codes of the form 1:0 (slurm) are
+# also accepted. Jobs that are not listed are considered still active,
+# until they have been missing for queryGrace seconds: then they are
+# considered finished with an UNKNOWN outcome (schedulers forget about
+# jobs some time after they complete, but may also not list jobs that
+# were just submitted). Commands that only list queued and running jobs
+# (e.g. squeue or qstat) cannot report outcomes: use an accounting
+# command such as sacct, or done files or the ledger.
+queryCmd = "sacct -n -X -P --format=JobID,State,ExitCode -j {}"
+queryGrace = 120
+
+# Cancels the specified jobs.
+cancelCmd = "scancel"
+
+# Should print one line per job or job step: jobid walltime cputime maxrss,
+# with fields separated by whitespace or |. Times are in seconds or in the
+# [days-][hours:]minutes:seconds format, memory is in bytes or has a K, M,
+# G, or T suffix. Lines for the steps of a job (jobid.step) are combined.
+usageCmd = "sacct -n -P --format=JobID,ElapsedRaw,TotalCPU,MaxRSS -j {}"
+
+# Job states, normalized to one of the following:
+ACTIVE = "active"
+DONE = "done"
+FAILED = "failed"
+UNKNOWN = "unknown"             # Finished, but the query command never reported how
+
+# Return code of the jobs whose outcome is unknown: they are not
+# considered successful.
+unknownCode = 255
+
+stateNames = {"COMPLETED": DONE, "CD": DONE, "C": DONE,
+              "FAILED": FAILED, "F": FAILED, "CANCELLED": FAILED, "CA": FAILED,
+              "TIMEOUT": FAILED, "TO": FAILED, "NODE_FAIL": FAILED, "NF": FAILED,
+              "OUT_OF_MEMORY": FAILED, "OOM": FAILED, "BOOT_FAIL": FAILED, "BF": FAILED,
+              "DEADLINE": FAILED, "DL": FAILED, "PREEMPTED": FAILED, "PR": FAILED,
+              "REVOKED": FAILED, "RV": FAILED}
+
+# Active states in which the job has started running.
+runningStates = ["RUNNING", "R", "COMPLETING", "CG"]
+
+# Jobs killed by the scheduler for exceeding their memory get this return
+# code, the same as a process killed by the kernel's OOM killer (SIGKILL).
+oomStates = ["OUT_OF_MEMORY", "OOM"]
+oomCode = 137
+
+# Utils
+
+def formatCommand(command, jobids):
+    if "{}" in command:
+        return command.replace("{}", ",".join(jobids))
+    else:
+        return command + " " + " ".join(jobids)
+
+def runCommand(command, jobids):
+    """Run scheduler `command' on `jobids', returning its output as a list of lines.
+Returns None if the command fails."""
+    try:
+        out = subprocess.check_output(formatCommand(command, jobids), shell=True)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return out.decode().splitlines()
+
+def cancelJobs(jobids, command=None):
+    """Cancel all jobs in `jobids' with a single invocation of `command' (defaulting to
+cancelCmd). Returns True if the command succeeded."""
+    if not jobids:
+        return True
+    return runCommand(command or cancelCmd, jobids) != None
+
+def stateWord(state):
+    """Returns the scheduler state `state' without qualifiers (e.g. CANCELLED for "CANCELLED by 123")."""
+    words = state.split()
+    return words[0].upper().rstrip("+") if words else ""
+
+def normalizeState(state):
+    """Convert a scheduler state (e.g. RUNNING, CANCELLED by 123, Q) to ACTIVE, DONE, or FAILED."""
+    return stateNames.get(stateWord(state), ACTIVE)
+
+def parseExitCode(s):
+    try:
+        return int(s.split(":")[0])
+    except ValueError:
+        return None
+
+def parseDuration(s):
+    """Convert a duration (seconds, or [days-][hours:]minutes:seconds) to seconds. Returns None if `s' is empty or invalid."""
+    try:
+        days = 0
+        if "-" in s:
+            (d, s) = s.split("-", 1)
+            days = int(d)
+        secs = 0.0
+        for f in s.split(":"):
+            secs = secs * 60 + float(f)
+        return days * 86400 + secs
+    except ValueError:
+        return None
+
+def parseMemory(s):
+    """Convert an amount of memory (bytes, or with a K, M, G, or T suffix) to MB. Returns None if `s' is empty or invalid."""
+    units = {"K": 1.0 / 1024, "M": 1.0, "G": 1024.0, "T": 1024.0 * 1024}
+    s = s.strip().upper().rstrip("B")
+    try:
+        if s and s[-1] in units:
+            return float(s[:-1]) * units[s[-1]]
+        return float(s) / (1024 * 1024)
+    except ValueError:
+        return None
+
+class JobState():
+    jobid = ""
+    state = ACTIVE
+    code = None                 # Exit code, if known
+    running = False             # True if the job is active and has started running
+
+    def __init__(self, jobid, state, code=None, running=False):
+        self.jobid = jobid
+        self.state = state
+        self.code = code
+        self.running = running
+
+    def finished(self):
+        return self.state != ACTIVE
+
+    def returnCode(self):
+        """Returns the exit code of the job, 1 if it failed without reporting one, or unknownCode if its outcome is unknown."""
+        if self.state == UNKNOWN:
+            return unknownCode
+        if self.code != None and (self.code != 0 or self.state == DONE):
+            return self.code
+        return 1 if self.state == FAILED else 0
+
+class JobQuery():
+    """Queries the state of many jobs at once with `command'. A job that the scheduler
+does not report is considered active until it has been missing from the output of the
+query for `grace' seconds, and finished with an UNKNOWN outcome afterwards."""
+    command = queryCmd
+    grace = queryGrace
+    missing = {}                # jobid -> time at which it was first found missing
+
+    def __init__(self, command=None, grace=None):
+        if command:
+            self.command = command
+        if grace != None:
+            self.grace = grace
+        self.missing = {}
+
+    def query(self, jobids):
+        """Returns a dictionary mapping each job ID in `jobids' to a JobState, using a
+single invocation of the query command. Returns None if the query fails."""
+        result = {}
+        if not jobids:
+            return result
+        lines = runCommand(self.command, jobids)
+        if lines == None:
+            return None
+        for line in lines:
+            fields = line.split("|") if "|" in line else line.split()
+            if len(fields) < 2:
+                continue
+            code = parseExitCode(fields[2]) if len(fields) > 2 else None
+            if stateWord(fields[1]) in oomStates:
+                code = oomCode
+            result[fields[0]] = JobState(fields[0], normalizeState(fields[1]), code, running=stateWord(fields[1]) in runningStates)
+            self.missing.pop(fields[0], None)
+        now = time.time()
+        for j in jobids:
+            if j not in result:
+                since = self.missing.setdefault(j, now)
+                result[j] = JobState(j, UNKNOWN if now - since >= self.grace else ACTIVE)
+        return result
+
+class JobUsage():
+    """The resources used by a job: `walltime' and `cputime' in seconds, `maxrss' in MB (None when unknown)."""
+    jobid = ""
+    walltime = None
+    cputime = None
+    maxrss = None
+
+    def __init__(self, jobid, walltime=None, cputime=None, maxrss=None):
+        self.jobid = jobid
+        self.walltime = walltime
+        self.cputime = cputime
+        self.maxrss = maxrss
+
+    def merge(self, other):
+        """Combine with the usage of one of the steps of the same job, taking the maximum of each value."""
+        for a in ["walltime", "cputime", "maxrss"]:
+            v = getattr(other, a)
+            if v != None and (getattr(self, a) == None or v > getattr(self, a)):
+                setattr(self, a, v)
+
+class UsageQuery():
+    """Obtains the resource usage of many jobs at once with `command'."""
+    command = usageCmd
+    chunk = 1000                # Maximum number of job IDs per invocation
+
+    def __init__(self, command=None):
+        if command:
+            self.command = command
+
+    def query(self, jobids):
+        """Returns a dictionary mapping the job IDs in `jobids' to JobUsage objects. Jobs not reported by the accounting command are not included. Returns None if the command fails."""
+        result = {}
+        failed = True
+        for start in range(0, len(jobids), self.chunk):
+            lines = runCommand(self.command, jobids[start:start+self.chunk])
+            if lines == None:
+                continue
+            failed = False
+            for line in lines:
+                fields = line.split("|") if "|" in line else line.split()
+                if len(fields) < 2:
+                    continue
+                fields += [""] * (4 - len(fields))
+                jobid = fields[0].split(".")[0]
+                u = JobUsage(jobid, parseDuration(fields[1]), parseDuration(fields[2]), parseMemory(fields[3]))
+                if jobid in result:
+                    result[jobid].merge(u)
+                else:
+                    result[jobid] = u
+        if failed and jobids:
+            return None
+        return result
+
+class JobIndex():
+    """The state of all the jobs waited for in one poll cycle, obtained with a single query."""
+    states = {}
+    aliases = {}                # jobid -> ID of the job whose state should be reported instead
+    jobquery = None
+
+    def __init__(self, jobquery):
+        self.jobquery = jobquery
+        self.states = {}
+        self.aliases = {}
+
+    def refresh(self, jobids):
+        """Query the state of `jobids'. If the query fails, previously known states are kept."""
+        if jobids:
+            states = self.jobquery.query(list(set([ self.aliases.get(j, j) for j in jobids ])))
+            if states != None:
+                self.states.update(states)
+
+    def alias(self, jobid, other):
+        """From now on, report the state of job `other' as the state of `jobid'."""
+        self.aliases[jobid] = other
+
+    def state(self, jobid):
+        return self.states.get(self.aliases.get(jobid, jobid), None)
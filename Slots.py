@@ -0,0 +1,165 @@
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# Job slots limit the number of jobs that are queued or running at the
+# same time. Slots can be shared by several concurrent runs through a
+# slot file, locked with fcntl while it is being updated. Each line of
+# the file describes a slot in use:
+#
+#   token  jobid  timestamp
+#
+# where token is host:pid:n, identifying the process that holds the slot.
+# Slots held by processes that no longer exist on this host are freed
+# automatically. The liveness of processes on other hosts cannot be
+# checked, so each process refreshes the timestamps of its slots
+# periodically, and the slots of other hosts that were not refreshed for
+# `expire' seconds are freed.
+
+import os
+import time
+import errno
+import fcntl
+import socket
+import threading
+
+def pidAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM     # The process exists, but belongs to someone else
+    return True
+
+class JobSlots():
+    """At most `limit' slots can be in use at the same time. If `filename' is specified, the
+slots are shared with all the processes using the same file. The slots of processes on other
+hosts are freed when their timestamp is more than `expire' seconds old (0 means never)."""
+    limit = 0
+    filename = None
+    expire = 3600
+
+    def __init__(self, limit, filename=None, expire=3600):
+        self.limit = limit
+        self.expire = expire
+        self.filename = filename and os.path.expanduser(filename)
+        self.host = socket.gethostname()
+        self.owner = "{}:{}".format(self.host, os.getpid())
+        self.counter = 0
+        self.mine = {}          # token -> jobid (None until assigned)
+        self.entries = {}       # token -> (jobid, timestamp), when not using a file
+        self.lock = threading.Lock()
+
+    def _isStale(self, token, timestamp):
+        parts = token.split(":")
+        if len(parts) != 3:
+            return False
+        if parts[0] != self.host:
+            return self.expire and time.time() - timestamp > self.expire
+        try:
+            return not pidAlive(int(parts[1]))
+        except ValueError:
+            return True
+
+    def _update(self, fn):
+        """Call `fn' on the dictionary of slots in use, and save it if `fn' returns True. If
+using a file, it is locked for the whole operation."""
+        if not self.filename:
+            fn(self.entries)
+            return
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r") as f:
+                data = f.read()
+            entries = {}
+            for line in data.splitlines():
+                fields = line.split("\t")
+                if len(fields) == 3 and not self._isStale(fields[0], float(fields[2])):
+                    entries[fields[0]] = (fields[1], float(fields[2]))
+            if fn(entries):
+                data = "".join([ "{}\t{}\t{:.0f}\n".format(t, j, ts) for (t, (j, ts)) in entries.items() ])
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data.encode())
+        finally:
+            os.close(fd)        # Also releases the lock
+
+    def acquire(self, n=1):
+        """Try to take `n' slots. Returns the list of their tokens, or None if not enough slots
+are free. A request for more slots than the limit succeeds when all slots are free."""
+        with self.lock:
+            tokens = []
+
+            def take(entries):
+                if len(entries) + n > self.limit and entries:
+                    return False
+                now = time.time()
+                for i in range(n):
+                    self.counter += 1
+                    token = "{}:{}".format(self.owner, self.counter)
+                    entries[token] = ("-", now)
+                    tokens.append(token)
+                return True
+
+            self._update(take)
+            for t in tokens:
+                self.mine[t] = None
+            return tokens or None
+
+    def assign(self, token, jobid):
+        """Record that the slot `token' is used by job `jobid'."""
+        with self.lock:
+            self.mine[token] = jobid
+
+            def setJob(entries):
+                if token in entries:
+                    entries[token] = (jobid, entries[token][1])
+                    return True
+                return False
+
+            self._update(setJob)
+
+    def release(self, tokens):
+        """Free the slots in the list `tokens'."""
+        if not tokens:
+            return
+        with self.lock:
+            for t in tokens:
+                self.mine.pop(t, None)
+
+            def free(entries):
+                for t in tokens:
+                    entries.pop(t, None)
+                return True
+
+            self._update(free)
+
+    def refresh(self):
+        """Update the timestamps of the slots held by this process, so that they do not expire."""
+        with self.lock:
+            tokens = list(self.mine)
+
+            def touch(entries):
+                now = time.time()
+                for t in tokens:
+                    if t in entries:
+                        entries[t] = (entries[t][0], now)
+                return True
+
+            if tokens:
+                self._update(touch)
+
+    def held(self):
+        """Returns a dictionary mapping the tokens of the slots held by this process to their job IDs."""
+        with self.lock:
+            return dict([ (t, j) for (t, j) in self.mine.items() if j ])
+
+    def inUse(self):
+        """Returns the number of slots in use (by all processes sharing the file)."""
+        count = []
+        self._update(lambda entries: count.append(len(entries)))
+        return count[0]
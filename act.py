@@ -9,6 +9,7 @@
 ###################################################
 
 import sys
+import signal
 import os.path
 import subprocess
 import traceback
@@ -28,6 +29,12 @@ def getScriptClass(filename):
 def show(msg, *args):
     sys.stdout.write(msg.format(*args))
 
+def interrupted(signum, frame):
+    """Signal handler for SIGTERM and SIGHUP: treat them like Ctrl-C, so that the run is
+aborted and its outstanding jobs are cancelled."""
+    signal.signal(signum, signal.SIG_IGN)
+    raise KeyboardInterrupt("received signal {}".format(signum))
+
 def execute(filename):
     sys.stderr.write("Executing: {}\n".format(filename))
     if PY3:
@@ -93,6 +100,9 @@ class Args():
         ACT.dry = self.dry
         # print ACT.ask
         good = True
+        signal.signal(signal.SIGTERM, interrupted)
+        if signal.getsignal(signal.SIGHUP) != signal.SIG_IGN:       # Ignored when running under nohup
+            signal.signal(signal.SIGHUP, interrupted)
 
         if self.debug:
             try:
@@ -102,7 +112,13 @@ class Args():
                 bt = traceback.format_exc()
                 ACT.log.log(bt)
                 good = False
+                ACT.abort(str(e))
+                ACT._cancelIfAborted()
                 raise e
+            except KeyboardInterrupt:
+                ACT.abort("interrupted")
+                ACT._cancelIfAborted()
+                raise
         else:
             try:
                 execute(filename)
@@ -110,6 +126,13 @@ class Args():
                 msg = "*** Script terminated with the following error:\n*** {}\n".format(e)
                 show(msg)
                 ACT.log.log(msg)
+                ACT.abort(str(e))
+                good = False
+            except KeyboardInterrupt as e:
+                msg = "*** Script interrupted{}.\n".format(": {}".format(e) if str(e) else "")
+                show(msg)
+                ACT.log.log(msg)
+                ACT.abort("interrupted")
                 good = False
             finally:
                 ACT._cleanup()
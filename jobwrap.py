@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# Wrapper used by Actor.submit() to run a job script and record its
+# completion in a ledger, instead of (or in addition to) a -done file.
+# It can also touch a heartbeat file periodically while the script runs,
+# so that the controller can detect jobs whose node died. It can run a
+# bundle of short tasks in a single job. Finally, it can run a command in
+# a scratch directory, so that it does not overwrite the outputs of
+# another copy of the same job that may be running at the same time.
+
+import os
+import sys
+import time
+import stat
+import shutil
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from Ledger import Ledger
+
+# Environment variables containing the job ID, for the schedulers we know about
+jobidVars = ["DAMON_JOB_ID", "SLURM_JOB_ID", "PBS_JOBID", "JOB_ID", "LSB_JOBID"]
+
+# Environment variables containing the index of an array job element
+arrayVars = ["SLURM_ARRAY_TASK_ID", "PBS_ARRAYID", "PBS_ARRAY_INDEX", "SGE_TASK_ID", "LSB_JOBINDEX"]
+
+def show(msg, *args):
+    sys.stderr.write(msg.format(*args))
+
+def getArrayIndex():
+    for v in arrayVars:
+        if v in os.environ:
+            return int(os.environ[v])
+    return None
+
+def getJobid():
+    if "SLURM_ARRAY_JOB_ID" in os.environ:
+        return "{}_{}".format(os.environ["SLURM_ARRAY_JOB_ID"], os.environ["SLURM_ARRAY_TASK_ID"])
+    for v in jobidVars:
+        if v in os.environ:
+            return os.environ[v]
+    return "pid{}".format(os.getpid())
+
+def touch(filename):
+    with open(filename, "a"):
+        os.utime(filename, None)
+
+class Heartbeat(threading.Thread):
+    """Touches `filename' every `interval' seconds until stop() is called."""
+
+    def __init__(self, filename, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.filename = filename
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                touch(self.filename)
+            except (IOError, OSError):
+                pass
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        try:
+            os.remove(self.filename)
+        except OSError:
+            pass
+
+def quote(word):
+    try:
+        from shlex import quote as q
+    except ImportError:
+        from pipes import quote as q
+    return q(word)
+
+def scriptCommand(command, shell=False):
+    """Returns `command' (a list of words, or a command line if `shell' is True) ready to be
+run the way the submit command would run it: if the first word is a file in the current
+directory, it is run from there, through bash if it is not executable."""
+    words = command.split(None, 1) if shell else command
+    if not words or not os.path.isfile(words[0]):
+        return command
+    script = os.path.abspath(words[0])
+    prefix = [script] if os.access(script, os.X_OK) else ["bash", script]
+    if shell:
+        return " ".join([ quote(w) for w in prefix ] + words[1:])
+    return prefix + words[1:]
+
+def makeScratch(path, since=None):
+    """Create the scratch directory `path', containing a symbolic link to each entry of the
+current directory. A command run in it reads the same files, but the new files it creates
+are written to `path'. If `since' is specified, only the files last modified before that
+time are linked: the others may be outputs that another copy of the command is still
+writing, and writing them through the link would overwrite them. In this case directories
+are not linked, but recreated in `path' and filled in the same way."""
+    os.makedirs(path)
+    linkEntries(".", path, since, os.path.abspath(path))
+
+def linkEntries(src, dest, since, skip):
+    for name in os.listdir(src):
+        entry = os.path.abspath(os.path.join(src, name))
+        if entry == skip or skip.startswith(entry + os.sep):     # The scratch directory and the ones containing it
+            continue
+        if since != None and not os.path.islink(entry):
+            try:
+                st = os.stat(entry)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                os.mkdir(os.path.join(dest, name))
+                linkEntries(entry, os.path.join(dest, name), since, skip)
+                continue
+            if st.st_mtime >= since:
+                continue
+        os.symlink(entry, os.path.join(dest, name))
+
+def publishScratch(path, dest="."):
+    """Move the files created in the scratch directory `path' to `dest', each one with an
+atomic rename. Directories that already exist in `dest' are merged."""
+    for name in os.listdir(path):
+        src = os.path.join(path, name)
+        target = os.path.join(dest, name)
+        if os.path.islink(src):
+            continue
+        if os.path.isdir(src) and os.path.isdir(target) and not os.path.islink(target):
+            publishScratch(src, target)
+        else:
+            os.rename(src, target)
+
+class Args():
+    ledger = None
+    task = ""
+    done = None
+    heartbeat = None
+    interval = 60
+    array = None
+    bundle = None
+    parallel = 1
+    scratch = None
+    since = None
+    command = []
+
+    def parse(self, args):
+        next = ""
+        for i in range(len(args)):
+            a = args[i]
+            if next == "-ledger":
+                self.ledger = a
+                next = ""
+            elif next == "-task":
+                self.task = a
+                next = ""
+            elif next == "-done":
+                self.done = a
+                next = ""
+            elif next == "-heartbeat":
+                self.heartbeat = a
+                next = ""
+            elif next == "-interval":
+                self.interval = float(a)
+                next = ""
+            elif next == "-array":
+                self.array = a
+                next = ""
+            elif next == "-bundle":
+                self.bundle = a
+                next = ""
+            elif next == "-parallel":
+                self.parallel = int(a)
+                next = ""
+            elif next == "-scratch":
+                self.scratch = os.path.abspath(a)
+                next = ""
+            elif next == "-since":
+                self.since = float(a)
+                next = ""
+            elif a in ["-ledger", "-task", "-done", "-heartbeat", "-interval", "-array", "-bundle", "-parallel", "-scratch", "-since"]:
+                next = a
+            elif a == "--":
+                self.command = args[i+1:]
+                break
+            else:
+                self.command = args[i:]
+                break
+        if self.array:
+            return self.readArrayTask()
+        if self.bundle:
+            return True
+        return len(self.command) > 0
+
+    def readArrayTask(self):
+        """Set the command, done file and ledger task from the line of the array task
+file corresponding to this element of the array job."""
+        idx = getArrayIndex()
+        if idx == None:
+            show("Error: -array requires an array job.\n")
+            return False
+        tasks = readTasks(self.array)
+        if idx < 1 or idx > len(tasks):
+            show("Error: no task {} in {}.\n", idx, self.array)
+            return False
+        (done, task, command) = tasks[idx-1]
+        if done:
+            self.done = done
+        if task:
+            self.task = task
+        self.command = command
+        return True
+
+    def run(self):
+        hb = None
+        if self.heartbeat:
+            hb = Heartbeat(self.heartbeat, self.interval)
+            hb.start()
+        if self.bundle:
+            code = self.runBundle()
+        else:
+            code = runTask(self.command, self.done, self.ledger, self.task, shell=(self.array != None), scratch=self.scratch, since=self.since)
+        if hb:
+            hb.stop()
+        return code
+
+    def runBundle(self):
+        """Run all the tasks in the bundle file, `parallel' at a time. Returns the highest
+return code of the tasks."""
+        tasks = readTasks(self.bundle)
+        codes = [0]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not tasks:
+                        return
+                    (done, task, command) = tasks.pop(0)
+                code = runTask(command, done, self.ledger if task else None, task, shell=True)
+                with lock:
+                    codes.append(code)
+
+        threads = [ threading.Thread(target=worker) for i in range(max(1, self.parallel)) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return max(codes)
+
+def readTasks(filename):
+    """Read a task file for -array or -bundle. Each line of the file contains three
+tab-delimited fields: done file, ledger task, and command line (- stands for an empty
+field, returned as None)."""
+    tasks = []
+    with open(filename, "r") as f:
+        for line in f.read().splitlines():
+            (done, task, command) = line.split("\t", 2)
+            tasks.append((None if done == "-" else done, None if task == "-" else task, command))
+    return tasks
+
+def runTask(command, done, ledger, task, shell=False, scratch=None, since=None):
+    """Run `command', then write its return code to the `done' file and append it to the
+`ledger', if specified. If `scratch' is specified, the command is run in that scratch
+directory (see makeScratch() for `since'), and the files it creates are moved to the
+current directory only if it succeeds. Returns the return code."""
+    start = time.time()
+    try:
+        if scratch:
+            makeScratch(scratch, since)
+        code = subprocess.call(scriptCommand(command, shell), shell=shell, cwd=scratch)
+        if code < 0:            # Killed by a signal: report it the way the shell does
+            code = 128 - code
+    except OSError as e:
+        show("Error running {}: {}\n", command if shell else command[0], e)
+        code = 127
+    if scratch:
+        try:
+            if code == 0:
+                publishScratch(scratch)
+        except OSError as e:
+            show("Error moving the outputs of {} from {}: {}\n", command if shell else command[0], scratch, e)
+            code = 1
+        shutil.rmtree(scratch, ignore_errors=True)
+    if done:
+        with open(done, "w") as out:
+            out.write("{}\n".format(code))
+    if ledger:
+        Ledger(ledger).append(getJobid(), task, code, elapsed=time.time() - start)
+    return code
+
+def usage():
+    show("""
+Usage: {} [-ledger file] [-task name] [-done file] [-heartbeat file] [-interval secs] [-scratch dir [-since time]] [--] command [arguments...]
+       {} -array taskfile [-ledger file]
+       {} -bundle taskfile [-parallel n] [-ledger file] [-heartbeat file] [-interval secs]
+
+Runs `command' with the specified arguments. When the command terminates, its
+return code is appended to the ledger `file' together with the job ID, the
+task `name' and the runtime of the command, and written to the -done file if
+requested. If -heartbeat is specified, the heartbeat file is touched every
+-interval seconds (default: 60)
+while the command runs, and removed when it terminates. If -scratch is specified,
+the command is run in directory `dir', which contains links to all the files in
+the current directory (or only to those last modified before `time', in seconds
+since the epoch, if -since is specified); the new files it creates are moved to
+the current directory if it succeeds, and discarded otherwise. The return code of this
+program is the one of `command'.
+
+In the second form, this program runs as an element of an array job: the command
+line, done file, and ledger task are read from the line of `taskfile' whose
+number is the index of the array element.
+
+In the third form, this program runs all the tasks in `taskfile' (in the same
+format as for -array), `n' at a time (default: 1). Each task writes its own done
+file and ledger record. The return code is the highest one of the tasks.
+""", os.path.split(sys.argv[0])[1], os.path.split(sys.argv[0])[1], os.path.split(sys.argv[0])[1])
+
+if __name__ == "__main__":
+    A = Args()
+    if A.parse(sys.argv[1:]):
+        sys.exit(A.run())
+    else:
+        usage()
+        sys.exit(1)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+###################################################
+#
+# (c) 2016, Alberto Riva, ariva@ufl.edu
+# DiBiG, ICBR Bioinformatics, University of Florida
+#
+# See the LICENSE file for license information.
+###################################################
+
+# Pilot jobs are long-lived workers that pull tasks from a queue
+# directory on the shared filesystem, instead of having the scheduler
+# start one job for each task. The queue directory contains:
+#
+#   queue/    tasks waiting to run, one file per task
+#   running/  tasks claimed by a pilot (moved here with an atomic rename)
+#   results/  the return code of each completed task
+#   pilots/   one file per live pilot, listing the tasks it is running;
+#             its modification time works as a heartbeat
+#   cancel/   tasks that should be killed
+#   stop      if present, pilots exit when the queue is empty
+#
+# Each task file contains tab-delimited key/value lines: script, done,
+# after, and cwd. Tasks are run in the order of their names.
+
+import os
+import sys
+import time
+import subprocess
+
+# Utils
+
+def show(msg, *args):
+    sys.stderr.write(msg.format(*args))
+
+def writeFile(filename, content):
+    """Write `content' to `filename' atomically (through a temporary file and a rename)."""
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp, "w") as out:
+        out.write(content)
+    os.rename(tmp, filename)
+
+def listdir(path):
+    try:
+        return sorted([ f for f in os.listdir(path) if not f.endswith(".tmp") ])
+    except OSError:
+        return []
+
+class TaskQueue():
+    """Access to a queue directory, shared by the controller and the pilots."""
+    path = ""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        for d in ["queue", "running", "results", "pilots", "cancel"]:
+            if not os.path.isdir(self.sub(d)):
+                try:
+                    os.makedirs(self.sub(d))
+                except OSError:
+                    pass        # Created by someone else in the meantime
+
+    def sub(self, *names):
+        return os.path.join(self.path, *names)
+
+    # Tasks
+
+    def put(self, jobid, script, done=None, after=None, cwd=None):
+        fields = [("script", script), ("done", done or ""), ("after", after or ""), ("cwd", cwd or os.getcwd())]
+        writeFile(self.sub("queue", jobid), "".join([ "{}\t{}\n".format(k, v) for (k, v) in fields ]))
+
+    def read(self, filename):
+        task = {}
+        try:
+            with open(filename, "r") as f:
+                for line in f.read().splitlines():
+                    (k, v) = line.split("\t", 1)
+                    task[k] = v
+        except (IOError, OSError, ValueError):
+            return None
+        return task
+
+    def waiting(self):
+        return listdir(self.sub("queue"))
+
+    def running(self):
+        return listdir(self.sub("running"))
+
+    def result(self, jobid):
+        """Returns the return code of task `jobid', or None if it has not completed."""
+        try:
+            with open(self.sub("results", jobid), "r") as f:
+                return int(f.read().strip())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def setResult(self, jobid, code):
+        writeFile(self.sub("results", jobid), "{}\n".format(code))
+        for d in ["running", "cancel"]:
+            try:
+                os.remove(self.sub(d, jobid))
+            except OSError:
+                pass
+
+    def isRunning(self, jobid):
+        return os.path.exists(self.sub("running", jobid))
+
+    def isPending(self, jobid):
+        return os.path.exists(self.sub("queue", jobid)) or os.path.exists(self.sub("running", jobid))
+
+    def depsState(self, task):
+        """Returns None if the dependencies of `task' have not completed yet, otherwise
+the highest of their return codes. Dependencies that are not in this queue are assumed
+to be satisfied."""
+        code = 0
+        for d in [ j for j in task.get("after", "").replace(":", ",").split(",") if j ]:
+            c = self.result(d)
+            if c == None:
+                if self.isPending(d):
+                    return None
+            else:
+                code = max(code, c)
+        return code
+
+    def claim(self):
+        """Move the first task whose dependencies are satisfied to running/, and return
+its ID and contents, or None if no task is ready."""
+        for jobid in self.waiting():
+            task = self.read(self.sub("queue", jobid))
+            if task == None or self.depsState(task) == None:
+                continue
+            try:
+                os.rename(self.sub("queue", jobid), self.sub("running", jobid))
+            except OSError:
+                continue        # Another pilot got it first
+            return (jobid, task)
+        return None
+
+    def requeue(self, jobid):
+        try:
+            os.rename(self.sub("running", jobid), self.sub("queue", jobid))
+        except OSError:
+            pass
+
+    def cancel(self, jobid):
+        """Cancel task `jobid'. If it is waiting it is removed from the queue, if it is running
+the pilot running it will kill it."""
+        try:
+            os.remove(self.sub("queue", jobid))
+            self.setResult(jobid, 143)
+            return
+        except OSError:
+            pass
+        if os.path.exists(self.sub("running", jobid)):
+            writeFile(self.sub("cancel", jobid), "")
+
+    def isCancelled(self, jobid):
+        return os.path.exists(self.sub("cancel", jobid))
+
+    # Pilots
+
+    def register(self, name, jobids):
+        writeFile(self.sub("pilots", name), "".join([ j + "\n" for j in jobids ]))
+
+    def unregister(self, name):
+        try:
+            os.remove(self.sub("pilots", name))
+        except OSError:
+            pass
+
+    def pilots(self):
+        """Returns a dictionary mapping the name of each registered pilot to a tuple containing
+the age of its last heartbeat and the list of tasks it is running."""
+        result = {}
+        now = time.time()
+        for name in listdir(self.sub("pilots")):
+            try:
+                filename = self.sub("pilots", name)
+                age = now - os.path.getmtime(filename)
+                with open(filename, "r") as f:
+                    result[name] = (age, f.read().split())
+            except (IOError, OSError):
+                pass
+        return result
+
+    def stop(self, stopped=True):
+        if stopped:
+            writeFile(self.sub("stop"), "")
+        elif os.path.exists(self.sub("stop")):
+            os.remove(self.sub("stop"))
+
+    def isStopped(self):
+        return os.path.exists(self.sub("stop"))
+
+class Pilot():
+    """Runs tasks from `queue' (a TaskQueue), `parallel' at a time, checking the queue every
+`interval' seconds. Exits when the queue is stopped and empty, or after `idle' seconds
+without work. Tasks whose dependencies are still running count as work."""
+    name = ""
+    parallel = 1
+    idle = 300
+    interval = 1
+
+    def __init__(self, queue, name, parallel=1, idle=300, interval=1):
+        self.queue = queue
+        self.name = name
+        self.parallel = parallel
+        self.idle = idle
+        self.interval = interval
+        self.procs = {}         # jobid -> (Popen, task)
+
+    def start(self, jobid, task):
+        code = self.queue.depsState(task)
+        if code != 0:           # A dependency failed: do not run this task
+            self.finish(jobid, task, 1)
+            return
+        env = dict(os.environ)
+        env["DAMON_JOB_ID"] = jobid
+        cwd = task.get("cwd") or None
+        try:
+            out = open(os.path.join(cwd or ".", jobid + ".out"), "w")
+            proc = subprocess.Popen(task["script"], shell=True, cwd=cwd, stdout=out, stderr=subprocess.STDOUT, env=env)
+            out.close()
+        except (IOError, OSError) as e:
+            show("Error starting task {}: {}\n", jobid, e)
+            self.finish(jobid, task, 127)
+            return
+        self.procs[jobid] = (proc, task)
+
+    def finish(self, jobid, task, code):
+        if task.get("done"):
+            done = task["done"]
+            if task.get("cwd"):
+                done = os.path.join(task["cwd"], done)
+            with open(done, "w") as out:
+                out.write("{}\n".format(code))
+        self.queue.setResult(jobid, code)
+
+    def reap(self):
+        for (jobid, (proc, task)) in list(self.procs.items()):
+            if self.queue.isCancelled(jobid) and proc.poll() == None:
+                proc.terminate()
+            code = proc.poll()
+            if code != None:
+                if code < 0:
+                    code = 128 - code
+                del self.procs[jobid]
+                self.finish(jobid, task, code)
+
+    def run(self):
+        lastWork = time.time()
+        try:
+            while True:
+                self.queue.register(self.name, list(self.procs.keys()))
+                self.reap()
+                claimed = False
+                if len(self.procs) < self.parallel:
+                    item = self.queue.claim()
+                    if item:
+                        self.start(*item)
+                        claimed = True
+                if self.procs or claimed or (self.queue.waiting() and self.queue.running()):
+                    # Tasks waiting for others to complete will become ready: do not exit
+                    lastWork = time.time()
+                elif self.queue.isStopped() and not self.queue.waiting():
+                    return 0
+                elif time.time() - lastWork > self.idle:
+                    return 0
+                if not claimed:
+                    time.sleep(self.interval)
+        finally:
+            for (proc, task) in self.procs.values():
+                proc.terminate()
+            self.queue.unregister(self.name)
+
+def usage():
+    show("""
+Usage: {} -queue dir [-name name] [-parallel n] [-idle secs] [-interval secs]
+
+Runs as a pilot job: takes tasks from the queue directory `dir', and runs them
+`n' at a time (default: 1), until the queue is stopped and empty or no task is
+available for `secs' seconds (default: 300).
+""", os.path.split(sys.argv[0])[1])
+
+def main(args):
+    qdir = None
+    name = "pilot{}".format(os.getpid())
+    parallel = 1
+    idle = 300
+    interval = 1
+    next = ""
+    for a in args:
+        if next == "-queue":
+            qdir = a
+        elif next == "-name":
+            name = a
+        elif next == "-parallel":
+            parallel = int(a)
+        elif next == "-idle":
+            idle = float(a)
+        elif next == "-interval":
+            interval = float(a)
+        elif a in ["-queue", "-name", "-parallel", "-idle", "-interval"]:
+            next = a
+            continue
+        next = ""
+    if not qdir:
+        usage()
+        return 1
+    return Pilot(TaskQueue(qdir), name, parallel=parallel, idle=idle, interval=interval).run()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,22 @@
+# Lines used by test_asyncdirector.py. Python 3 only: test_asyncdirector.py imports
+# this module only if it can.
+
+from Lines import Line
+
+class Wait(Line):
+    """Submits the script in its `script' property, and awaits it."""
+    tag = "wait"
+    name = "Wait"
+
+    async def Execute(self):
+        self.actor.submit(self.properties['script'], task=self.key, done=self.key + ".done")
+        return await self.actor.waitAsync([self.key + ".done"])
+
+class Barrier(Line):
+    """Submits the script in its `script' property, and waits for it."""
+    tag = "barrier"
+    name = "Barrier"
+
+    def Execute(self):
+        self.actor.submit(self.properties['script'], task=self.key, done=self.key + ".done")
+        return self.actor.wait([self.key + ".done"])
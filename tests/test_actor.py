@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Actor
+import Notify
+import Executors
+import Scheduler
+
+class ActorTest(unittest.TestCase):
+    """Runs an Actor with a local executor in a temporary run directory."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.actor = Actor.Actor()
+        self.actor.pollPolicy = Notify.PollPolicy(initial=0.1, maximum=0.2, jitter=0)
+        self.actor.executor = Executors.LocalExecutor(cpus=2, mem=1000)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def script(self, name, body, executable=False):
+        with open(name, "w") as out:
+            out.write("#!/bin/bash\n" + body + "\n")
+        if executable:
+            os.chmod(name, 0o755)
+
+    def read(self, filename):
+        with open(filename, "r") as f:
+            return f.read()
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_attempts(self):
+        policy = Actor.RetryPolicy(attempts=3)
+        job = Actor.Job("1", "script.qsub", {})
+        self.assertFalse(policy.shouldRetry(job, 0))
+        self.assertTrue(policy.shouldRetry(job, 1))
+        job = Actor.Job("2", "script.qsub", {}, attempts=3)
+        self.assertFalse(policy.shouldRetry(job, 1))
+
+    def test_delay(self):
+        policy = Actor.RetryPolicy(backoff=10, factor=3)
+        self.assertEqual([ policy.delay(a) for a in [1, 2, 3] ], [10, 30, 90])
+
+    def test_options(self):
+        policy = Actor.RetryPolicy(memFactor=2)
+        self.assertEqual(policy.options("--mem=4G", Scheduler.oomCode), "--mem=8G")
+        self.assertEqual(policy.options("--mem=4G", 1), "--mem=4G")
+        self.assertEqual(Actor.RetryPolicy(memFactor=1).options("--mem=4G", Scheduler.oomCode), "--mem=4G")
+        self.assertEqual(Actor.RetryPolicy(oomCodes=[1]).options("--mem=4G", 1), "--mem=8G")
+
+    def test_configuration(self):
+        a = Actor.Actor()
+        self.assertEqual(a.getRetryPolicy(False), None)
+        policy = Actor.RetryPolicy(attempts=5)
+        self.assertTrue(a.getRetryPolicy(policy) is policy)
+        self.assertEqual(a.getRetryPolicy(True).attempts, 3)
+        self.assertEqual(a.getRetryPolicy(4).attempts, 4)
+
+class TestRetry(ActorTest):
+
+    def setUp(self):
+        ActorTest.setUp(self)
+        # Fails until it has been run $2 times
+        self.script("flaky.qsub", "echo $1 >> runs.txt\ntest $(grep -c $1 runs.txt) -ge $2")
+
+    def test_done(self):
+        a = self.actor
+        a.submit("flaky.qsub a 2", task="t", done="a.done", retry=Actor.RetryPolicy(attempts=3, backoff=0))
+        self.assertTrue(a.wait(["a.done"], timeout=30))
+        self.assertEqual(self.read("runs.txt").split(), ["a", "a"])
+
+    def test_ledger(self):
+        a = self.actor
+        a.submit("flaky.qsub b 2", task="t", ledger=True, retry=Actor.RetryPolicy(attempts=3, backoff=0))
+        self.assertTrue(a.wait([a.ledgerWaiter("t")], timeout=30))
+        self.assertEqual(self.read("runs.txt").split(), ["b", "b"])
+
+    def test_exhausted(self):
+        a = self.actor
+        a.submit("flaky.qsub c 5", task="t", done="c.done", retry=Actor.RetryPolicy(attempts=2, backoff=0))
+        self.assertFalse(a.wait(["c.done"], timeout=30))
+        self.assertEqual(self.read("runs.txt").split(), ["c", "c"])
+
+class TestLedgerJobs(ActorTest):
+
+    def test_relativeScript(self):
+        self.script("job.qsub", "echo $1 > $1.txt")
+        a = self.actor
+        a.submit("job.qsub s1", task="align", ledger=True)
+        a.submit("job.qsub s2", prefix="count", ledger=True)
+        self.assertTrue(a.wait([a.ledgerWaiter("align"), a.ledgerWaiter("count")], timeout=30))
+        self.assertEqual((self.read("s1.txt"), self.read("s2.txt")), ("s1\n", "s2\n"))
+
+    def test_noTask(self):
+        self.assertRaises(Actor.ActorError, self.actor.submit, "true", ledger=True)
+
+class TestSubmitPool(ActorTest):
+
+    def test_sharedExecutor(self):
+        a = self.actor
+        with open("test.conf", "w") as out:
+            out.write("[General]\nexecutor = local\nlocalCpus = 2\nmaxJobs = 100\n")
+        a.loadConfiguration("test.conf")
+        a.executor = None
+        with a.submitPool(workers=4, rate=0) as pool:
+            futures = [ pool.submit("true", task="t", done="t{}.done".format(i)) for i in range(8) ]
+        jobids = [ f.result() for f in futures ]
+        self.assertEqual(sorted(a.executor.jobs.keys()), sorted(jobids))
+        self.assertEqual(sorted(a.jobs["t"]), sorted(jobids))
+        self.assertTrue(a.wait([ "t{}.done".format(i) for i in range(8) ], timeout=30))
+
+class TestSpeculation(ActorTest):
+
+    def test_straggler(self):
+        a = self.actor
+        a.speculate = True
+        a.speculateFraction = 0.5
+        # The original job of s3 takes a long time, its copy (running in a scratch directory) does not
+        self.script("job.qsub", "echo $PWD > $1.txt\ncase $PWD in *.speculative*) ;; *) sleep $2 ;; esac")
+        for i in range(4):
+            a.submit("job.qsub s{} {}".format(i, 30 if i == 3 else 0.2), task="w", done="s{}.done".format(i))
+        start = time.time()
+        self.assertTrue(a.wait([ "s{}.done".format(i) for i in range(4) ], timeout=60))
+        self.assertTrue(time.time() - start < 30)
+        self.assertTrue(".speculative" in self.read("s3.txt"))
+        self.assertEqual(os.listdir(".speculative"), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from test_director import DirectorTest
+
+try:
+    import AsyncDirector
+    import asynclines
+except SyntaxError:             # Python 2
+    AsyncDirector = None
+
+@unittest.skipIf(AsyncDirector == None, "AsyncDirector requires Python 3")
+class TestAsyncDirector(DirectorTest):
+    """Each job appends `start' and `end' lines to order.txt, sleeping in between."""
+
+    def setUp(self):
+        DirectorTest.setUp(self)
+        self.director = AsyncDirector.AsyncDirector(self.actor, library="asynclines")
+        for name in ["a", "b", "c"]:
+            self.script(name, "echo start{0} >> order.txt\nsleep 0.5\necho end{0} >> order.txt".format(name))
+        self.script("fail", "exit 1")
+
+    def script(self, name, body):
+        with open(name + ".sh", "w") as out:
+            out.write(body + "\n")
+
+    def order(self):
+        with open("order.txt", "r") as f:
+            return f.read().split()
+
+    def test_concurrent(self):
+        d = self.director
+        d.add("wait.a", script="a.sh", independent=True)
+        d.add("wait.b", script="b.sh", independent=True)
+        d.add("barrier.c", script="c.sh")
+        self.assertTrue(d.ExecuteAll())
+        order = self.order()
+        self.assertEqual(sorted(order[:2]), ["starta", "startb"])
+        self.assertEqual(order[-2:], ["startc", "endc"])
+
+    def test_sequential(self):
+        d = self.director
+        d.add("wait.a", script="a.sh")
+        d.add("wait.b", script="b.sh")
+        self.assertTrue(d.ExecuteAll())
+        self.assertEqual(self.order(), ["starta", "enda", "startb", "endb"])
+
+    def test_failure(self):
+        d = self.director
+        d.add("wait.a", script="a.sh", independent=True)
+        d.add("wait.fail", script="fail.sh", independent=True)
+        d.add("barrier.c", script="c.sh")
+        self.assertFalse(d.ExecuteAll())
+        self.assertEqual(sorted(self.order()), ["enda", "starta"])
+
+if __name__ == "__main__":
+    unittest.main()
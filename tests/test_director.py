@@ -0,0 +1,192 @@
+import os
+import sys
+import shutil
+import signal
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Actor
+import Notify
+import Director
+import Executors
+import MultiSampleActor
+from Lines import Line
+
+actCmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "act.py")]
+
+# Lines used by the tests
+
+class Hello(Line):
+    tag = "hello"
+    name = "Hello"
+
+    def Execute(self):
+        self.actor.submit("touch hello.txt", task="hello", done="hello.done")
+        return self.actor.wait(["hello.done"])
+
+class Touch(Line):
+    """Creates a file for each sample, failing for those whose name starts with `bad'."""
+    tag = "touch"
+    name = "Touch"
+    scope = "sample"
+
+    def ExecuteItem(self, item):
+        if item['name'].startswith("bad"):
+            return "false"
+        return "touch {}.txt".format(item['name'])
+
+class Run(Line):
+    """Submits the script in its `script' property, without waiting for it."""
+    tag = "run"
+    name = "Run"
+
+    def Execute(self):
+        self.actor.submit(self.properties['script'], task=self.key, done=self.key + ".done")
+        return True
+
+class Barrier(Line):
+    """Submits the script in its `script' property, and waits for it."""
+    tag = "barrier"
+    name = "Barrier"
+
+    def Execute(self):
+        self.actor.submit(self.properties['script'], task=self.key, done=self.key + ".done")
+        return self.actor.wait([self.key + ".done"])
+
+class Samples():
+    def __init__(self, names):
+        self.samples = [ {'name': n} for n in names ]
+
+class PipelineActor(MultiSampleActor.MultiSampleActor):
+    libpath = ""
+
+    def __init__(self):
+        Actor.Actor.__init__(self)
+        MultiSampleActor.MultiSampleActor.__init__(self)
+        self.ask = False
+        self.dry = False
+        self.pollPolicy = Notify.PollPolicy(initial=0.1, maximum=0.2, jitter=0)
+        self.executor = Executors.LocalExecutor(cpus=2, mem=1000)
+
+class DirectorTest(unittest.TestCase):
+    """Runs pipelines made of the Lines above in a temporary directory."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        for f in ["js/jquery.tablescroll.js", "css/jquery.tablescroll.css"]:
+            os.makedirs(os.path.dirname(f))
+            open(f, "w").close()
+        with open("test.conf", "w") as out:
+            out.write("[General]\ntitle = Test\n")
+        PipelineActor.libpath = self.dir + "/"
+        self.actor = PipelineActor()
+        self.actor.loadConfiguration("test.conf")
+        self.director = Director.Director(self.actor, library=__name__)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def read(self, filename):
+        with open(filename, "r") as f:
+            return f.read()
+
+class TestRun(DirectorTest):
+
+    def test_complete(self):
+        d = self.director
+        d.setSteps("hello")
+        d.step("hello")
+        self.assertTrue(d.run(self.actor, "Test"))
+        self.actor._cleanup()
+        self.assertTrue(self.actor.complete)
+        self.assertEqual(self.actor.aborted, None)
+        self.assertTrue(os.path.exists("Test/hello.txt"))
+
+class TestScatter(DirectorTest):
+
+    def test_scatter(self):
+        self.actor.sc = Samples(["s1", "s2", "s3"])
+        l = self.director.add("touch", concurrency=2)
+        self.assertTrue(self.director.scatter(l))
+        self.assertEqual(sorted([ (item['name'], code) for (item, code) in l.results ]), [("s1", 0), ("s2", 0), ("s3", 0)])
+        self.assertTrue(os.path.exists("s1.txt") and os.path.exists("s2.txt") and os.path.exists("s3.txt"))
+
+    def test_failure(self):
+        self.actor.sc = Samples(["s1", "bad1"])
+        l = self.director.add("touch")
+        self.assertFalse(self.director.scatter(l))
+        self.assertTrue("bad1" in l.status)
+
+    def test_dry(self):
+        self.actor.sc = Samples(["s1", "s2"])
+        l = self.director.add("touch", dry=True)
+        self.assertTrue(self.director.scatter(l))
+        self.assertEqual(self.actor.jobinfo, {})
+        self.assertFalse(os.path.exists("s1.txt"))
+
+class TestDAG(DirectorTest):
+
+    def script(self, name, body):
+        with open(name, "w") as out:
+            out.write(body + "\n")
+
+    def test_dependencies(self):
+        self.script("first.sh", "touch first.txt")
+        self.script("produce.sh", "sleep 1\ntouch a.txt")
+        self.script("consume.sh", "test -f a.txt && touch b.txt")
+        self.script("other.sh", "touch c.txt")
+        d = self.director
+        first = d.add("barrier.first", script="first.sh")
+        produce = d.add("run.produce", script="produce.sh", outputs=["a.txt"])
+        consume = d.add("run.consume", script="consume.sh", inputs=["a.txt"], outputs=["b.txt"])
+        other = d.add("run.other", script="other.sh", inputs=["x.txt"])
+        self.assertTrue(d.ExecuteAll())
+        # The jobs of the barrier were already done
+        self.assertEqual(produce.after, [])
+        self.assertEqual(consume.after, produce.jobids)
+        self.assertEqual(other.after, [])
+        self.assertTrue(os.path.exists("b.txt") and os.path.exists("c.txt"))
+        self.assertEqual(self.actor.activeJobs(produce.jobids + consume.jobids + other.jobids), [])
+
+    def test_failure(self):
+        self.script("fail.sh", "exit 1")
+        d = self.director
+        d.add("run.fail", script="fail.sh", outputs=["a.txt"])
+        d.add("barrier.after", script="fail.sh")
+        self.assertFalse(d.ExecuteAll())
+        self.assertFalse(os.path.exists("barrier.after.done"))
+
+class TestAct(unittest.TestCase):
+    """Runs act.py on a script that sends itself SIGHUP."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.script = os.path.join(self.dir, "hup.py")
+        with open(self.script, "w") as out:
+            out.write("# Actor\nimport os, signal\nos.kill(os.getpid(), signal.SIGHUP)\nopen('{}', 'w').close()\n".format(os.path.join(self.dir, "survived")))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def act(self, hup):
+        def setup():
+            signal.signal(signal.SIGHUP, hup)
+        with open(os.devnull, "w") as null:
+            return subprocess.call(actCmd + ["-y", self.script], cwd=self.dir, preexec_fn=setup, stdout=null, stderr=null)
+
+    def test_hangup(self):
+        self.assertEqual(self.act(signal.SIG_DFL), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "survived")))
+
+    def test_nohup(self):
+        self.assertEqual(self.act(signal.SIG_IGN), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "survived")))
+
+if __name__ == "__main__":
+    unittest.main()
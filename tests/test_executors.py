@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Ledger
+import Scheduler
+import Executors
+
+class TestOptions(unittest.TestCase):
+
+    def test_parseResources(self):
+        self.assertEqual(Executors.parseResources("--cpus-per-task=4 --mem=16G"), (4, 16384))
+        self.assertEqual(Executors.parseResources("-l nodes=1:ppn=8,mem=2gb"), (8, 2048))
+        self.assertEqual(Executors.parseResources("-c 2 --mem 500"), (2, 500))
+        self.assertEqual(Executors.parseResources("--time=10"), (None, None))
+        self.assertEqual(Executors.parseResources(None), (None, None))
+
+    def test_parseWalltime(self):
+        self.assertEqual(Executors.parseWalltime("--time=2:00:00"), 7200)
+        self.assertEqual(Executors.parseWalltime("--time=120"), 7200)
+        self.assertEqual(Executors.parseWalltime("-t 30 --mem=1G"), 1800)
+        self.assertEqual(Executors.parseWalltime("--time=1-00:00:00"), 86400)
+        self.assertEqual(Executors.parseWalltime("-l walltime=7200"), 7200)
+        self.assertEqual(Executors.parseWalltime("-l h_rt=1:00:00"), 3600)
+        self.assertEqual(Executors.parseWalltime("-l s_rt=600"), 600)
+        self.assertEqual(Executors.parseWalltime("--partition=test --mem=1G"), None)
+        self.assertEqual(Executors.parseWalltime(None), None)
+
+    def test_scaleMemory(self):
+        self.assertEqual(Executors.scaleMemory("--mem=16G -c 2", 2), "--mem=32G -c 2")
+        self.assertEqual(Executors.scaleMemory("-l nodes=1,mem=1.5gb", 2), "-l nodes=1,mem=3gb")
+        self.assertEqual(Executors.scaleMemory("--mem=1000", 1.5), "--mem=1500")
+        self.assertEqual(Executors.scaleMemory("--time=10", 2), "--time=10")
+        self.assertEqual(Executors.scaleMemory(None, 2), None)
+
+    def test_splitJobids(self):
+        self.assertEqual(Executors.splitJobids("1,2:3"), ["1", "2", "3"])
+        self.assertEqual(Executors.splitJobids(None), [])
+
+class ClusterExecutor(Executors.Executor):
+    """Records the jobs submitted to the cluster, which all succeed."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, spec):
+        self.submitted.append((spec.script, spec.after))
+        return "c{}".format(len(self.submitted))
+
+class ClusterQuery(Scheduler.JobQuery):
+
+    def query(self, jobids):
+        return dict([ (j, Scheduler.JobState(j, Scheduler.DONE, 0)) for j in jobids ])
+
+class ExecutorTest(unittest.TestCase):
+    """Runs jobs in a temporary directory. Jobs run job.sh, which appends its first argument
+to order.txt and exits with its second one."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        with open("job.sh", "w") as out:
+            out.write("echo $1 >> order.txt\nexit $2\n")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def wait(self, ex, jobids, timeout=10):
+        start = time.time()
+        while time.time() - start < timeout:
+            states = ex.query(jobids)
+            if all([ st.state != Scheduler.ACTIVE for st in states.values() ]):
+                return states
+            time.sleep(0.1)
+        self.fail("Jobs did not complete")
+
+    def order(self):
+        with open("order.txt", "r") as f:
+            return f.read().split()
+
+    def readFile(self, filename):
+        with open(filename, "r") as f:
+            return f.read().strip()
+
+class TestLocalExecutor(ExecutorTest):
+
+    def test_dependencies(self):
+        ex = Executors.LocalExecutor(cpus=2)
+        j1 = ex.submit(Executors.JobSpec("job.sh a 0"))
+        j2 = ex.submit(Executors.JobSpec("job.sh b 0", after=j1, done="b.done"))
+        j3 = ex.submit(Executors.JobSpec("job.sh c 3"))
+        j4 = ex.submit(Executors.JobSpec("job.sh d 0", after=j3, done="d.done", ledger=("ledger", "t:d")))
+        states = self.wait(ex, [j1, j2, j3, j4])
+        self.assertEqual([ states[j].returnCode() for j in [j1, j2, j3, j4] ], [0, 0, 3, 1])
+        order = self.order()
+        self.assertEqual(sorted(order), ["a", "b", "c"])        # d never ran
+        self.assertTrue(order.index("a") < order.index("b"))
+        self.assertEqual(self.readFile("b.done"), "0")
+        self.assertEqual(self.readFile("d.done"), "1")
+        self.assertEqual([ (r.jobid, r.task, r.code) for r in Ledger.Ledger("ledger").scan() ], [(j4, "t:d", 1)])
+
+    def test_budget(self):
+        ex = Executors.LocalExecutor(cpus=1)
+        with open("slow.sh", "w") as out:
+            out.write("echo start$1 >> order.txt\nsleep 0.3\necho end$1 >> order.txt\n")
+        jobids = [ ex.submit(Executors.JobSpec("slow.sh {}".format(i))) for i in range(2) ]
+        self.wait(ex, jobids)
+        self.assertEqual(self.order(), ["start0", "end0", "start1", "end1"])
+
+    def test_cancel(self):
+        ex = Executors.LocalExecutor(cpus=1)
+        j1 = ex.submit(Executors.JobSpec("sleep 30", done="1.done"))
+        j2 = ex.submit(Executors.JobSpec("job.sh b 0", done="2.done"))
+        time.sleep(0.2)
+        self.assertEqual(ex.query([j1, j2])[j1].running, True)
+        ex.cancel([j1, j2])
+        states = self.wait(ex, [j1, j2])
+        self.assertEqual((states[j1].returnCode(), states[j2].returnCode()), (143, 143))
+        self.assertEqual(self.readFile("1.done"), "143")
+        self.assertFalse(os.path.exists("order.txt"))
+
+class TestHybridExecutor(ExecutorTest):
+
+    def setUp(self):
+        ExecutorTest.setUp(self)
+        self.cluster = ClusterExecutor()
+        self.ex = Executors.HybridExecutor(self.cluster, Executors.LocalExecutor(), lambda spec: spec.runtime,
+                                           threshold=60, jobquery=ClusterQuery())
+
+    def test_placement(self):
+        j1 = self.ex.submit(Executors.JobSpec("job.sh a 0", runtime=10))
+        j2 = self.ex.submit(Executors.JobSpec("long1", runtime=3600))
+        j3 = self.ex.submit(Executors.JobSpec("long2", after="c0"))
+        self.assertTrue(self.ex.isLocal(j1))
+        self.assertEqual((j2, j3), ("c1", "c2"))
+        self.assertEqual(self.cluster.submitted, [("long1", None), ("long2", "c0")])
+        self.assertFalse(self.ex.limits(Executors.JobSpec("short", runtime=10)))
+        self.assertTrue(self.ex.limits(Executors.JobSpec("long", runtime=None)))
+        states = self.wait(self.ex, [j1, j2, j3])
+        self.assertEqual([ states[j].returnCode() for j in [j1, j2, j3] ], [0, 0, 0])
+
+    def test_deferred(self):
+        j1 = self.ex.submit(Executors.JobSpec("job.sh a 0", runtime=10))
+        j2 = self.ex.submit(Executors.JobSpec("long1", after=",".join([j1, "c0"])))
+        self.assertTrue(j2.startswith("hybrid"))
+        self.wait(self.ex, [j2])
+        self.assertEqual(self.ex.resolve(j2), "c1")
+        self.assertEqual(self.cluster.submitted, [("long1", "c0")])
+
+    def test_failedDependency(self):
+        j1 = self.ex.submit(Executors.JobSpec("job.sh a 2", runtime=10))
+        j2 = self.ex.submit(Executors.JobSpec("long1", after=j1, done="long1.done", ledger=("ledger", "t:long1")))
+        states = self.wait(self.ex, [j1, j2])
+        self.assertEqual((states[j1].returnCode(), states[j2].returnCode()), (2, 1))
+        self.assertEqual(self.cluster.submitted, [])
+        self.assertEqual(self.readFile("long1.done"), "1")
+        self.assertEqual([ (r.jobid, r.code) for r in Ledger.Ledger("ledger").scan() ], [(j2, 1)])
+
+if __name__ == "__main__":
+    unittest.main()
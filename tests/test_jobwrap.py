@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import jobwrap
+import Ledger
+
+jobwrapCmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jobwrap.py")]
+
+class TestJobwrap(unittest.TestCase):
+    """Runs jobwrap.py on small scripts in a temporary run directory."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def script(self, name, body, executable=False):
+        with open(name, "w") as out:
+            out.write("#!/bin/bash\n" + body + "\n")
+        if executable:
+            os.chmod(name, 0o755)
+
+    def jobwrap(self, args, env=None):
+        return subprocess.call(jobwrapCmd + args, env=env)
+
+    def read(self, filename):
+        with open(filename, "r") as f:
+            return f.read()
+
+    def test_relativeScript(self):
+        self.script("job.qsub", "echo $1 > out.txt\nexit 3")
+        self.assertEqual(self.jobwrap(["-ledger", "L", "-task", "align", "-done", "job.done", "job.qsub", "sample1"]), 3)
+        self.assertEqual(self.read("out.txt"), "sample1\n")
+        self.assertEqual(self.read("job.done"), "3\n")
+        recs = Ledger.Ledger("L").scan()
+        self.assertEqual([ (r.task, r.code) for r in recs ], [("align", 3)])
+        self.assertTrue(recs[0].elapsed != None)
+
+    def test_executableScript(self):
+        self.script("job.qsub", "echo ok > out.txt", executable=True)
+        self.assertEqual(self.jobwrap(["-done", "job.done", "job.qsub"]), 0)
+        self.assertEqual(self.read("out.txt"), "ok\n")
+
+    def test_missingCommand(self):
+        self.assertEqual(self.jobwrap(["-done", "job.done", "no-such-command-here"]), 127)
+        self.assertEqual(self.read("job.done"), "127\n")
+
+    def test_scriptCommand(self):
+        self.script("a.qsub", "true")
+        self.script("b.qsub", "true", executable=True)
+        self.assertEqual(jobwrap.scriptCommand(["a.qsub", "x"]), ["bash", os.path.abspath("a.qsub"), "x"])
+        self.assertEqual(jobwrap.scriptCommand(["b.qsub"]), [os.path.abspath("b.qsub")])
+        self.assertEqual(jobwrap.scriptCommand(["ls", "-l"]), ["ls", "-l"])
+        self.assertEqual(jobwrap.scriptCommand("a.qsub x > y", shell=True), "bash {} x > y".format(jobwrap.quote(os.path.abspath("a.qsub"))))
+        self.assertEqual(jobwrap.scriptCommand("echo a.qsub", shell=True), "echo a.qsub")
+
+    def test_array(self):
+        self.script("job.qsub", "echo $1 > $1.txt")
+        with open("tasks", "w") as out:
+            out.write("e1.done\tt:1\tjob.qsub e1\n-\tt:2\tjob.qsub e2 && exit 2\n")
+        env = dict(os.environ)
+        env["SLURM_ARRAY_JOB_ID"] = "55"
+        for i in [1, 2]:
+            env["SLURM_ARRAY_TASK_ID"] = str(i)
+            self.jobwrap(["-array", "tasks", "-ledger", "L"], env=env)
+        self.assertEqual(self.read("e1.txt"), "e1\n")
+        self.assertEqual(self.read("e1.done"), "0\n")
+        self.assertEqual(sorted([ (r.jobid, r.task, r.code) for r in Ledger.Ledger("L").scan() ]), [("55_1", "t:1", 0), ("55_2", "t:2", 2)])
+
+    def test_bundle(self):
+        with open("tasks", "w") as out:
+            out.write("a.done\tb:a\ttrue\nb.done\tb:b\tfalse\n-\t-\ttouch c\n")
+        self.assertEqual(self.jobwrap(["-bundle", "tasks", "-parallel", "2", "-ledger", "L"]), 1)
+        self.assertEqual((self.read("a.done"), self.read("b.done")), ("0\n", "1\n"))
+        self.assertTrue(os.path.exists("c"))
+        self.assertEqual(sorted([ (r.task, r.code) for r in Ledger.Ledger("L").scan() ]), [("b:a", 0), ("b:b", 1)])
+
+    def test_heartbeat(self):
+        self.script("job.qsub", "test -f hb")
+        self.assertEqual(self.jobwrap(["-heartbeat", "hb", "-interval", "1", "job.qsub"]), 0)
+        self.assertFalse(os.path.exists("hb"))
+
+    def test_scratch(self):
+        self.script("job.qsub", "cat in.txt > out.txt\nexit $1")
+        with open("in.txt", "w") as out:
+            out.write("input\n")
+        self.assertEqual(self.jobwrap(["-scratch", "s1", "-done", "s1.done", "job.qsub", "1"]), 1)
+        self.assertFalse(os.path.exists("out.txt") or os.path.exists("s1"))
+        self.assertEqual(self.jobwrap(["-scratch", "s2", "-done", "s2.done", "job.qsub", "0"]), 0)
+        self.assertEqual(self.read("out.txt"), "input\n")
+        self.assertFalse(os.path.islink("out.txt") or os.path.exists("s2"))
+
+    def test_scratchOutputs(self):
+        self.script("job.qsub", "cat in.txt res/ref.txt > out.bam\necho copy > res/part.txt\nexit $1")
+        for (name, text) in [("in.txt", "input\n"), ("out.bam", "original\n")]:
+            with open(name, "w") as out:
+                out.write(text)
+        os.mkdir("res")
+        for (name, text) in [("res/ref.txt", "ref\n"), ("res/part.txt", "original\n")]:
+            with open(name, "w") as out:
+                out.write(text)
+        since = time.time() - 10
+        for name in ["job.qsub", "in.txt", "res/ref.txt"]:
+            os.utime(name, (since - 100, since - 100))
+        os.mkdir(".speculative")
+        self.assertEqual(self.jobwrap(["-scratch", ".speculative/j1", "-since", str(since), "job.qsub", "1"]), 1)
+        self.assertEqual((self.read("out.bam"), self.read("res/part.txt")), ("original\n", "original\n"))
+        self.assertEqual(self.jobwrap(["-scratch", ".speculative/j2", "-since", str(since), "job.qsub", "0"]), 0)
+        self.assertEqual((self.read("out.bam"), self.read("res/part.txt")), ("input\nref\n", "copy\n"))
+        self.assertFalse(os.path.islink("out.bam") or os.path.islink("res/part.txt"))
+        self.assertEqual(os.listdir(".speculative"), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Ledger
+
+class TestLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "ledger")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_update(self):
+        l = Ledger.Ledger(self.filename)
+        self.assertEqual(l.update(), [])
+        l.append("1", "a:x", 0, elapsed=12)
+        l.append("2", "a:y", 2)
+        new = l.update()
+        self.assertEqual([ (r.jobid, r.task, r.code, r.elapsed) for r in new ], [("1", "a:x", 0, 12), ("2", "a:y", 2, None)])
+        self.assertEqual(l.update(), [])
+        l.append("3", "b", 1)
+        self.assertEqual([ r.jobid for r in l.update() ], ["3"])
+        self.assertEqual(len(l.records), 3)
+
+    def test_partialLine(self):
+        l = Ledger.Ledger(self.filename)
+        with open(self.filename, "w") as out:
+            out.write("1\ta\t0\t100.0\n2\ta\t0")
+        self.assertEqual([ r.jobid for r in l.update() ], ["1"])
+        self.assertEqual([ r.jobid for r in l.scan() ], ["1"])
+        with open(self.filename, "a") as out:
+            out.write("\t101.0\n")
+        self.assertEqual([ r.jobid for r in l.update() ], ["2"])
+
+    def test_skipExisting(self):
+        Ledger.Ledger(self.filename).append("1", "a", 0)
+        l = Ledger.Ledger(self.filename)
+        l.skipExisting()
+        l.append("2", "a", 0)
+        self.assertEqual([ r.jobid for r in l.update() ], ["2"])
+        self.assertEqual([ r.jobid for r in l.scan() ], ["1", "2"])
+        self.assertEqual([ r.jobid for r in l.scan("1") ], ["1"])
+
+    def test_queries(self):
+        l = Ledger.Ledger(self.filename)
+        for (j, t, c) in [("1", "align:s1", 0), ("2", "align:s2", 3), ("3", "count", 0)]:
+            l.append(j, t, c)
+        l.update()
+        self.assertEqual(l.count("align:*"), 2)
+        self.assertEqual(l.maxCode("align:*"), 3)
+        l.consume(l.query("align:s2"))
+        self.assertEqual(l.count("align:*"), 1)
+        self.assertEqual(l.maxCode("align:*"), 0)
+
+    def test_aliases(self):
+        l = Ledger.Ledger(self.filename, aliases={"123": "hybrid1"})
+        l.append("123", "a", 0)
+        self.assertEqual([ r.jobid for r in l.update() ], ["hybrid1"])
+        self.assertEqual([ r.jobid for r in l.scan("hybrid1") ], ["hybrid1"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pilot
+import Scheduler
+import Executors
+
+class TestTaskQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = pilot.TaskQueue(os.path.join(self.dir, "queue"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_claim(self):
+        self.queue.put("t1", "true")
+        self.queue.put("t2", "true", after="t1")
+        self.assertEqual(self.queue.claim()[0], "t1")
+        self.assertEqual(self.queue.claim(), None)      # t2 waits for t1
+        self.assertTrue(self.queue.isRunning("t1"))
+        self.queue.setResult("t1", 0)
+        self.assertFalse(self.queue.isPending("t1"))
+        self.assertEqual(self.queue.result("t1"), 0)
+        self.assertEqual(self.queue.claim()[0], "t2")
+
+    def test_cancel(self):
+        self.queue.put("t1", "true")
+        self.queue.cancel("t1")
+        self.assertFalse(self.queue.isPending("t1"))
+        self.assertEqual(self.queue.result("t1"), 143)
+
+class TestPilotExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)
+        self.ex = Executors.PilotExecutor(Executors.LocalExecutor(), queuedir=os.path.join(self.dir, "queue"),
+                                          pilots=1, parallel=2, idle=10)
+
+    def tearDown(self):
+        self.ex.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def wait(self, jobids, timeout=30):
+        start = time.time()
+        while time.time() - start < timeout:
+            states = self.ex.query(jobids)
+            if all([ st.state != Scheduler.ACTIVE for st in states.values() ]):
+                return states
+            self.ex.poll()
+            time.sleep(0.2)
+        self.fail("Tasks did not complete")
+
+    def test_query(self):
+        q = self.ex.queue
+        q.put("t1", "true")
+        q.claim()
+        # The result is written before the task leaves running/: still active
+        pilot.writeFile(q.sub("results", "t1"), "3\n")
+        self.assertEqual(self.ex.query(["t1"])["t1"].state, Scheduler.ACTIVE)
+        q.setResult("t1", 3)
+        st = self.ex.query(["t1"])["t1"]
+        self.assertEqual((st.state, st.code), (Scheduler.FAILED, 3))
+        # Neither pending nor finished: the outcome is unknown, not success
+        self.assertEqual(self.ex.query(["t2"])["t2"].state, Scheduler.UNKNOWN)
+
+    def test_pilots(self):
+        j1 = self.ex.submit(Executors.JobSpec("true", done="j1.done"))
+        j2 = self.ex.submit(Executors.JobSpec("exit 3"))
+        j3 = self.ex.submit(Executors.JobSpec("true", after=j2))
+        states = self.wait([j1, j2, j3])
+        self.assertEqual(states[j1].returnCode(), 0)
+        self.assertEqual(states[j2].returnCode(), 3)
+        self.assertEqual(states[j3].returnCode(), 1)    # Its dependency failed
+        with open("j1.done", "r") as f:
+            self.assertEqual(f.read().strip(), "0")
+        self.assertEqual(len(self.ex.launched), 1)
+        self.ex.close()
+        start = time.time()
+        while self.ex.queue.pilots() and time.time() - start < 10:
+            time.sleep(0.2)
+        self.assertEqual(self.ex.queue.pilots(), {})
+
+if __name__ == "__main__":
+    unittest.main()
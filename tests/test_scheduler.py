@@ -0,0 +1,123 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Scheduler
+
+class SchedulerTest(unittest.TestCase):
+    """Runs the queries on the output of a fake scheduler command, that prints the contents of a file."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir, "output")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fakeCommand(self, lines):
+        with open(self.output, "w") as out:
+            out.write("".join([ line + "\n" for line in lines ]))
+        return "cat {} #".format(self.output)
+
+class TestParsers(unittest.TestCase):
+
+    def test_parseDuration(self):
+        self.assertEqual(Scheduler.parseDuration("90"), 90)
+        self.assertEqual(Scheduler.parseDuration("01:30"), 90)
+        self.assertEqual(Scheduler.parseDuration("2:00:00"), 7200)
+        self.assertEqual(Scheduler.parseDuration("1-02:00:00"), 93600)
+        self.assertEqual(Scheduler.parseDuration("00:01.5"), 1.5)
+        self.assertEqual(Scheduler.parseDuration(""), None)
+        self.assertEqual(Scheduler.parseDuration("Unknown"), None)
+
+    def test_parseMemory(self):
+        self.assertEqual(Scheduler.parseMemory("1048576"), 1)
+        self.assertEqual(Scheduler.parseMemory("512K"), 0.5)
+        self.assertEqual(Scheduler.parseMemory("300M"), 300)
+        self.assertEqual(Scheduler.parseMemory("2G"), 2048)
+        self.assertEqual(Scheduler.parseMemory("1.5gb"), 1536)
+        self.assertEqual(Scheduler.parseMemory("1T"), 1048576)
+        self.assertEqual(Scheduler.parseMemory(""), None)
+        self.assertEqual(Scheduler.parseMemory("lots"), None)
+
+    def test_parseExitCode(self):
+        self.assertEqual(Scheduler.parseExitCode("0"), 0)
+        self.assertEqual(Scheduler.parseExitCode("1:0"), 1)
+        self.assertEqual(Scheduler.parseExitCode("0:9"), 0)
+        self.assertEqual(Scheduler.parseExitCode(""), None)
+
+    def test_normalizeState(self):
+        self.assertEqual(Scheduler.stateWord("CANCELLED by 123"), "CANCELLED")
+        self.assertEqual(Scheduler.normalizeState("CANCELLED+"), Scheduler.FAILED)
+        self.assertEqual(Scheduler.normalizeState("completed"), Scheduler.DONE)
+        self.assertEqual(Scheduler.normalizeState("PENDING"), Scheduler.ACTIVE)
+        self.assertEqual(Scheduler.normalizeState(""), Scheduler.ACTIVE)
+
+class TestJobQuery(SchedulerTest):
+
+    def test_states(self):
+        q = Scheduler.JobQuery(self.fakeCommand(["1|COMPLETED|0:0", "2|FAILED|2:0", "3|RUNNING|0:0", "4 PENDING"]))
+        states = q.query(["1", "2", "3", "4"])
+        self.assertEqual(states["1"].state, Scheduler.DONE)
+        self.assertEqual(states["1"].returnCode(), 0)
+        self.assertEqual(states["2"].state, Scheduler.FAILED)
+        self.assertEqual(states["2"].returnCode(), 2)
+        self.assertTrue(states["3"].running)
+        self.assertFalse(states["3"].finished())
+        self.assertFalse(states["4"].running)
+        self.assertFalse(states["4"].finished())
+
+    def test_oom(self):
+        q = Scheduler.JobQuery(self.fakeCommand(["1|OUT_OF_MEMORY|0:125"]))
+        state = q.query(["1"])["1"]
+        self.assertEqual(state.state, Scheduler.FAILED)
+        self.assertEqual(state.returnCode(), Scheduler.oomCode)
+
+    def test_grace(self):
+        command = self.fakeCommand(["1|COMPLETED|0:0"])
+        q = Scheduler.JobQuery(command, grace=3600)
+        self.assertFalse(q.query(["1", "2"])["2"].finished())
+        q.missing["2"] -= 3600
+        state = q.query(["1", "2"])["2"]
+        self.assertEqual(state.state, Scheduler.UNKNOWN)
+        self.assertTrue(state.finished())
+        self.assertEqual(state.returnCode(), Scheduler.unknownCode)
+        q = Scheduler.JobQuery(command, grace=0)
+        self.assertTrue(q.query(["2"])["2"].finished())
+
+    def test_reappearing(self):
+        q = Scheduler.JobQuery(self.fakeCommand([]), grace=3600)
+        q.query(["1"])
+        self.assertTrue("1" in q.missing)
+        q.command = self.fakeCommand(["1|RUNNING"])
+        q.query(["1"])
+        self.assertFalse("1" in q.missing)
+
+    def test_failure(self):
+        q = Scheduler.JobQuery("false")
+        self.assertEqual(q.query(["1"]), None)
+        self.assertEqual(q.query([]), {})
+
+class TestUsageQuery(SchedulerTest):
+
+    def test_steps(self):
+        q = Scheduler.UsageQuery(self.fakeCommand(["10|3600|00:10:00|", "10.batch|3599|00:50:00|2G", "10.0|120|1:00|4G",
+                                                   "11|60|60|", "12"]))
+        usage = q.query(["10", "11", "12"])
+        self.assertEqual(sorted(usage.keys()), ["10", "11"])
+        self.assertEqual(usage["10"].walltime, 3600)
+        self.assertEqual(usage["10"].cputime, 3000)
+        self.assertEqual(usage["10"].maxrss, 4096)
+        self.assertEqual(usage["11"].walltime, 60)
+        self.assertEqual(usage["11"].maxrss, None)
+
+    def test_failure(self):
+        q = Scheduler.UsageQuery("false")
+        self.assertEqual(q.query(["1"]), None)
+
+if __name__ == "__main__":
+    unittest.main()
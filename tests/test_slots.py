@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Slots
+import Actor
+import Scheduler
+import Executors
+
+class ArrayExecutor(Executors.Executor):
+    """Pretends to run array jobs, which terminate as soon as they are submitted."""
+    arrays = True
+    limited = True
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, spec):
+        self.submitted.append(spec.otherargs)
+        return str(len(self.submitted))
+
+    def query(self, jobids):
+        return dict([ (j, Scheduler.JobState(j, Scheduler.DONE, 0)) for j in jobids ])
+
+class TestSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "slots")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_limit(self):
+        s = Slots.JobSlots(3)
+        tokens = s.acquire(2)
+        self.assertEqual(len(tokens), 2)
+        self.assertEqual(s.acquire(2), None)
+        s.assign(tokens[0], "j1")
+        self.assertEqual(s.held(), {tokens[0]: "j1"})
+        s.release(tokens)
+        self.assertEqual(s.inUse(), 0)
+        self.assertEqual(len(s.acquire(3)), 3)
+
+    def test_shared(self):
+        s1 = Slots.JobSlots(2, self.filename)
+        s2 = Slots.JobSlots(2, self.filename)
+        s2.counter = 100        # Tokens include the PID, which both objects share here
+        t1 = s1.acquire(1)
+        s1.assign(t1[0], "j1")
+        self.assertEqual(len(s2.acquire(1)), 1)
+        self.assertEqual(s2.acquire(1), None)
+        s1.release(t1)
+        self.assertEqual(len(s2.acquire(1)), 1)
+        self.assertEqual(s1.inUse(), 2)
+
+    def test_stale(self):
+        now = time.time()
+        with open(self.filename, "w") as out:
+            out.write("otherhost:1:1\tj1\t{:.0f}\n".format(now - 7200))
+            out.write("otherhost:1:2\tj2\t{:.0f}\n".format(now))
+            out.write("{}:999999999:1\tj3\t{:.0f}\n".format(Slots.socket.gethostname(), now))
+        s = Slots.JobSlots(10, self.filename, expire=3600)
+        self.assertEqual(s.inUse(), 1)
+        tokens = s.acquire(1)
+        with open(self.filename, "r") as f:
+            before = f.read()
+        time.sleep(1.1)
+        s.refresh()
+        with open(self.filename, "r") as f:
+            self.assertNotEqual(f.read(), before)
+        self.assertEqual(s.inUse(), 2)
+
+class TestArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_chunks(self):
+        a = Actor.Actor()
+        a.maxJobs = 2
+        a.executor = ArrayExecutor()
+        jobids = a.submitArray([ "true" ] * 5, task="t")
+        self.assertEqual(a.executor.submitted, ["--array=1-2", "--array=1-2", "--array=1-1"])
+        self.assertEqual(jobids, ["1_1", "1_2", "2_1", "2_2", "3_1"])
+
+    def test_hybrid(self):
+        hybrid = Executors.HybridExecutor(ArrayExecutor(), Executors.LocalExecutor(cpus=1, mem=100), lambda spec: spec.runtime, threshold=60)
+        self.assertFalse(hybrid.limits(Executors.JobSpec("true", runtime=10)))
+        self.assertTrue(hybrid.limits(Executors.JobSpec("true", runtime=600)))
+        self.assertTrue(hybrid.limits(Executors.JobSpec("true")))
+
+if __name__ == "__main__":
+    unittest.main()
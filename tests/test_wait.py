@@ -0,0 +1,110 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import Actor
+import Notify
+import Scheduler
+
+class WaitTest(unittest.TestCase):
+    """Waits for files in a temporary directory."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.actor = Actor.Actor()
+        self.actor.pollPolicy = Notify.PollPolicy(initial=0.1, maximum=0.2, jitter=0)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def write(self, filename, text):
+        with open(filename, "w") as out:
+            out.write(text)
+
+class TestDirIndex(WaitTest):
+
+    def test_index(self):
+        self.write("a.done", "0\n")
+        os.mkdir("sub")
+        self.write("sub/b.done", "1\n")
+        index = Actor.DirIndex()
+        self.assertTrue(index.exists("a.done"))
+        self.assertTrue(index.exists("sub/b.done"))
+        self.assertFalse(index.exists("c.done"))
+        self.assertEqual(index.returnCode("sub/b.done"), 1)
+        self.write("c.done", "0\n")
+        self.assertFalse(index.exists("c.done"))        # Not until the next cycle
+        os.remove("a.done")
+        index.forget("a.done")
+        self.assertFalse(index.exists("a.done"))
+        self.assertEqual(index.glob("*.done"), [])
+        index.refresh()
+        self.assertTrue(index.exists("c.done"))
+        self.assertEqual(index.glob("*.done"), ["c.done"])
+
+class TestWaiters(WaitTest):
+
+    def test_files(self):
+        self.write("a.done", "0\n")
+        self.write("b.done", "2\n")
+        self.assertTrue(self.actor.wait(["a.done"]))
+        self.assertFalse(os.path.exists("a.done"))
+        self.assertFalse(self.actor.wait(["b.done"], delete=False))
+        self.assertTrue(os.path.exists("b.done"))
+
+    def test_counter(self):
+        self.write("counter", "3\n")
+        self.assertTrue(self.actor.wait([("counter", 3)], timeout=10))
+        self.write("counter", "2\n")
+        self.assertFalse(self.actor.wait([("counter", 3)], timeout=0.5))
+
+    def test_glob(self):
+        for i in range(3):
+            self.write("x{}.done".format(i), "0\n")
+        self.assertTrue(self.actor.wait([("x@.done", 3)], timeout=10))
+        self.assertEqual([ f for f in os.listdir(".") if f.endswith(".done") ], [])
+        self.write("y1.done", "0\n")
+        self.write("y2.done", "4\n")
+        self.assertFalse(self.actor.wait([("y@.done", 2)], timeout=10))
+
+    def test_timeout(self):
+        self.write("a.done", "0\n")
+        result = self.actor.wait(["a.done", "b.done"], timeout=0.5)
+        self.assertFalse(result)
+        self.assertTrue(isinstance(result, Actor.WaitTimeout))
+        self.assertEqual([ w.filename for w in result.pending ], ["b.done"])
+
+class TestSchedulerWaiter(WaitTest):
+
+    def query(self, lines, grace=0):
+        with open("states", "w") as out:
+            out.write("".join([ line + "\n" for line in lines ]))
+        return Scheduler.JobQuery("cat states #", grace=grace)
+
+    def test_states(self):
+        q = self.query(["1|COMPLETED|0:0", "2|COMPLETED|0:0"])
+        self.assertTrue(self.actor.wait(Actor.SchedulerWaiter("t", ["1", "2"], jobquery=q), timeout=10))
+        q = self.query(["1|COMPLETED|0:0", "2|FAILED|3:0"])
+        w = Actor.SchedulerWaiter("t", ["1", "2"], jobquery=q)
+        self.assertFalse(self.actor.wait(w, timeout=10))
+        self.assertEqual(w.codes, {"1": 0, "2": 3})
+
+    def test_unknown(self):
+        q = self.query(["1|COMPLETED|0:0"])
+        w = Actor.SchedulerWaiter("t", ["1", "2"], jobquery=q)
+        self.assertFalse(self.actor.wait(w, timeout=10))
+        self.assertEqual(w.codes, {"1": 0, "2": Scheduler.unknownCode})
+
+    def test_grace(self):
+        q = self.query(["1|RUNNING"], grace=3600)
+        self.assertFalse(self.actor.wait(Actor.SchedulerWaiter("t", ["1", "2"], jobquery=q), timeout=0.5))
+
+if __name__ == "__main__":
+    unittest.main()